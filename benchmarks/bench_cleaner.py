@@ -0,0 +1,42 @@
+# Benchmark so sánh DataCleaner.clean_data (RuleEngine, 1 mask) với cách clean cũ từng bước
+# Chạy từ thư mục gốc của repo: python -m benchmarks.bench_cleaner --rows 1000000
+import argparse
+import time
+import tracemalloc
+from benchmarks.data_generator import make_frame
+from src.transform.cleaner import DataCleaner
+
+
+def measure(func, df, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Có dữ liệu bẩn để các rule thực sự loại dòng
+    df = make_frame(args.rows, dirty_ratio=0.05)
+
+    stepwise, t_step, m_step = measure(DataCleaner.clean_data_stepwise, df, args.repeat)
+    fused, t_fused, m_fused = measure(DataCleaner.clean_data, df, args.repeat)
+    assert stepwise.reset_index(drop=True).equals(fused.reset_index(drop=True)), "Fused result differs from stepwise"
+
+    print(f"{'path':<12}{'rows out':>12}{'seconds':>10}{'rows/sec':>14}{'peak MB':>10}")
+    for name, result, elapsed, peak in (('stepwise', stepwise, t_step, m_step), ('fused', fused, t_fused, m_fused)):
+        print(f"{name:<12}{len(result):>12}{elapsed:>10.3f}{args.rows / elapsed:>14,.0f}{peak / 2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
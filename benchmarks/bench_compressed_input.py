@@ -0,0 +1,67 @@
+# Benchmark đọc CSV nén trực tiếp (gzip / bz2 / xz / zstd) so với CSV thường:
+# dung lượng trên đĩa, thời gian extract (hash + giải nén + parse trong 1 lượt) và kiểm tra kết quả giống hệt file thường
+# Chạy từ thư mục gốc của repo: python -m benchmarks.bench_compressed_input --rows 2000000
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import time
+from benchmarks.data_generator import generate_csv
+from src.extract.csv_extractor import ExtractorCSV
+from src.utils import compressed_io
+from src.utils.fingerprint import compute_fingerprint
+
+
+def _zstd_writer(path: str):
+    if compressed_io.zstd is not None:
+        return compressed_io.zstd.open(path, 'wb')
+    return compressed_io.zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+
+
+WRITERS = {
+    'gz': lambda path: gzip.open(path, 'wb', compresslevel=6),
+    'bz2': lambda path: bz2.open(path, 'wb'),
+    'xz': lambda path: lzma.open(path, 'wb', preset=1),
+    'zst': _zstd_writer,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--dirty', type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        plain = generate_csv(os.path.join(tmp_dir, 'bench.csv'), args.rows, args.dirty)
+        plain_size = os.path.getsize(plain)
+        start = time.perf_counter()
+        # Không dùng cache fingerprint để lần nào cũng đo cả hash
+        expected_hash = compute_fingerprint(plain)
+        expected = ExtractorCSV._read_csv(plain, plain, 'c')
+        baseline = time.perf_counter() - start
+        expected.columns = expected.columns.str.strip()
+
+        print(f"{'format':<8}{'MB on disk':>12}{'ratio':>8}{'seconds':>10}{'rows/sec':>14}")
+        print(f"{'csv':<8}{plain_size / 2**20:>12.1f}{1.0:>8.1f}{baseline:>10.2f}{args.rows / baseline:>14,.0f}")
+        for ext, writer in WRITERS.items():
+            if ext == 'zst' and compressed_io.zstd is None and compressed_io.zstandard is None:
+                print(f"{'zst':<8}  skipped (needs Python >= 3.14 or zstandard)")
+                continue
+            path = f"{plain}.{ext}"
+            with open(plain, 'rb') as src, writer(path) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            start = time.perf_counter()
+            df, file_hash = ExtractorCSV.extract_with_fingerprint(path)
+            elapsed = time.perf_counter() - start
+            assert df.equals(expected), f"{ext} frame differs from plain CSV"
+            assert file_hash == expected_hash, f"{ext} hash differs from plain CSV"
+            size = os.path.getsize(path)
+            print(f"{ext:<8}{size / 2**20:>12.1f}{plain_size / size:>8.1f}{elapsed:>10.2f}{args.rows / elapsed:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# Benchmark so sánh tốc độ load (rows/sec) giữa các chiến lược của DBLoader
+# Chạy từ thư mục gốc của repo: python -m benchmarks.bench_load_strategies --rows 200000
+# Cần Postgres local theo cấu hình trong .env
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.data_generator import make_frame
+from config.constants import TABLE_RAW, TABLE_CLEAN, LOAD_STRATEGIES
+from src.load.db_loader import DBLoader
+from src.transform.cleaner import DataCleaner
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    df_raw = make_frame(args.rows)
+    df_clean = DataCleaner.clean_data(df_raw)
+    DBLoader.create_raw_and_clean_table()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'bench_bmw.csv')
+        df_raw.to_csv(csv_path, index=False)
+
+        print(f"{'strategy':<16}{'table':<18}{'rows':>10}{'seconds':>10}{'rows/sec':>14}")
+        for strategy in LOAD_STRATEGIES:
+            for table, df, load in ((TABLE_RAW, df_raw, DBLoader.load_to_raw_table),
+                                    (TABLE_CLEAN, df_clean, DBLoader.load_to_clean_table)):
+                start = time.perf_counter()
+                load(df, csv_path, skip_if_exist=False, load_strategy=strategy)
+                elapsed = time.perf_counter() - start
+                print(f"{strategy:<16}{table:<18}{len(df):>10}{elapsed:>10.2f}{len(df) / elapsed:>14,.0f}")
+                DBLoader.delete_existing(csv_path, table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Benchmark chi phí log trên mỗi thao tác DB (mỗi lần get_cursor trước đây ghi 3 dòng INFO: trả connection,
+# commit, đóng cursor), so sánh:
+# - before: handler đồng bộ (FileHandler + StreamHandler) như logger_config cũ, 3 dòng INFO mỗi thao tác
+# - queued: QueueHandler + QueueListener, vẫn 3 dòng INFO nhưng I/O nằm ở thread listener
+# - gated: cách hiện tại, log thao tác DB ở mức DEBUG + lấy mẫu, mặc định không tạo record nào
+# - sampled: gated nhưng bật DEBUG với tỉ lệ lấy mẫu --sample
+# Chạy từ thư mục gốc của repo: python -m benchmarks.bench_logging --calls 20000 --stream stderr
+# --db: đo thêm thời gian thật của 1 lần DBManager.get_cursor() + SELECT 1 (cần Postgres local theo .env)
+import argparse
+import logging
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+from logging.handlers import QueueHandler, QueueListener
+from config.log_config import JsonFormatter
+
+DB_OP_EVENTS = ("Database connection returned to pool.", "Transaction committed.", "Database cursor closed.")
+
+
+def make_logger(name: str, handlers: list, level: int) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(level)
+    for handler in handlers:
+        logger.addHandler(handler)
+    return logger
+
+
+def per_call_us(emit, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        emit()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20_000)
+    parser.add_argument('--stream', choices=('devnull', 'stderr'), default='devnull',
+                        help='Nơi in log console (stderr ra terminal chậm hơn nhiều so với devnull)')
+    parser.add_argument('--sample', type=float, default=0.01)
+    parser.add_argument('--db', action='store_true')
+    args = parser.parse_args()
+
+    stream = open(os.devnull, 'w') if args.stream == 'devnull' else sys.stderr
+    text = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def sync_handlers(formatter):
+            file_handler = logging.FileHandler(os.path.join(tmp, 'bench.log'), encoding='utf-8')
+            file_handler.setLevel(logging.ERROR)
+            console_handler = logging.StreamHandler(stream)
+            console_handler.setLevel(logging.INFO)
+            for handler in (file_handler, console_handler):
+                handler.setFormatter(formatter)
+            return [file_handler, console_handler]
+
+        before = make_logger('bench.before', sync_handlers(text), logging.DEBUG)
+        results['before (sync INFO x3)'] = per_call_us(lambda: [before.info(e) for e in DB_OP_EVENTS], args.calls)
+
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *sync_handlers(JsonFormatter()), respect_handler_level=True)
+        listener.start()
+        queued = make_logger('bench.queued', [QueueHandler(log_queue)], logging.INFO)
+        results['queued (INFO x3)'] = per_call_us(lambda: [queued.info(e) for e in DB_OP_EVENTS], args.calls)
+
+        def gated_emit(logger, rate):
+            # Giống _log_db_op trong src/utils/db_manager.py
+            def emit():
+                for event in DB_OP_EVENTS:
+                    if rate <= 0 or not logger.isEnabledFor(logging.DEBUG):
+                        continue
+                    if rate >= 1 or random.random() < rate:
+                        logger.debug(event, extra={'event': 'db_op', 'sample_rate': rate})
+            return emit
+
+        gated = make_logger('bench.gated', [QueueHandler(log_queue)], logging.INFO)
+        results['gated (default, off)'] = per_call_us(gated_emit(gated, 0.0), args.calls)
+        sampled = make_logger('bench.sampled', [QueueHandler(log_queue)], logging.DEBUG)
+        results[f'sampled (DEBUG, {args.sample:.0%})'] = per_call_us(gated_emit(sampled, args.sample), args.calls)
+        listener.stop()
+
+    if args.db:
+        from src.utils.db_manager import DBManager
+
+        def db_call():
+            with DBManager.get_cursor() as cur:
+                cur.execute("SELECT 1;")
+        db_call()  # Khởi tạo pool trước khi đo
+        results['get_cursor + SELECT 1 (current)'] = per_call_us(db_call, min(args.calls, 2_000))
+
+    print(f"{'setup':<36}{'us / DB call':>14}")
+    for name, value in results.items():
+        print(f"{name:<36}{value:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
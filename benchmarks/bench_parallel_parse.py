@@ -0,0 +1,56 @@
+# Benchmark parse + clean 1 file CSV lớn: tuần tự (extract + clean) so với ExtractorCSV.extract_parallel
+# theo số worker, đồng thời kiểm tra kết quả song song giống hệt tuần tự (dòng, thứ tự, kiểu cột, index)
+# Chạy từ thư mục gốc của repo: python -m benchmarks.bench_parallel_parse --rows 20000000 --workers 2 4 8 16
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.data_generator import generate_csv
+from src.extract import csv_extractor
+from src.extract.csv_extractor import ExtractorCSV
+from src.transform.cleaner import DataCleaner
+
+
+def serial(csv_path: str, engine: str):
+    df_raw, file_hash = ExtractorCSV.extract_with_fingerprint(csv_path, engine)
+    df_clean, rejections = DataCleaner.clean_data_with_report(df_raw)
+    return df_raw, df_clean, rejections, file_hash
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--dirty', type=float, default=0.05)
+    parser.add_argument('--engine', default='c')
+    args = parser.parse_args()
+
+    # File benchmark có thể nhỏ hơn ngưỡng mặc định, bỏ ngưỡng để luôn đo đường song song
+    csv_extractor.PARALLEL_PARSE_MIN_BYTES = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'bench_parallel_parse.csv')
+        generate_csv(csv_path, args.rows, args.dirty)
+        size_mb = os.path.getsize(csv_path) / 2**20
+
+        start = time.perf_counter()
+        expected = serial(csv_path, args.engine)
+        baseline = time.perf_counter() - start
+
+        print(f"file: {size_mb:,.0f} MB, {args.rows:,} rows, {os.cpu_count()} cores")
+        print(f"{'mode':<14}{'seconds':>10}{'rows/sec':>14}{'MB/sec':>10}{'speedup':>10}")
+        print(f"{'serial':<14}{baseline:>10.2f}{args.rows / baseline:>14,.0f}{size_mb / baseline:>10.1f}{1.0:>10.2f}")
+        for workers in args.workers:
+            start = time.perf_counter()
+            result = ExtractorCSV.extract_parallel(csv_path, workers, args.engine)
+            elapsed = time.perf_counter() - start
+            for name, left, right in (('raw', expected[0], result[0]), ('clean', expected[1], result[1])):
+                assert list(left.dtypes) == list(right.dtypes), f"{name} dtypes differ with {workers} workers"
+                assert left.equals(right), f"{name} frame differs from serial with {workers} workers"
+            assert expected[2] == result[2], f"rejections differ with {workers} workers"
+            assert expected[3] == result[3], f"file hash differs with {workers} workers"
+            print(f"{f'{workers} workers':<14}{elapsed:>10.2f}{args.rows / elapsed:>14,.0f}"
+                  f"{size_mb / elapsed:>10.1f}{baseline / elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
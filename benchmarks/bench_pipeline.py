@@ -0,0 +1,89 @@
+# Benchmark toàn pipeline theo nhiều kích thước file để bắt regression trước khi lên production
+# Mỗi kích thước: sinh CSV giả lập -> extract -> clean -> load raw -> load clean -> report
+# Ghi lại thời gian, rows/sec, peak RSS tăng thêm và số round trip DB của từng stage
+# Chạy từ thư mục gốc của repo (cần Postgres local theo .env):
+#   python -m benchmarks.bench_pipeline --sizes 10000 100000 1000000 --dirty 0.05 --out bench_pipeline.json
+import argparse
+import json
+import os
+import tempfile
+from benchmarks.data_generator import generate_csv
+from config.constants import TABLE_RAW, TABLE_CLEAN, TABLE_MANIFEST, TABLE_PROFILE
+from src.extract.csv_extractor import ExtractorCSV
+from src.transform.cleaner import DataCleaner
+from src.load.db_loader import DBLoader
+from src.utils.data_profiler import DataProfiler
+from src.utils.db_manager import DBManager
+from src.utils.metrics import RunMetrics
+
+
+def cleanup(csv_path: str):
+    # Xoá dữ liệu benchmark để các lần chạy sau (và warehouse thật) không bị ảnh hưởng
+    # Xoá qua DBLoader.delete_existing để bảng tổng hợp cũng được trừ đi phần dữ liệu benchmark
+    with DBManager.get_cursor() as cur:
+        for table in (TABLE_RAW, TABLE_CLEAN):
+            DBLoader.delete_existing(csv_path, table, cur)
+        for table in (TABLE_MANIFEST, TABLE_PROFILE):
+            cur.execute(f"DELETE FROM {table} WHERE src_file = %s", (csv_path,))
+
+
+def bench_size(rows: int, dirty_ratio: float, tmp_dir: str) -> dict:
+    csv_path = os.path.join(tmp_dir, f"bench_{rows}.csv")
+    generate_csv(csv_path, rows, dirty_ratio)
+    metrics = RunMetrics()
+    try:
+        with metrics.stage('extract') as stage:
+            df_raw, file_hash = ExtractorCSV.extract_with_fingerprint(csv_path)
+            stage['rows_out'] = len(df_raw)
+        with metrics.stage('transform', rows_in=len(df_raw)) as stage:
+            df_clean, rejections = DataCleaner.clean_data_with_report(df_raw)
+            profile = DataProfiler.profile_frame(len(df_raw), df_clean, rejections)
+            stage['rows_out'] = len(df_clean)
+        with metrics.stage('load_raw', rows_in=len(df_raw)):
+            DBLoader.load_to_raw_table(df_raw, csv_path, skip_if_exist=True, file_hash=file_hash)
+        with metrics.stage('load_clean', rows_in=len(df_clean)):
+            DBLoader.load_to_clean_table(df_clean, csv_path, skip_if_exist=True, file_hash=file_hash)
+            DataProfiler.save_file_profile(csv_path, file_hash, profile)
+        with metrics.stage('report'):
+            DataProfiler.generated_quantity_report()
+    finally:
+        cleanup(csv_path)
+        os.remove(csv_path)
+    result = metrics.to_dict()
+    result['rows'] = rows
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--dirty', type=float, default=0.05)
+    parser.add_argument('--tmp-dir', default=None, help='Thư mục chứa CSV tạm (file lớn nên để ở ổ nhanh)')
+    parser.add_argument('--out', default=None, help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+
+    DBLoader.create_raw_and_clean_table()
+    DataProfiler.create_profile_table()
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp:
+        for rows in args.sizes:
+            result = bench_size(rows, args.dirty, tmp)
+            results.append(result)
+            print(f"\n== {rows:,} rows (total {result['total_seconds']:.2f}s)")
+            print(f"{'stage':<14}{'seconds':>10}{'rows/sec':>14}{'peak RSS +MB':>14}{'db trips':>10}")
+            for name, stage in result['stages'].items():
+                rows_per_sec = f"{stage['rows_per_sec']:,.0f}" if stage['rows_per_sec'] else '-'
+                # Không đo được RSS (không có /proc) thì in '-'
+                peak_mb = f"{stage['peak_rss_delta_kb'] / 1024:.1f}" if stage['peak_rss_delta_kb'] is not None else '-'
+                print(f"{name:<14}{stage['seconds']:>10.3f}{rows_per_sec:>14}"
+                      f"{peak_mb:>14}{stage['db_round_trips']:>10}")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# Kiểm tra profile / report của từng file sau khi dedup chéo file (regression cho dòng bị bỏ lúc load)
+# Sinh 2 file chồng lấn nhau (phần giữa trùng nhau), load bằng các chế độ nhiều file / 1 file / streaming
+# rồi so report của từng file và bảng file_profile với số liệu tính thẳng trên bảng clean
+# Chạy từ thư mục gốc của repo (cần Postgres local theo .env):
+#   python -m benchmarks.check_dedup_profile --rows 10000 --overlap 2000
+import argparse
+import os
+import tempfile
+from benchmarks.data_generator import make_frame
+from config.constants import TABLE_RAW, TABLE_CLEAN, TABLE_MANIFEST, TABLE_PROFILE, PRICE_HISTOGRAM_BIN_WIDTH
+from flow.pipeline import ETLPipeline
+from src.load.db_loader import DBLoader
+from src.transform.dedup import Deduplicator, IN_WAREHOUSE
+from src.utils.data_profiler import DataProfiler
+from src.utils.db_manager import DBManager
+
+
+def cleanup(paths: list[str]):
+    # Xoá dữ liệu của các file kiểm tra, trả lại key dedup để lần chạy sau load lại từ đầu
+    with DBManager.get_cursor() as cur:
+        for path in paths:
+            for table in (TABLE_RAW, TABLE_CLEAN):
+                DBLoader.delete_existing(path, table, cur)
+            for table in (TABLE_MANIFEST, TABLE_PROFILE):
+                cur.execute(f"DELETE FROM {table} WHERE src_file = %s", (path,))
+            Deduplicator.release_file(cur, path)
+
+
+def table_stats(path: str) -> dict:
+    # Số liệu của file tính trực tiếp trên các dòng đang có trong bảng clean
+    with DBManager.get_cursor() as cur:
+        cur.execute(f"""
+            SELECT COUNT(*), COUNT(DISTINCT model), MIN(price), MAX(price), AVG(price),
+                   PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price), MIN(year), MAX(year)
+            FROM {TABLE_CLEAN}
+            WHERE src_file = %s;
+        """, (path,))
+        count, models, price_min, price_max, price_avg, price_median, year_min, year_max = cur.fetchone()
+    return {'clean_record': count, 'unique_model': models, 'price_min': price_min, 'price_max': price_max,
+            'price_avg': round(float(price_avg or 0), 2), 'price_median': price_median,
+            'year_min': year_min, 'year_max': year_max}
+
+
+def saved_summary(path: str) -> dict:
+    with DBManager.get_cursor() as cur:
+        cur.execute(f"""
+            SELECT raw_record, clean_record, rejections, models, price_min, price_max,
+                   price_sum, price_median, price_hist, year_min, year_max
+            FROM {TABLE_PROFILE}
+            WHERE src_file = %s;
+        """, (path,))
+        columns = [desc[0] for desc in cur.description]
+        row = cur.fetchone()
+    assert row is not None, f"{path}: no row in {TABLE_PROFILE}"
+    return DataProfiler.summarize(dict(zip(columns, row)))
+
+
+def check_summary(label: str, summary: dict, expected: dict, median_tolerance: float):
+    # Median của streaming gộp từ histogram nên sai số tối đa 1 bin, các chế độ khác phải khớp tuyệt đối
+    actual = {'clean_record': summary['clean_record'], 'unique_model': summary['unique_model'],
+              'price_min': summary['price_stat']['min'], 'price_max': summary['price_stat']['max'],
+              'year_min': summary['year_stat']['min'], 'year_max': summary['year_stat']['max']}
+    for key, value in actual.items():
+        assert value == expected[key], f"{label}: {key} = {value}, clean table has {expected[key]}"
+    assert abs(summary['price_stat']['avg'] - expected['price_avg']) <= 0.01, \
+        f"{label}: avg price {summary['price_stat']['avg']}, clean table has {expected['price_avg']}"
+    median = summary['price_stat']['median']
+    assert median is not None and abs(median - expected['price_median']) <= median_tolerance, \
+        f"{label}: median price {median}, clean table has {expected['price_median']}"
+
+
+def check_mode(mode: str, paths: list[str], source_dir: str, chunk_size: int):
+    cleanup(paths)
+    if mode == 'multi':
+        report = ETLPipeline(source_dir).run()
+        median_tolerance = 0.0
+    else:
+        # Load lần lượt từng file, file sau trùng với file trước nên phải bỏ dòng lúc load
+        report = {'files': []}
+        for path in paths:
+            pipeline = ETLPipeline(path, chunk_size=chunk_size if mode == 'streaming' else None)
+            report['files'] += pipeline.run()['files']
+        median_tolerance = PRICE_HISTOGRAM_BIN_WIDTH if mode == 'streaming' else 0.0
+
+    file_reports = {r['src_file']: r for r in report['files']}
+    dropped = 0
+    for path in paths:
+        file_report = file_reports[path]
+        assert file_report['status'] == 'loaded', f"[{mode}] {path}: status {file_report['status']}"
+        expected = table_stats(path)
+        assert file_report['clean_rows'] == expected['clean_record'], \
+            f"[{mode}] {path}: clean_rows {file_report['clean_rows']}, clean table has {expected['clean_record']}"
+        check_summary(f"[{mode}] {path} report", file_report['profile'], expected, median_tolerance)
+        saved = saved_summary(path)
+        check_summary(f"[{mode}] {path} {TABLE_PROFILE}", saved, expected, median_tolerance)
+        dropped += saved['rejections'].get(IN_WAREHOUSE, 0)
+    assert dropped > 0, f"[{mode}] overlapping files but no row dropped as {IN_WAREHOUSE}"
+    print(f"{mode:<10} OK ({dropped} rows dropped as {IN_WAREHOUSE})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000, help='Số dòng mỗi file')
+    parser.add_argument('--overlap', type=int, default=2_000, help='Số dòng 2 file trùng nhau')
+    parser.add_argument('--chunk-size', type=int, default=3_000)
+    parser.add_argument('--dirty', type=float, default=0.05)
+    args = parser.parse_args()
+
+    DBLoader.create_raw_and_clean_table()
+    DataProfiler.create_profile_table()
+
+    df = make_frame(2 * args.rows - args.overlap, dirty_ratio=args.dirty)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, 'dealer_a.csv'), os.path.join(tmp, 'dealer_b.csv')]
+        df.iloc[:args.rows].to_csv(paths[0], index=False)
+        df.iloc[args.rows - args.overlap:].to_csv(paths[1], index=False)
+        try:
+            for mode in ('multi', 'full', 'streaming'):
+                check_mode(mode, paths, tmp, args.chunk_size)
+        finally:
+            cleanup(paths)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Kiểm tra ExtractorCSV.extract_parallel cho kết quả giống hệt extract + DataCleaner.clean_data_with_report
+# (dòng, thứ tự, kiểu cột, index, rejections, hash file) trên file nhỏ: bỏ ngưỡng PARALLEL_PARSE_MIN_BYTES
+# để luôn đi đường song song qua shared memory. Không cần Postgres:
+#   python -m benchmarks.check_parallel_parse --rows 50000 --workers 4
+import argparse
+import gc
+import os
+import sys
+import tempfile
+from benchmarks.data_generator import generate_csv
+from src.extract import csv_extractor
+from src.extract.csv_extractor import ExtractorCSV
+from src.transform.cleaner import DataCleaner
+from src.transform.validate import cal_hash_file
+
+
+def check_file(csv_path: str, workers: int):
+    expected_raw = ExtractorCSV.extract(csv_path)
+    expected_clean, expected_rejections = DataCleaner.clean_data_with_report(expected_raw)
+    # Vùng shared memory không close được (DataFrame còn trỏ vào) thì SharedMemory.__del__ chỉ in
+    # 'Exception ignored' lúc thu hồi: gom các lỗi bị bỏ qua đó lại để check fail
+    ignored = []
+    hook, sys.unraisablehook = sys.unraisablehook, ignored.append
+    try:
+        df_raw, df_clean, rejections, file_hash = ExtractorCSV.extract_parallel(csv_path, workers)
+        gc.collect()
+    finally:
+        sys.unraisablehook = hook
+    assert not ignored, f"{len(ignored)} ignored errors, first: {ignored[0].exc_value!r}"
+    for name, left, right in (('raw', expected_raw, df_raw), ('clean', expected_clean, df_clean)):
+        assert list(left.dtypes) == list(right.dtypes), f"{name} dtypes differ: {list(right.dtypes)}"
+        assert left.index.equals(right.index), f"{name} index differs"
+        assert left.equals(right), f"{name} frame differs from serial parse"
+    assert rejections == expected_rejections, f"rejections {rejections}, serial {expected_rejections}"
+    assert file_hash == cal_hash_file(csv_path), "file hash differs"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    csv_extractor.PARALLEL_PARSE_MIN_BYTES = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        # File sạch đi đường parse theo schema, file bẩn có khoảng phải parse lại ở chế độ ép kiểu sau
+        for dirty in (0.0, 0.05):
+            csv_path = generate_csv(os.path.join(tmp, f'parallel_{dirty}.csv'), args.rows, dirty)
+            check_file(csv_path, args.workers)
+            print(f"dirty={dirty:<5} OK ({args.rows} rows, {args.workers} workers)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Kiểm tra load streaming bị ngắt giữa chừng (KeyboardInterrupt) thì lần chạy sau đọc tiếp từ checkpoint
+# Sinh 1 file CSV, ngắt sau vài chunk đã commit, chạy lại rồi so bảng raw / clean với 1 lần load không bị ngắt
+# Chạy cả chế độ streaming lẫn pipelined, từ thư mục gốc của repo (cần Postgres local theo .env):
+#   python -m benchmarks.check_resume --rows 20000 --chunk-size 3000 --interrupt-after 3
+import argparse
+import os
+import tempfile
+from benchmarks.data_generator import generate_csv
+from config.constants import TABLE_RAW, TABLE_CLEAN, TABLE_MANIFEST, TABLE_PROFILE, TABLE_LOAD_CHECKPOINT
+from flow.pipeline import ETLPipeline
+from src.load.checkpoint import LoadCheckpoint
+from src.load.db_loader import DBLoader
+from src.transform.dedup import Deduplicator
+from src.utils.data_profiler import DataProfiler
+from src.utils.db_manager import DBManager
+
+
+class InterruptedPipeline(ETLPipeline):
+    # Giả lập Ctrl-C ngay khi bắt đầu ghi chunk thứ interrupt_after + 1 (các chunk trước đã commit)
+
+    def __init__(self, *args, interrupt_after: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interrupt_after = interrupt_after
+        self.written = 0
+
+    def _write_staged(self, frames: list, checkpoint: dict | None):
+        if self.written == self.interrupt_after:
+            raise KeyboardInterrupt
+        super()._write_staged(frames, checkpoint)
+        self.written += 1
+
+
+def cleanup(csv_path: str):
+    # Xoá dữ liệu, checkpoint và staging của file kiểm tra để lần chạy sau load lại từ đầu
+    with DBManager.get_cursor() as cur:
+        for table in (TABLE_RAW, TABLE_CLEAN):
+            DBLoader.delete_existing(csv_path, table, cur)
+        for table in (TABLE_MANIFEST, TABLE_PROFILE):
+            cur.execute(f"DELETE FROM {table} WHERE src_file = %s", (csv_path,))
+        Deduplicator.release_file(cur, csv_path)
+        LoadCheckpoint.clear(cur, csv_path)
+    for table in (TABLE_RAW, TABLE_CLEAN):
+        DBLoader.drop_staging(DBLoader._staging_name(csv_path, table))
+
+
+def snapshot(csv_path: str) -> dict:
+    # Nội dung bảng của file (bỏ cột thời gian ingest), sắp theo row_hash để so 2 lần load
+    result = {}
+    with DBManager.get_cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {TABLE_LOAD_CHECKPOINT} WHERE src_file = %s;", (csv_path,))
+        result['checkpoints'] = cur.fetchone()[0]
+        cur.execute(f"SELECT raw_record, clean_record, price_sum, models FROM {TABLE_PROFILE} WHERE src_file = %s;",
+                    (csv_path,))
+        result['profile'] = cur.fetchone()
+        for table, columns in ((TABLE_RAW, 'model, year, price, mileage, file_hash, row_hash'),
+                               (TABLE_CLEAN, 'model, year, price, mileage, row_hash')):
+            cur.execute(f"SELECT {columns} FROM {table} WHERE src_file = %s ORDER BY row_hash, {columns};",
+                        (csv_path,))
+            result[table] = cur.fetchall()
+    return result
+
+
+def check_mode(csv_path: str, chunk_size: int, interrupt_after: int, pipelined: bool):
+    mode = 'pipelined' if pipelined else 'streaming'
+    cleanup(csv_path)
+    ETLPipeline(csv_path, chunk_size=chunk_size, pipelined=pipelined).run()
+    expected = snapshot(csv_path)
+    cleanup(csv_path)
+
+    interrupted = InterruptedPipeline(csv_path, chunk_size=chunk_size, pipelined=pipelined,
+                                      interrupt_after=interrupt_after)
+    try:
+        interrupted.run()
+    except KeyboardInterrupt:
+        pass
+    else:
+        raise AssertionError(f"[{mode}] run finished, file has too few chunks to interrupt")
+    with DBManager.get_cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {TABLE_LOAD_CHECKPOINT} WHERE src_file = %s;", (csv_path,))
+        checkpoints = cur.fetchone()[0]
+        cur.execute(f"SELECT COUNT(*) FROM {TABLE_CLEAN} WHERE src_file = %s;", (csv_path,))
+        published = cur.fetchone()[0]
+    assert checkpoints == interrupt_after, f"[{mode}] {checkpoints} checkpoints kept, expected {interrupt_after}"
+    assert published == 0, f"[{mode}] interrupted run published {published} rows"
+    for table in (TABLE_RAW, TABLE_CLEAN):
+        with DBManager.get_cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (DBLoader._staging_name(csv_path, table),))
+            assert cur.fetchone()[0], f"[{mode}] staging of {table} dropped after interrupt"
+
+    report = ETLPipeline(csv_path, chunk_size=chunk_size, pipelined=pipelined).run()
+    file_report = report['files'][0]
+    assert file_report.get('resumed_chunks') == interrupt_after, \
+        f"[{mode}] rerun resumed {file_report.get('resumed_chunks')} chunks, expected {interrupt_after}"
+    actual = snapshot(csv_path)
+    for key in expected:
+        assert actual[key] == expected[key], f"[{mode}] {key} differs from an uninterrupted load"
+    print(f"{mode:<10} OK (resumed after {interrupt_after} chunks)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--chunk-size', type=int, default=3_000)
+    parser.add_argument('--interrupt-after', type=int, default=3, help='Số chunk commit xong trước khi bị ngắt')
+    parser.add_argument('--dirty', type=float, default=0.05)
+    args = parser.parse_args()
+
+    DBLoader.create_raw_and_clean_table()
+    DataProfiler.create_profile_table()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = generate_csv(os.path.join(tmp, 'resume.csv'), args.rows, args.dirty)
+        try:
+            for pipelined in (False, True):
+                check_mode(csv_path, args.chunk_size, args.interrupt_after, pipelined)
+        finally:
+            cleanup(csv_path)
+
+
+if __name__ == '__main__':
+    main()
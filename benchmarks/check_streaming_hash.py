@@ -0,0 +1,82 @@
+# Kiểm tra chế độ streaming trên file nén chưa có hash: hash + parse các chunk chỉ giải nén file đúng 1 lượt
+# (đếm số lần open_decompressed), hash bằng hash của file thường, các chunk ghép lại giống extract cả file,
+# đọc tiếp từ giữa file (resume) vẫn ra hash của cả file. Không cần Postgres:
+#   python -m benchmarks.check_streaming_hash --rows 50000 --chunk-size 7000
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import pandas as pd
+from benchmarks.data_generator import generate_csv
+from src.extract import csv_extractor
+from src.extract.csv_extractor import ExtractorCSV
+from src.utils import fingerprint
+from src.utils.fingerprint import compute_fingerprint
+
+
+def count_opens() -> list:
+    # Bọc open_decompressed ở mọi module gọi nó, mỗi lần mở ghi lại 1 phần tử
+    opened = []
+    original = csv_extractor.open_decompressed
+
+    def counting(path):
+        opened.append(path)
+        return original(path)
+
+    csv_extractor.open_decompressed = counting
+    fingerprint.open_decompressed = counting
+    return opened
+
+
+def values(df: pd.DataFrame) -> pd.DataFrame:
+    # Các chunk có thể parse theo schema hoặc ép kiểu sau (dữ liệu bẩn) nên chỉ so giá trị, không so kiểu cột
+    df = df.reset_index(drop=True).astype(object)
+    return df.where(df.notna(), None)
+
+
+def stream(path: str, chunk_size: int, offset: int = 0, index: int = 0, row: int = 0) -> tuple[list, list, str]:
+    hash_result = {}
+    chunks = list(ExtractorCSV.extract_chunk_ranges(path, chunk_size, offset, index, row, hash_result))
+    return [c for c, _ in chunks], [p for _, p in chunks], hash_result.get('digest')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--chunk-size', type=int, default=7_000)
+    parser.add_argument('--dirty', type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = generate_csv(os.path.join(tmp, 'stream.csv'), args.rows, args.dirty)
+        path = f"{plain}.gz"
+        with open(plain, 'rb') as src, gzip.open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        expected_hash = compute_fingerprint(plain)
+        expected = ExtractorCSV._read_csv(plain, plain, 'c')
+        expected.columns = expected.columns.str.strip()
+
+        opened = count_opens()
+        frames, positions, digest = stream(path, args.chunk_size)
+        assert len(opened) == 1, f"compressed file opened {len(opened)} times, expected 1"
+        assert digest == expected_hash, "hash computed while streaming differs from plain CSV"
+        assert len(frames) > 2, "file too small for the chunk size"
+        streamed = pd.concat(frames)
+        assert len(streamed) == len(expected), f"{len(streamed)} rows streamed, expected {len(expected)}"
+        assert values(streamed).equals(values(expected)), "chunks differ from extract"
+
+        # Đọc tiếp sau chunk thứ 2 như khi resume: phần trước offset vẫn được hash, chunk sau giống lần đầu
+        last = positions[1]
+        opened.clear()
+        resumed, resumed_positions, digest = stream(path, args.chunk_size, last['byte_end'], 2,
+                                                    last['row_start'] + len(frames[1]))
+        assert len(opened) == 1, f"resume opened the file {len(opened)} times, expected 1"
+        assert digest == expected_hash, "hash after resume differs from the full file hash"
+        assert resumed_positions == positions[2:], "resumed chunk positions differ"
+        assert all(values(a).equals(values(b)) for a, b in zip(resumed, frames[2:])), "resumed chunks differ"
+        print(f"OK ({len(frames)} chunks, 1 decompression pass, resume from chunk 2)")
+
+
+if __name__ == '__main__':
+    main()
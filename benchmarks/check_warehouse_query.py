@@ -0,0 +1,94 @@
+# Kiểm tra WarehouseQuery (đọc từ bảng tổng hợp) khớp với số liệu tính thẳng trên bảng clean:
+# price_stats theo model và theo model + năm, counts_by_fuel_type, tên model chưa chuẩn hoá (' 3 Series')
+# Load 1 file sinh ngẫu nhiên vào warehouse rồi xoá đi sau khi kiểm tra
+# Chạy từ thư mục gốc của repo (cần Postgres local theo .env):
+#   python -m benchmarks.check_warehouse_query --rows 20000
+import argparse
+import os
+import tempfile
+from benchmarks.data_generator import generate_csv
+from config.constants import TABLE_RAW, TABLE_CLEAN, TABLE_MANIFEST, TABLE_PROFILE
+from flow.pipeline import ETLPipeline
+from src.load.db_loader import DBLoader
+from src.transform.dedup import Deduplicator
+from src.utils.db_manager import DBManager
+from src.utils.warehouse_query import WarehouseQuery
+
+
+def cleanup(csv_path: str):
+    # Xoá qua DBLoader.delete_existing để bảng tổng hợp cũng được trừ đi phần dữ liệu kiểm tra
+    with DBManager.get_cursor() as cur:
+        for table in (TABLE_RAW, TABLE_CLEAN):
+            DBLoader.delete_existing(csv_path, table, cur)
+        for table in (TABLE_MANIFEST, TABLE_PROFILE):
+            cur.execute(f"DELETE FROM {table} WHERE src_file = %s", (csv_path,))
+        Deduplicator.release_file(cur, csv_path)
+
+
+def expected_price_stats(model: str, year: int | None) -> dict | None:
+    where, params = "WHERE model = %s", [model]
+    if year is not None:
+        where, params = where + " AND year = %s", params + [year]
+    with DBManager.get_cursor() as cur:
+        cur.execute(f"SELECT COUNT(*), MIN(price), MAX(price), AVG(price) FROM {TABLE_CLEAN} {where};", params)
+        count, price_min, price_max, price_avg = cur.fetchone()
+    if not count:
+        return None
+    return {'count': count, 'min': price_min, 'max': price_max, 'avg': float(price_avg)}
+
+
+def check_price_stats(model: str, year: int | None):
+    label = f"price_stats({model!r}, {year})"
+    actual = WarehouseQuery.price_stats(model, year)
+    expected = expected_price_stats(model.strip().lower(), year)
+    if expected is None:
+        assert actual is None, f"{label} = {actual}, clean table has no rows"
+        return
+    assert actual is not None, f"{label} = None, clean table has {expected['count']} rows"
+    for key in ('count', 'min', 'max'):
+        assert actual[key] == expected[key], f"{label}: {key} = {actual[key]}, clean table has {expected[key]}"
+    assert isinstance(actual['avg'], float), f"{label}: avg is {type(actual['avg']).__name__}"
+    assert abs(actual['avg'] - expected['avg']) <= 0.01, f"{label}: avg {actual['avg']}, clean table {expected['avg']}"
+
+
+def check_fuel_counts(model: str | None):
+    actual = WarehouseQuery.counts_by_fuel_type(model)
+    where, params = ("WHERE model = %s", (model.strip().lower(),)) if model is not None else ("", None)
+    with DBManager.get_cursor() as cur:
+        cur.execute(f"SELECT fuel_type, COUNT(*) FROM {TABLE_CLEAN} {where} GROUP BY fuel_type;", params)
+        expected = {fuel: count for fuel, count in cur.fetchall()}
+    assert actual == expected, f"counts_by_fuel_type({model!r}) = {actual}, clean table has {expected}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = generate_csv(os.path.join(tmp, 'warehouse_query.csv'), args.rows, 0.05)
+        cleanup(csv_path)
+        try:
+            ETLPipeline(csv_path).run()
+            with DBManager.get_cursor() as cur:
+                cur.execute(f"SELECT DISTINCT model, year FROM {TABLE_CLEAN} WHERE src_file = %s "
+                            f"ORDER BY model, year LIMIT 20;", (csv_path,))
+                pairs = cur.fetchall()
+            assert pairs, "no clean rows loaded"
+            for model, year in pairs:
+                check_price_stats(model, None)
+                check_price_stats(model, year)
+            # Tên model như trong file gốc (có khoảng trắng, viết hoa) phải trả cùng kết quả
+            check_price_stats(' 3 Series', None)
+            check_price_stats(' 3 Series', 2019)
+            assert WarehouseQuery.price_stats(' 3 Series', 2019) == WarehouseQuery.price_stats('3 series', 2019)
+            check_price_stats('no such model', 2019)
+            check_fuel_counts(None)
+            check_fuel_counts(' 3 Series')
+            print(f"OK ({len(pairs)} model / year pairs, cache {WarehouseQuery.cache_stats()})")
+        finally:
+            cleanup(csv_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Sinh file CSV giả lập theo schema bmw.csv (model, year, price, transmission, mileage, fuelType, tax, mpg, engineSize)
+# Kích thước từ vài nghìn tới hàng chục triệu dòng, tỉ lệ dữ liệu bẩn điều chỉnh được
+# Ví dụ: python -m benchmarks.data_generator --rows 1000000 --out archive/synthetic_1m.csv --dirty 0.05
+import argparse
+import numpy as np
+import pandas as pd
+
+MODELS = [' 1 Series', ' 2 Series', ' 3 Series', ' 4 Series', ' 5 Series', ' 6 Series', ' 7 Series', ' 8 Series',
+          ' X1', ' X2', ' X3', ' X4', ' X5', ' X6', ' X7', ' M2', ' M3', ' M4', ' M5', ' Z4', ' i3', ' i8']
+TRANSMISSIONS = ['Automatic', 'Manual', 'Semi-Auto']
+FUEL_TYPES = ['Diesel', 'Petrol', 'Hybrid', 'Electric', 'Other']
+ENGINE_SIZES = [0.0, 1.5, 2.0, 2.5, 3.0, 4.0, 4.4, 6.6]
+
+# Tỉ lệ (trên tổng số dòng) của từng loại lỗi khi dirty_ratio = 1.0, được nhân với dirty_ratio thực tế
+DIRTY_MIX = {
+    'null_critical': 0.25,      # model / year / price bị trống -> bị loại
+    'null_fillable': 0.25,      # mileage / tax / mpg / engineSize bị trống -> điền 0
+    'negative_price': 0.15,     # vi phạm price > 0
+    'old_year': 0.15,           # vi phạm year >= 2014
+    'negative_mileage': 0.10,   # vi phạm mileage >= 0
+    'garbage_number': 0.10,     # price không phải số -> coerce thành NA
+}
+
+
+def make_frame(rows: int, seed: int = 42, dirty_ratio: float = 0.0) -> pd.DataFrame:
+    # Tạo DataFrame giả lập, dirty_ratio là tỉ lệ dòng bị cài lỗi (0.0 -> 1.0)
+    rng = np.random.default_rng(seed)
+    # Cột số nguyên dùng Int64 (nullable) để cài NULL vào mà file CSV vẫn ghi số nguyên như file thật
+    df = pd.DataFrame({
+        'model': rng.choice(MODELS, rows),
+        'year': pd.array(rng.integers(2014, 2021, rows), dtype='Int64'),
+        'price': pd.array(rng.integers(1000, 125000, rows), dtype='Int64'),
+        'transmission': rng.choice(TRANSMISSIONS, rows),
+        'mileage': pd.array(rng.integers(0, 215000, rows), dtype='Int64'),
+        'fuelType': rng.choice(FUEL_TYPES, rows, p=[0.6, 0.3, 0.07, 0.01, 0.02]),
+        'tax': pd.array(rng.integers(0, 580, rows), dtype='Int64'),
+        'mpg': rng.uniform(5.5, 470.8, rows).round(1),
+        'engineSize': rng.choice(ENGINE_SIZES, rows),
+    })
+    if dirty_ratio <= 0:
+        return df
+
+    def pick(share: float) -> np.ndarray:
+        return rng.random(rows) < dirty_ratio * share
+
+    for col in ('model', 'year', 'price'):
+        df.loc[pick(DIRTY_MIX['null_critical'] / 3), col] = None
+    for col in ('mileage', 'tax', 'mpg', 'engineSize'):
+        df.loc[pick(DIRTY_MIX['null_fillable'] / 4), col] = None
+    df.loc[pick(DIRTY_MIX['negative_price']), 'price'] = -1
+    df.loc[pick(DIRTY_MIX['old_year']), 'year'] = rng.integers(1996, 2014)
+    df.loc[pick(DIRTY_MIX['negative_mileage']), 'mileage'] = -100
+    garbage = pick(DIRTY_MIX['garbage_number'])
+    if garbage.any():
+        df['price'] = df['price'].astype(object)
+        df.loc[garbage, 'price'] = 'N/A'
+    return df
+
+
+def generate_csv(path: str, rows: int, dirty_ratio: float = 0.0, seed: int = 42,
+                 chunk_rows: int = 1_000_000) -> str:
+    # Ghi file theo từng khối chunk_rows dòng nên sinh được file 50M dòng mà không cần giữ hết trong RAM
+    written = 0
+    index = 0
+    while written < rows:
+        n = min(chunk_rows, rows - written)
+        df = make_frame(n, seed=seed + index, dirty_ratio=dirty_ratio)
+        df.to_csv(path, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+        written += n
+        index += 1
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--dirty', type=float, default=0.05, help='Tỉ lệ dòng bẩn, 0.0 - 1.0')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate_csv(args.out, args.rows, args.dirty, args.seed)
+    print(f"Wrote {args.rows} rows to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
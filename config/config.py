@@ -9,4 +9,12 @@ DB_CONFIG = {
     "dbname" : os.getenv("DB_NAME"),
     "user" : os.getenv("DB_USER"),
     "password" : os.getenv("DB_PASSWORD")
-}
\ No newline at end of file
+}
+
+# Cấu hình connection pool của DBManager, chỉnh qua biến môi trường khi cần nhiều thread load hơn
+DB_POOL_CONFIG = {
+    "minconn" : int(os.getenv("DB_POOL_MIN", 1)),
+    "maxconn" : int(os.getenv("DB_POOL_MAX", 10)),
+    "checkout_timeout" : float(os.getenv("DB_POOL_TIMEOUT", 30)),   # Số giây tối đa chờ 1 connection rảnh
+    "ping_after" : float(os.getenv("DB_POOL_PING_AFTER", 30)),      # Connection rảnh quá lâu thì SELECT 1 trước khi dùng
+}
@@ -1,5 +1,14 @@
 TABLE_RAW = 'raw_bmw_sales'
 TABLE_CLEAN = 'clean_bmw_sales'
+TABLE_MANIFEST = 'ingest_manifest'
+TABLE_PROFILE = 'file_profile'
+# Bảng tổng hợp được cập nhật dần theo từng lần load bảng clean
+TABLE_AGG_MODEL = 'agg_model'
+TABLE_AGG_MODEL_YEAR_FUEL = 'agg_model_year_fuel'
+# Bảng key hash của mọi listing đã có trong bảng clean, dùng để loại listing trùng giữa các file
+TABLE_DEDUP_KEYS = 'dedup_keys'
+# Checkpoint của từng chunk đã ghi vào staging ở chế độ streaming, dùng để resume khi load bị ngắt giữa chừng
+TABLE_LOAD_CHECKPOINT = 'load_checkpoint'
 
 REQUIRED_COLUMNS = {
     'model',
@@ -25,4 +34,184 @@ DATA_TYPES = {
     'tax': 'Int64',
     'mpg': 'float',
     'engine_size': 'float'
-}
\ No newline at end of file
+}
+
+# Thứ tự cột khi load vào DB, dùng chung cho COPY / execute_values / executemany
+RAW_DB_COLUMNS = [
+    'model', 'year', 'price', 'transmission', 'mileage',
+    'fuel_type', 'tax', 'mpg', 'engine_size', 'src_file', 'file_hash', 'row_hash'
+]
+
+CLEAN_DB_COLUMNS = [
+    'model', 'year', 'price', 'transmission', 'mileage',
+    'fuel_type', 'tax', 'mpg', 'engine_size', 'src_file', 'row_hash'
+]
+
+# Chiến lược load: 'copy' (COPY FROM STDIN), 'execute_values' hoặc 'executemany' (cách cũ)
+LOAD_STRATEGIES = ('copy', 'execute_values', 'executemany')
+DEFAULT_LOAD_STRATEGY = 'copy'
+EXECUTE_VALUES_PAGE_SIZE = 1000
+
+# Số dòng mỗi chunk khi chạy pipeline ở chế độ streaming
+DEFAULT_CHUNK_SIZE = 100_000
+# Chế độ pipelined: số chunk tối đa chờ trong hàng đợi giữa thread đọc / clean và thread load
+# Hàng đợi đầy thì thread đọc phải chờ (backpressure), RAM chỉ giữ tối đa chừng đó chunk
+PIPELINE_QUEUE_SIZE = 4
+
+# Số thread tối đa chạy các stage độc lập của pipeline cùng lúc (flow/dag.py)
+# vd tạo bảng song song với extract, load raw song song với clean
+PIPELINE_STAGE_WORKERS = 4
+
+# Số thread load song song khi pipeline chạy nhiều file, mỗi thread giữ 1 connection của pool
+# Phải nhỏ hơn maxconn trong DB_POOL_CONFIG (config/config.py)
+PARALLEL_LOAD_WORKERS = 4
+# File lấy khi csv_path là 1 thư mục: CSV thường và CSV nén (đọc thẳng, không giải nén ra đĩa)
+CSV_GLOB_PATTERNS = ('*.csv', '*.csv.gz', '*.csv.bz2', '*.csv.xz', '*.csv.zst')
+# Đuôi file -> loại nén (src/utils/compressed_io.py), không khớp đuôi thì nhận theo magic bytes đầu file
+COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+    '.zstd': 'zstd',
+}
+
+# Fingerprint file: thuật toán hash (tên trong hashlib, vd 'md5', 'sha256', 'blake2b')
+HASH_ALGORITHM = 'blake2b'
+HASH_READ_BUFFER = 1 << 20           # đọc 1 MB mỗi lần thay vì 4 KB
+HASH_MMAP_THRESHOLD = 64 << 20       # file >= 64 MB thì hash qua mmap
+FINGERPRINT_CACHE_PATH = '.cache/fingerprints.json'
+
+# ===== Cleaning rules (DataCleaner / RuleEngine) =====
+# Cột text được strip + lower
+TEXT_COLUMNS = ['model', 'transmission', 'fuel_type']
+
+# Dòng null ở các cột này thì bị loại (tên cột sau khi rename)
+NULL_DROP_COLUMNS = ['model', 'year', 'price']
+
+# Cột số được điền giá trị mặc định khi null
+NULL_FILL_VALUES = {
+    'mileage': 0,
+    'tax': 0,
+    'mpg': 0,
+    'engine_size': 0
+}
+
+# Business rule dạng (tên rule, cột, toán tử, ngưỡng), dòng nào vi phạm thì bị loại
+# Thêm rule mới chỉ cần thêm 1 dòng ở đây
+RANGE_RULES = [
+    ('price_positive', 'price', '>', 0),
+    ('year_min_2014', 'year', '>=', 2014),
+    ('mileage_non_negative', 'mileage', '>=', 0),
+]
+
+# Độ rộng mỗi bin histogram giá dùng để gộp median giữa các file (median toàn cục sai số tối đa 1 bin)
+PRICE_HISTOGRAM_BIN_WIDTH = 100
+
+# Metrics của mỗi lần chạy pipeline (JSON + file .prof nếu bật profiling)
+METRICS_DIR = 'metrics'
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+# Chu kỳ lấy mẫu RSS hiện tại trong lúc có stage đang chạy (tính peak RSS của từng stage)
+METRICS_RSS_SAMPLE_SECONDS = 0.02
+
+# Schema khi đọc CSV (tên cột gốc trong file): text -> category, số -> kiểu nullable hẹp nhất đủ chứa dữ liệu
+CSV_DTYPES = {
+    'model': 'category',
+    'year': 'Int16',
+    'price': 'Int32',
+    'transmission': 'category',
+    'mileage': 'Int32',
+    'fuelType': 'category',
+    'tax': 'Int16',
+    'mpg': 'float32',
+    'engineSize': 'float32'
+}
+
+# Engine parse CSV của pandas: 'c' (mặc định) hoặc 'pyarrow' (đa luồng, cần cài pyarrow, không hỗ trợ chunksize)
+CSV_PARSER_ENGINES = ('c', 'pyarrow')
+DEFAULT_CSV_ENGINE = 'c'
+
+# Parse song song 1 file CSV lớn (ExtractorCSV.extract_parallel): file được map vào bộ nhớ, chia thành các khoảng byte
+# cắt đúng ở ký tự xuống dòng, mỗi process parse + clean 1 khoảng, kết quả trả về qua shared memory dạng Arrow (cần pyarrow)
+# File nhỏ hơn PARALLEL_PARSE_MIN_BYTES thì parse tuần tự (chi phí tạo process + gom kết quả không đáng)
+PARALLEL_PARSE_MIN_BYTES = 64 << 20     # 64 MB
+# Số khoảng byte cho mỗi worker, > 1 để worker xong sớm nhận thêm khoảng khác (cân bằng tải)
+PARALLEL_PARSE_RANGES_PER_WORKER = 2
+
+# Tăng khi đổi logic clean trong code (rule trong file này đã tự được đưa vào version stamp)
+CLEANING_RULES_VERSION = 1
+
+# Cache kết quả extract / transform dạng Arrow (Feather) theo hash file, cần cài pyarrow
+STAGE_CACHE_ENABLED = True
+STAGE_CACHE_DIR = '.cache/stages'
+STAGE_CACHE_MAX_BYTES = 2 << 30     # 2 GB, vượt thì xoá entry dùng lâu nhất (LRU)
+
+# Tạo bảng raw / clean dạng partition theo src_file (LIST), mỗi file 1 partition
+# Chỉ có tác dụng khi bảng chưa tồn tại; thay dữ liệu 1 file = detach/drop/tạo lại partition thay vì DELETE
+PARTITIONED_TABLES = False
+
+# Load lại file đã có trong warehouse: ghi vào bảng staging UNLOGGED trước, kiểm tra rồi mới publish
+# trong 1 transaction (xoá cũ + INSERT ... SELECT, hoặc swap partition) nên người đọc không thấy file bị thiếu
+STAGED_RELOADS = True
+STAGING_TABLE_PREFIX = 'stg'
+
+# Load lại file đã sửa 1 vài dòng: so hash từng dòng (row_hash) với dữ liệu đang có của file,
+# chỉ insert dòng mới và xoá dòng đã bị bỏ. Thay đổi vượt DELTA_MAX_CHANGE_RATIO số dòng thì thay cả file
+DELTA_RELOADS = True
+DELTA_MAX_CHANGE_RATIO = 0.5
+
+# Loại listing trùng trước khi ghi vào bảng clean (src/transform/dedup.py), key là row_hash của bảng clean
+# - Trùng trong cùng 1 file: bỏ ở bước transform
+# - Trùng với file khác đã load: tra bảng TABLE_DEDUP_KEYS, mỗi chunk 1 query
+DEDUP_ENABLED = True
+
+# Chế độ streaming / pipelined: mỗi chunk ghi vào staging cùng transaction với 1 dòng checkpoint
+# (offset byte / dòng + hash của chunk). Load bị ngắt thì staging được giữ lại, lần chạy sau với cùng hash file
+# đọc tiếp từ byte sau chunk cuối đã commit thay vì làm lại từ đầu (src/load/checkpoint.py)
+CHECKPOINTED_LOADS = True
+
+# Logging: format 'json' (mỗi dòng 1 object JSON) hoặc 'text' (format cũ)
+# Log từng thao tác DB (lấy / trả connection, commit, đóng cursor) ở mức DEBUG, chỉ ghi khi LOG_LEVEL = 'DEBUG'
+# và theo tỉ lệ lấy mẫu DB_OP_LOG_SAMPLE_RATE (0 = tắt, 1 = ghi mọi thao tác)
+LOG_DIR = 'logs'
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = 'json'
+DB_OP_LOG_SAMPLE_RATE = 0.0
+
+# Kết nối DB lỗi tạm thời (OperationalError) thì thử lại DB_CONNECT_RETRIES lần, chờ DB_RETRY_BACKOFF giây, nhân đôi mỗi lần
+DB_CONNECT_RETRIES = 3
+DB_RETRY_BACKOFF = 0.5
+
+# Preset cấu hình session theo mục đích, áp dụng bằng SET LOCAL nên chỉ có tác dụng trong transaction của cursor
+DB_SESSION_PRESETS = {
+    'default': {},
+    # Ghi vào bảng staging: mất khi crash thì chỉ cần load lại, không cần chờ flush WAL khi commit
+    'bulk_load': {'work_mem': '256MB', 'maintenance_work_mem': '512MB', 'synchronous_commit': 'off'},
+    # Truy vấn tổng hợp / report trên bảng lớn (sort, hash aggregate)
+    'report': {'work_mem': '128MB'},
+}
+
+# Cache kết quả của các truy vấn đọc (src/utils/warehouse_query.py): LRU tối đa QUERY_CACHE_MAX_ENTRIES entry,
+# mỗi entry sống tối đa QUERY_CACHE_TTL_SECONDS giây, bị xoá sớm hơn khi pipeline commit dữ liệu mới
+QUERY_CACHE_MAX_ENTRIES = 1024
+QUERY_CACHE_TTL_SECONDS = 300
+
+# Validate dữ liệu clean trước khi load (src/transform/validate.py): null / kiểu dữ liệu / khoảng giá trị
+VALIDATION_COLUMNS = ['model', 'year', 'price', 'transmission', 'mileage', 'fuel_type', 'tax', 'mpg', 'engine_size']
+# Kiểu mong đợi của từng cột: 'int', 'float' hoặc 'text'
+VALIDATION_DTYPES = {
+    'model': 'text', 'year': 'int', 'price': 'int', 'transmission': 'text', 'mileage': 'int',
+    'fuel_type': 'text', 'tax': 'int', 'mpg': 'float', 'engine_size': 'float',
+}
+# (tên rule, cột, toán tử, ngưỡng): dòng hợp lệ phải thoả điều kiện
+VALIDATION_RANGE_RULES = [
+    ('year_min_1990', 'year', '>=', 1990),
+    ('price_non_negative', 'price', '>=', 0),
+    ('mileage_non_negative', 'mileage', '>=', 0),
+]
+# Frame lớn hơn VALIDATION_SAMPLE_THRESHOLD dòng thì chỉ kiểm tra mẫu ngẫu nhiên VALIDATION_SAMPLE_SIZE dòng
+VALIDATION_SAMPLE_THRESHOLD = 2_000_000
+VALIDATION_SAMPLE_SIZE = 200_000
+# True: có vi phạm thì dừng load file đó, False: chỉ ghi vào report
+VALIDATION_FAIL_ON_VIOLATION = True
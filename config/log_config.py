@@ -1,33 +1,140 @@
+import atexit
+import copy
+import json
 import logging as log
 import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from config.constants import LOG_DIR, LOG_LEVEL, LOG_FORMAT
 
-def logger_config(name_file:str) -> log.Logger: # name_file là tên file log muốn tạo chứ không phải file data
-    os.makedirs('logs', exist_ok=True) # Tạo thư mục logs nếu chưa tồn tại
+# Mọi logger của các module dùng chung 1 QueueHandler: thread gọi log chỉ đẩy record vào hàng đợi,
+# việc format (JSON hoặc text) và ghi ra console / file do 1 thread listener riêng làm
+# nên các thread load / process không phải chờ I/O của log
 
+
+class JsonFormatter(log.Formatter):
+    # Mỗi record thành 1 dòng JSON, các field truyền qua extra={...} được giữ nguyên làm key
+    _RESERVED = set(vars(log.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record: log.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        payload.update({k: v for k, v in record.__dict__.items() if k not in self._RESERVED})
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _PerLoggerFileHandler(log.Handler):
+    # Giữ cách cũ: mỗi logger ghi lỗi vào file riêng logs/<tên logger>.log, file chỉ mở khi có lỗi đầu tiên
+    def __init__(self, level: int):
+        super().__init__(level)
+        self._files = {}
+
+    def emit(self, record: log.LogRecord):
+        handler = self._files.get(record.name)
+        if handler is None:
+            handler = log.FileHandler(f'{LOG_DIR}/{record.name}.log', mode='a', encoding='utf-8', delay=True)
+            handler.setFormatter(self.formatter)
+            self._files[record.name] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self._files.values():
+            handler.close()
+        super().close()
+
+
+class _ProcessLocalQueueHandler(QueueHandler):
+
+    def emit(self, record: log.LogRecord):
+        # Process con (fork từ process pool của chế độ nhiều file) không có thread listener,
+        # ghi thẳng ra handler để không mất log
+        if os.getpid() != _listener_pid:
+            for handler in _sinks:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return
+        super().emit(record)
+
+    def prepare(self, record: log.LogRecord) -> log.LogRecord:
+        # Chỉ ghép message + traceback ở thread gọi (args / exc_info có thể không an toàn khi dùng ở thread khác)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = log.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_setup_lock = threading.Lock()
+_listener = None
+_listener_pid = None
+_sinks = []
+_queue_handler = None
+
+
+def _make_formatter() -> log.Formatter:
+    if LOG_FORMAT == 'json':
+        return JsonFormatter()
+    return log.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+
+def _ensure_listener() -> QueueHandler:
+    # Khởi tạo 1 lần cho mỗi process: hàng đợi + thread listener + các handler ghi thật
+    global _listener, _listener_pid, _sinks, _queue_handler
+    with _setup_lock:
+        if _queue_handler is not None:
+            return _queue_handler
+        os.makedirs(LOG_DIR, exist_ok=True) # Tạo thư mục logs nếu chưa tồn tại
+        formatter = _make_formatter()
+
+        file_handler = _PerLoggerFileHandler(log.ERROR) # File chỉ ghi từ mức ERROR
+        console_handler = log.StreamHandler() # In ra console từ mức INFO
+        console_handler.setLevel(log.INFO)
+        for handler in (file_handler, console_handler):
+            handler.setFormatter(formatter)
+        _sinks = [file_handler, console_handler]
+
+        log_queue = queue.SimpleQueue()
+        _listener = QueueListener(log_queue, *_sinks, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+        _queue_handler = _ProcessLocalQueueHandler(log_queue)
+        atexit.register(stop_logging)
+        return _queue_handler
+
+
+def stop_logging():
+    # Ghi nốt các record còn trong hàng đợi rồi dừng thread listener (tự gọi khi process thoát)
+    global _listener
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            _listener = None
+            for handler in _sinks:
+                handler.close()
+
+
+def logger_config(name_file:str) -> log.Logger: # name_file là tên logger, cũng là tên file log lỗi logs/name_file.log
     logger = log.getLogger(name_file) # Này là để tạo logger với tên file
-    logger.setLevel(log.DEBUG) # Set mức độ log là DEBUG để ghi lại tất cả các mức độ log
+    # Level lấy từ LOG_LEVEL: mặc định INFO nên logger.debug(...) bị bỏ qua ngay, không tạo record
+    logger.setLevel(LOG_LEVEL)
 
     # Viết điều kiện để tránh việc thêm nhiều handler giống nhau khi gọi hàm nhiều lần
     if logger.handlers: 
         return logger # Nếu đã có handler rồi thì trả về luôn
-    
-    # Tạo handler để ghi log vào file có nghĩa là khi dùng nó thì log sẽ được ghi vào file kiểu logs/name_file.log
-    file_handler = log.FileHandler(f'logs/{name_file}.log', mode='a', encoding='utf-8') # mode 'a' là append, 'w' là ghi đè
-    file_handler.setLevel(log.ERROR) # Set mức độ log cho file handler là ERROR
-
-    # Tạo handler để in log ra console chỉ khi có mức độ INFO trở lên
-    console_handler = log.StreamHandler() # Hàm này để in log ra console
-    console_handler.setLevel(log.INFO) # Set mức độ log cho console handler là INFO
-    
-    # Tạo formatter để định dạng log
-    formatter = log.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-
-    # Thêm các handler vào logger là để logger biết có những handler nào để xử lý log, tức lúc này file_handler và console_handler 
-    # sẽ được thêm vào logger và lưu ở file logger.handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-    
-    return logger
\ No newline at end of file
+
+    logger.addHandler(_ensure_listener())
+    return logger
@@ -0,0 +1,219 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from config.log_config import logger_config
+from config.constants import PIPELINE_STAGE_WORKERS
+
+logger = logger_config('flow.dag')
+
+# Đây là nơi khai báo pipeline dưới dạng DAG các stage có tên, mỗi stage khai báo input / output theo tên
+# - Stage chạy ngay khi đủ input, các stage độc lập chạy song song trên thread pool
+#   (hoặc process pool nếu khai báo pool='process', hàm phải để ở module level để pickle được)
+# - Stage bị skip (skip=...) hoặc trả về SKIPPED thì không có output, stage nào cần output đó cũng bị skip theo;
+#   input khai báo trong optional thì stage vẫn chạy, thiếu input nào thì nhận None
+# - Mỗi stage được ghi lại thời điểm bắt đầu / kết thúc (timeline), kèm critical path của lần chạy
+# Ví dụ:
+# graph = StageGraph()
+# graph.add(Stage('extract', lambda: ExtractorCSV.extract_with_fingerprint(path), outputs=('df_raw', 'file_hash')))
+# graph.add(Stage('clean', DataCleaner.clean_data, inputs=('df_raw',), outputs=('df_clean',)))
+# values, timeline = graph.run(skip=('clean',))
+
+SKIPPED = object()  # Stage trả về giá trị này: không có output, các stage phụ thuộc bị skip theo
+
+
+class Stage:
+
+    # func được gọi với input dạng keyword (tên input = tên tham số)
+    # 1 output: func trả về giá trị đó; nhiều output: trả về tuple đúng thứ tự outputs
+    def __init__(self, name: str, func, inputs: tuple = (), outputs: tuple = (), optional: tuple = (),
+                 pool: str = 'thread'):
+        if pool not in ('thread', 'process'):
+            raise ValueError(f"Invalid pool for stage {name}: {pool}. Expected 'thread' or 'process'")
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.optional = tuple(optional)
+        self.outputs = tuple(outputs)
+        self.pool = pool
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs + self.optional}, outputs={self.outputs})"
+
+
+class StageGraph:
+
+    def __init__(self, max_workers: int = PIPELINE_STAGE_WORKERS):
+        self.max_workers = max_workers
+        self.stages = {}       # Giữ thứ tự add, dùng làm thứ tự ưu tiên khi nhiều stage cùng sẵn sàng
+        self._producers = {}   # tên output -> tên stage tạo ra nó
+
+    def add(self, stage: Stage) -> Stage:
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        for output in stage.outputs:
+            if output in self._producers:
+                raise ValueError(f"Output '{output}' of stage {stage.name} already produced by "
+                                 f"stage {self._producers[output]}")
+        self.stages[stage.name] = stage
+        for output in stage.outputs:
+            self._producers[output] = stage.name
+        return stage
+
+    def names(self) -> list[str]:
+        return list(self.stages)
+
+    def _check(self, initial: dict, skip: set):
+        # Mọi input phải có stage tạo ra hoặc được truyền sẵn, tên stage skip phải tồn tại, không có vòng lặp
+        unknown = skip - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages to skip: {sorted(unknown)}. Available: {self.names()}")
+        for stage in self.stages.values():
+            missing = [name for name in stage.inputs + stage.optional
+                       if name not in self._producers and name not in initial]
+            if missing:
+                raise ValueError(f"Stage {stage.name} needs {missing} but no stage produces them")
+        visiting, done = set(), set()
+
+        def visit(name: str, path: list):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in stage graph: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for value in self.stages[name].inputs + self.stages[name].optional:
+                if value in self._producers and value not in initial:
+                    visit(self._producers[value], path + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    def run(self, initial: dict | None = None, skip=()) -> tuple[dict, dict]:
+        # initial: giá trị có sẵn (không cần stage nào tạo), skip: tên các stage không chạy
+        # Trả về (mọi giá trị đã tạo ra, timeline). Stage lỗi: chờ các stage đang chạy xong rồi raise lỗi đầu tiên
+        values = dict(initial or {})
+        skip = set(skip)
+        self._check(values, skip)
+        pending = dict(self.stages)
+        running = {}           # future -> tên stage
+        records = {}           # tên stage -> record trong timeline
+        finished = set()       # stage đã kết thúc (xong / skip / lỗi)
+        errors = []
+        lock = threading.Lock()
+        started = time.perf_counter()
+        needs_process = any(stage.pool == 'process' for stage in self.stages.values())
+        thread_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='etl-stage')
+        process_pool = ProcessPoolExecutor(max_workers=self.max_workers) if needs_process else None
+
+        def mark_skipped(name: str, reason: str):
+            records[name] = {'stage': name, 'status': 'skipped', 'reason': reason, 'start': None, 'end': None,
+                             'seconds': 0.0}
+            finished.add(name)
+            logger.info(f"Stage {name} skipped ({reason})")
+
+        def resolved(name: str) -> bool:
+            # Giá trị đã có, hoặc stage tạo ra nó đã kết thúc mà không tạo được (bị skip)
+            return name in values or self._producers.get(name) in finished
+
+        def timed(stage: Stage, kwargs: dict):
+            # Chạy trong thread của pool, ghi lại thời điểm bắt đầu / kết thúc tính từ lúc bắt đầu run
+            start = time.perf_counter() - started
+            with lock:
+                records[stage.name] = {'stage': stage.name, 'status': 'running', 'start': start,
+                                       'thread': threading.current_thread().name}
+            try:
+                if stage.pool == 'process':
+                    return process_pool.submit(stage.func, **kwargs).result()
+                return stage.func(**kwargs)
+            finally:
+                with lock:
+                    end = time.perf_counter() - started
+                    records[stage.name].update(end=end, seconds=end - start)
+
+        def submit_ready():
+            for name, stage in list(pending.items()):
+                if errors:
+                    return
+                if name in skip:
+                    del pending[name]
+                    mark_skipped(name, 'skipped by caller')
+                    continue
+                # Thiếu 1 input bắt buộc là biết bị skip, không cần chờ các input còn lại
+                lost = [value for value in stage.inputs if resolved(value) and value not in values]
+                if lost:
+                    del pending[name]
+                    mark_skipped(name, f"missing {lost}")
+                    continue
+                if not all(resolved(value) for value in stage.inputs + stage.optional):
+                    continue
+                del pending[name]
+                kwargs = {value: values.get(value) for value in stage.inputs + stage.optional}
+                running[thread_pool.submit(timed, stage, kwargs)] = name
+
+        try:
+            # Skip 1 stage có thể làm các stage phía sau sẵn sàng (bị skip theo) nên lặp tới khi không đổi
+            size = None
+            while size != len(pending):
+                size = len(pending)
+                submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    finished.add(name)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.exception(f"Stage {name} failed: {e}")
+                        records[name]['status'] = 'failed'
+                        errors.append(e)
+                        continue
+                    if result is SKIPPED:
+                        records[name]['status'] = 'skipped'
+                        records[name]['reason'] = 'returned SKIPPED'
+                        logger.info(f"Stage {name} returned SKIPPED, dependent stages are skipped")
+                        continue
+                    records[name]['status'] = 'done'
+                    if len(stage.outputs) == 1:
+                        values[stage.outputs[0]] = result
+                    elif stage.outputs:
+                        values.update(zip(stage.outputs, result))
+                size = None
+                while not errors and size != len(pending):
+                    size = len(pending)
+                    submit_ready()
+        finally:
+            thread_pool.shutdown(wait=True)
+            if process_pool is not None:
+                process_pool.shutdown(wait=True)
+
+        timeline = self._timeline(records, time.perf_counter() - started)
+        if errors:
+            logger.error(f"Stage graph stopped, not run: {sorted(pending)}")
+            raise errors[0]
+        return values, timeline
+
+    def _timeline(self, records: dict, wall_seconds: float) -> dict:
+        # Critical path: đi ngược từ stage kết thúc muộn nhất, mỗi bước chọn input (stage tạo ra nó) kết thúc muộn nhất
+        # Tổng thời gian các stage trên path gần bằng wall time, muốn chạy nhanh hơn thì phải rút ngắn các stage này
+        ran = {name: record for name, record in records.items() if record['start'] is not None}
+        path = []
+        current = max(ran, key=lambda name: ran[name]['end'], default=None)
+        while current is not None:
+            path.append(current)
+            stage = self.stages[current]
+            parents = {self._producers.get(value) for value in stage.inputs + stage.optional} & set(ran)
+            current = max(parents, key=lambda name: ran[name]['end'], default=None)
+        stages = []
+        for name in self.stages:
+            if name not in records:
+                continue
+            record = dict(records[name])
+            for key in ('start', 'end', 'seconds'):
+                if record.get(key) is not None:
+                    record[key] = round(record[key], 4)
+            stages.append(record)
+        stages.sort(key=lambda record: (record['start'] is None, record['start'] or 0.0))
+        return {'wall_seconds': round(wall_seconds, 4), 'stages': stages, 'critical_path': path[::-1]}
@@ -1,61 +1,659 @@
+import glob
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
 from config.log_config import logger_config
+from config.constants import (TABLE_RAW, TABLE_CLEAN, PARALLEL_LOAD_WORKERS, CSV_GLOB_PATTERNS, DEFAULT_CSV_ENGINE,
+                              DEFAULT_CHUNK_SIZE, PIPELINE_QUEUE_SIZE, VALIDATION_FAIL_ON_VIOLATION, CHECKPOINTED_LOADS)
 from src.extract.csv_extractor import ExtractorCSV
 from src.transform.cleaner import DataCleaner
+from src.transform.dedup import Deduplicator, IN_FILE, IN_WAREHOUSE
+from src.transform.validate import (cal_hash_file, validate_dataframe, merge_validation_reports,
+                                    log_validation_report)
+from src.utils.fingerprint import FingerprintCache
+from src.utils.compressed_io import detect_compression
 from src.load.db_loader import DBLoader
+from src.load.checkpoint import LoadCheckpoint
 from src.utils.data_profiler import DataProfiler
+from src.utils.db_manager import DBManager
+from src.utils.metrics import RunMetrics
+from src.utils.stage_cache import StageCache
+from flow.dag import SKIPPED, Stage, StageGraph
 
 logger = logger_config('flow.pipeline')
 
+
+def _extract_stage(csv_path: str, csv_engine: str = DEFAULT_CSV_ENGINE):
+    # File không đổi và đã có trong stage cache thì đọc lại bản Arrow qua memory map thay vì parse CSV
+    cached_hash = FingerprintCache.get(csv_path)
+    hit = StageCache.get(cached_hash, 'extract')
+    if hit is not None:
+        return hit[0], cached_hash
+    df_raw, file_hash = ExtractorCSV.extract_with_fingerprint(csv_path, csv_engine)
+    StageCache.put(file_hash, 'extract', df_raw)
+    return df_raw, file_hash
+
+
+def _dedup_stage(df_clean, rejections: dict):
+    # Bỏ listing trùng trong cùng file / chunk ngay sau clean, số dòng bị bỏ tính như 1 rule loại dòng
+    # Trùng với file khác được kiểm tra lúc load (cần DB), xem src/transform/dedup.py
+    df_clean, duplicates = Deduplicator.drop_in_file(df_clean)
+    if duplicates:
+        rejections = dict(rejections, **{IN_FILE: duplicates})
+    return df_clean, rejections
+
+
+def _parallel_extract_stage(csv_path: str, workers: int, csv_engine: str = DEFAULT_CSV_ENGINE):
+    # Giống _extract_stage nhưng 1 file lớn được parse + clean song song theo khoảng byte
+    # Trả thêm (df_clean, rejections) đã clean sẵn để bước transform không phải clean lại, None nếu lấy từ cache
+    cached_hash = FingerprintCache.get(csv_path)
+    hit = StageCache.get(cached_hash, 'extract')
+    if hit is not None:
+        return hit[0], cached_hash, None
+    df_raw, df_clean, rejections, file_hash = ExtractorCSV.extract_parallel(csv_path, workers, csv_engine)
+    StageCache.put(file_hash, 'extract', df_raw)
+    return df_raw, file_hash, (df_clean, rejections)
+
+
+def _transform_stage(df_raw, file_hash: str, cleaned: tuple | None = None):
+    # Kết quả clean được cache theo hash file + version stamp của rule clean
+    # cleaned: (df_clean, rejections) đã clean sẵn lúc extract (parse song song), chỉ còn dedup + profile
+    hit = StageCache.get(file_hash, 'clean')
+    if hit is not None:
+        df_clean, meta = hit
+        return df_clean, meta['rejections'], meta['profile']
+    df_clean, rejections = cleaned or DataCleaner.clean_data_with_report(df_raw)
+    df_clean, rejections = _dedup_stage(df_clean, rejections)
+    profile = DataProfiler.profile_frame(len(df_raw), df_clean, rejections)
+    StageCache.put(file_hash, 'clean', df_clean, {'rejections': rejections, 'profile': profile})
+    return df_clean, rejections, profile
+
+
+def _validate_stage(df_clean, csv_path: str, report: dict | None = None) -> dict:
+    # Validate dữ liệu clean trước khi load: null / kiểu / khoảng giá trị, đếm đủ mọi vi phạm trong 1 lượt
+    # report: truyền vào report đã gộp (chế độ streaming) để chỉ log + quyết định dừng
+    report = report or validate_dataframe(df_clean)
+    if not report['passed']:
+        log_validation_report(report, csv_path)
+        if VALIDATION_FAIL_ON_VIOLATION:
+            raise ValueError(f"Validation failed for {csv_path}: missing={report['missing_columns']}, "
+                             f"empty={report['empty']}, violations={report['violations']}")
+    return report
+
+
+# Hàm chạy trong process con nên phải để ở module level (pickle được)
+# Extract + clean 1 file rồi trả DataFrame về process cha để load, kèm thời gian từng bước và số liệu cache
+def _extract_and_clean(csv_path: str, csv_engine: str = DEFAULT_CSV_ENGINE):
+    cache_before = StageCache.stats()
+    start = time.perf_counter()
+    df_raw, file_hash = _extract_stage(csv_path, csv_engine)
+    extract_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df_clean, _, profile = _transform_stage(df_raw, file_hash)
+    transform_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    validation = _validate_stage(df_clean, csv_path)
+    timings = {'extract': extract_seconds, 'transform': transform_seconds, 'validate': time.perf_counter() - start}
+    cache_after = StageCache.stats()
+    cache_delta = {key: cache_after[key] - cache_before.get(key, 0) for key in cache_after}
+    return df_raw, df_clean, file_hash, profile, validation, timings, cache_delta
+
+
 class ETLPipeline:
     """Main ETL Pipeline orchestrator"""
-    
-    # Tạo hàm __init__ để khởi tạo pipeline với đường dẫn csv 
+
+    # Tạo hàm __init__ để khởi tạo pipeline với đường dẫn csv
     # Khi gọi tới class ETLPipeline thì sẽ phải truyền vào đường dẫn csv để pipeline biết được nguồn dữ liệu ở đâu
-    def __init__(self, csv_path: str):
+    # chunk_size: nếu truyền vào thì pipeline chạy ở chế độ streaming, mỗi chunk đi hết extract -> load clean rồi mới đọc chunk tiếp
+    # csv_path có thể là 1 file, 1 thư mục (lấy hết *.csv và *.csv.gz / .bz2 / .xz / .zst) hoặc 1 glob như 'archive/*_2024-*.csv'
+    # Nếu ra nhiều file thì chạy song song: extract + clean trên process pool, load trên các connection của pool DB
+    # profile_stage / profile_mode: bật cProfile hoặc tracemalloc cho đúng 1 stage (vd 'transform') khi cần soi kỹ
+    # csv_engine: engine parse CSV ('c' hoặc 'pyarrow'), chế độ streaming luôn dùng 'c'
+    # pipelined: chế độ streaming nhưng đọc / clean chunk sau song song với lúc ghi chunk trước vào DB
+    # (chunk_size không truyền thì dùng DEFAULT_CHUNK_SIZE)
+    # parse_workers: chạy 1 file (không streaming) thì parse + clean file đó song song trên bấy nhiêu process
+    # theo khoảng byte (ExtractorCSV.extract_parallel), None = parse tuần tự như cũ
+    # skip_stages: tên các stage không chạy (xem build_graph), stage cần output của chúng cũng bị skip theo
+    # vd chỉ làm report: ('extract',) với 1 file, ('files',) với streaming / nhiều file; chỉ load raw: ('transform',)
+    def __init__(self, csv_path: str, chunk_size: int | None = None, max_workers: int | None = None,
+                 profile_stage: str | None = None, profile_mode: str = 'cprofile',
+                 csv_engine: str = DEFAULT_CSV_ENGINE, pipelined: bool = False, parse_workers: int | None = None,
+                 skip_stages: tuple = ()):
         self.csv_path = csv_path
-    
+        self.skip_stages = tuple(skip_stages)
+        self.extra_stages = []
+        self.timeline = None
+        self.csv_engine = csv_engine
+        self.pipelined = pipelined
+        self.parse_workers = parse_workers
+        self.chunk_size = chunk_size or (DEFAULT_CHUNK_SIZE if pipelined else None)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.profile_stage = profile_stage
+        self.profile_mode = profile_mode
+        self.metrics = None
+        self.csv_paths = ETLPipeline._resolve_sources(csv_path)
+        if not self.csv_paths:
+            raise FileNotFoundError(f"No CSV files found for: {csv_path}")
+        if len(self.csv_paths) == 1:
+            self.csv_path = self.csv_paths[0]
+
+    @staticmethod
+    def _resolve_sources(source: str) -> list[str]:
+        path = Path(source)
+        if path.is_dir():
+            return sorted({str(p) for pattern in CSV_GLOB_PATTERNS for p in path.glob(pattern)})
+        if glob.has_magic(source):
+            return sorted(glob.glob(source))
+        return [source]
+
+    def build_graph(self) -> StageGraph:
+        # Pipeline là 1 DAG các stage (flow/dag.py), stage độc lập chạy song song:
+        # - 1 file: tạo bảng song song với extract, load raw song song với transform / validate / load clean
+        # - Streaming / nhiều file: stage 'files' tự chạy song song bên trong (chunk / process pool)
+        # Stage thêm bằng add_stage được nối vào sau, có thể dùng mọi output ở đây (vd 'report', 'file_reports')
+        graph = StageGraph()
+        graph.add(Stage('create_tables', self._create_tables_stage, outputs=('tables_ready',)))
+        if len(self.csv_paths) > 1 or self.chunk_size:
+            graph.add(Stage('files', self._files_stage, inputs=('tables_ready',), outputs=('file_reports',)))
+        else:
+            self._add_file_stages(graph)
+        graph.add(Stage('report', self._report_stage, inputs=('tables_ready',), optional=('file_reports',),
+                        outputs=('report',)))
+        for stage in self.extra_stages:
+            graph.add(stage)
+        return graph
+
+    def add_stage(self, stage: Stage) -> Stage:
+        # Thêm 1 stage vào DAG mà không sửa run, vd gửi report đi sau khi pipeline chạy xong:
+        # pipeline.add_stage(Stage('notify', lambda report: send(report), inputs=('report',)))
+        self.extra_stages.append(stage)
+        return stage
+
     def run(self):
         """Execute full ETL pipeline"""
+        # Mỗi stage được đo thời gian, số dòng vào/ra, rows/sec, peak RSS tăng thêm và số round trip DB
+        # Kết quả nằm trong report['metrics'] và file metrics/run_<run_id>.json
+        # Thời điểm bắt đầu / kết thúc từng stage + critical path nằm trong report['timeline']
+        # Các stage chạy song song nên số round trip DB của 1 stage có thể lẫn của stage chạy cùng lúc
+        self.metrics = RunMetrics(self.profile_stage, self.profile_mode)
+        cache_before = StageCache.stats()
         try:
             logger.info("=" * 60)
             logger.info("🚀 Starting ETL Pipeline")
             logger.info("=" * 60)
-            
-            # Step 1: Setup tables
-            logger.info("Step 1: Creating tables...")
-            DBLoader.create_raw_and_clean_table()
-            logger.info("✅ Tables ready")
-            
-            # Step 2: Extract
-            logger.info("Step 2: Extracting data...")
-            df_raw = ExtractorCSV.extract(self.csv_path)
-            logger.info(f"✅ Extracted {len(df_raw)} rows")
-            
-            # Step 3: Load raw
-            logger.info("Step 3: Loading raw data...")
-            DBLoader.load_to_raw_table(df_raw, self.csv_path, skip_if_exist=True)
-            logger.info("✅ Raw data loaded")
-            logger.info("=="*60)
-
-            # Step 4: Transform
-            logger.info("Step 4: Transforming data...")
-            df_clean = DataCleaner.clean_data(df_raw)
-            logger.info(f"✅ Cleaned to {len(df_clean)} rows")
-            logger.info("=="*60)
-            
-            # Step 5: Load clean
-            logger.info("Step 5: Loading clean data...")
-            DBLoader.load_to_clean_table(df_clean, self.csv_path, skip_if_exist=True)
-            logger.info("✅ Clean data loaded")
-            logger.info("=="*60)
-            
-            # Step 6: Generate report
-            logger.info("Step 6: Generating quality report...")
-            report = DataProfiler.generated_quantity_report()
+
+            values, self.timeline = self.build_graph().run(skip=self.skip_stages)
+
+            # Stage report bị skip thì report chỉ còn phần số liệu của lần chạy
+            report = values.get('report') or {}
+            file_reports = values.get('file_reports') or []
+            report['files'] = file_reports
+            report['files_failed'] = sum(1 for r in file_reports if r['status'] == 'failed')
+            cache_after = StageCache.stats()
+            report['stage_cache'] = {key: cache_after[key] - cache_before.get(key, 0) for key in cache_after}
+            report['db_pool'] = DBManager.pool_stats()
+            report['metrics'] = self.metrics.to_dict()
+            report['timeline'] = self.timeline
+            report['metrics_file'] = self.metrics.write_json({'files': file_reports,
+                                                              'stage_cache': report['stage_cache'],
+                                                              'db_pool': report['db_pool'],
+                                                              'timeline': self.timeline})
             logger.info("=" * 60)
 
             logger.info("✅ ETL Pipeline Completed Successfully!")
-            logger.info("=" * 60)
+            self._log_report(report)
+
+            return report
+
+        except Exception as e:
+            logger.exception(f"❌ ETL Pipeline failed: {e}")
+            raise
+
+    def _create_tables_stage(self):
+        # Step 1: Setup tables
+        logger.info("Step 1: Creating tables...")
+        with self.metrics.stage('create_tables'):
+            DBLoader.create_raw_and_clean_table()
+            DataProfiler.create_profile_table()
+        logger.info("✅ Tables ready")
+        return True
+
+    def _files_stage(self, tables_ready):
+        if len(self.csv_paths) > 1:
+            return self._run_parallel()
+        return [self._run_streaming()]
+
+    def _report_stage(self, tables_ready, file_reports):
+        # Step 6: Generate report
+        logger.info("Step 6: Generating quality report...")
+        with self.metrics.stage('report'):
+            return DataProfiler.generated_quantity_report()
+
+    @staticmethod
+    def _already_loaded(csv_path: str) -> bool:
+        # File không đổi (hash có sẵn trong cache fingerprint) và manifest ghi nhận đã load đủ raw + clean
+        # thì bỏ qua luôn extract / clean / load: chỉ tốn 1 lần stat file + 1 query theo primary key
+        cached_hash = FingerprintCache.get(csv_path)
+        return bool(cached_hash) and DBLoader.is_file_loaded(csv_path, cached_hash)
+
+    @staticmethod
+    def _skipped_report(csv_path: str) -> dict:
+        return {'src_file': csv_path, 'status': 'skipped', 'raw_rows': 0, 'clean_rows': 0}
+
+    def _add_file_stages(self, graph: StageGraph):
+        # Step 2-5 cho 1 file (không streaming), mỗi bước là 1 stage:
+        # extract -> load_raw
+        #         -> transform -> validate -> load_clean
+        # file_report gom kết quả, thiếu phần nào (stage bị skip) thì phần đó là 0
+        # Skip 'extract' = chỉ làm report, skip 'transform' = chỉ load raw
+        extract_inputs = ()
+        if FingerprintCache.get(self.csv_path):
+            # Hash có trong cache thì phải hỏi manifest (cần bảng đã tạo) trước khi extract
+            # File mới / đã đổi thì không cần hỏi, extract chạy song song với tạo bảng
+            graph.add(Stage('check_loaded', self._check_loaded_stage, inputs=('tables_ready',),
+                            outputs=('pending',)))
+            extract_inputs = ('pending',)
+        graph.add(Stage('extract', self._full_extract_stage, inputs=extract_inputs,
+                        outputs=('df_raw', 'file_hash', 'cleaned')))
+        graph.add(Stage('load_raw', self._load_raw_stage, inputs=('tables_ready', 'df_raw', 'file_hash'),
+                        outputs=('raw_stats',)))
+        graph.add(Stage('transform', self._full_transform_stage, inputs=('df_raw', 'file_hash', 'cleaned'),
+                        outputs=('df_clean', 'profile')))
+        graph.add(Stage('validate', self._full_validate_stage, inputs=('df_clean',), outputs=('validation',)))
+        graph.add(Stage('load_clean', self._load_clean_stage,
+                        inputs=('tables_ready', 'df_clean', 'file_hash', 'profile', 'validation'),
+                        outputs=('clean_stats',)))
+        graph.add(Stage('file_report', self._file_report_stage,
+                        optional=('df_raw', 'raw_stats', 'df_clean', 'clean_stats', 'profile', 'validation'),
+                        outputs=('file_reports',)))
+
+    def _check_loaded_stage(self, tables_ready):
+        if ETLPipeline._already_loaded(self.csv_path):
+            logger.info(f"✅ {self.csv_path} unchanged since last load, skipping")
+            return SKIPPED
+        return True
+
+    def _full_extract_stage(self, pending=None):
+        # Step 2: Extract
+        logger.info("Step 2: Extracting data...")
+        # Hash được tính trong cùng lần đọc file với pandas, dùng lại cho cả 2 bước load
+        # Rerun trên file không đổi thì lấy luôn từ stage cache
+        # parse_workers: bước clean cũng chạy luôn trong các worker parse, thời gian nằm trong stage extract
+        cleaned = None
+        with self.metrics.stage('extract') as stage:
+            if self.parse_workers:
+                df_raw, file_hash, cleaned = _parallel_extract_stage(self.csv_path, self.parse_workers,
+                                                                     self.csv_engine)
+            else:
+                df_raw, file_hash = _extract_stage(self.csv_path, self.csv_engine)
+            stage['rows_out'] = len(df_raw)
+        logger.info(f"✅ Extracted {len(df_raw)} rows")
+        return df_raw, file_hash, cleaned
+
+    def _load_raw_stage(self, tables_ready, df_raw, file_hash: str):
+        # Step 3: Load raw
+        logger.info("Step 3: Loading raw data...")
+        with self.metrics.stage('load_raw', rows_in=len(df_raw)):
+            raw_stats = DBLoader.load_to_raw_table(df_raw, self.csv_path, skip_if_exist=True, file_hash=file_hash)
+        logger.info("✅ Raw data loaded")
+        return raw_stats
+
+    def _full_transform_stage(self, df_raw, file_hash: str, cleaned):
+        # Step 4: Transform
+        logger.info("Step 4: Transforming data...")
+        # Profile của file được tính luôn ở đây, không phải quét lại warehouse ở bước report
+        with self.metrics.stage('transform', rows_in=len(df_raw)) as stage:
+            df_clean, _, profile = _transform_stage(df_raw, file_hash, cleaned)
+            stage['rows_out'] = len(df_clean)
+        logger.info(f"✅ Cleaned to {len(df_clean)} rows")
+        return df_clean, profile
+
+    def _full_validate_stage(self, df_clean):
+        # Validate dữ liệu clean, có vi phạm thì dừng trước khi load bảng clean
+        with self.metrics.stage('validate', rows_in=len(df_clean)):
+            validation = _validate_stage(df_clean, self.csv_path)
+        logger.info(f"✅ Validated {validation['checked_rows']} rows")
+        return validation
+
+    def _load_clean_stage(self, tables_ready, df_clean, file_hash: str, profile: dict, validation: dict):
+        # Step 5: Load clean
+        logger.info("Step 5: Loading clean data...")
+        # Profile được lưu cùng transaction, dòng đã có trong warehouse từ file khác bị bỏ lúc load
+        # thì profile được tính lại trên các dòng đã ghi (nằm trong clean_stats['profile'])
+        with self.metrics.stage('load_clean', rows_in=len(df_clean)):
+            clean_stats = DBLoader.load_to_clean_table(df_clean, self.csv_path, skip_if_exist=True,
+                                                       file_hash=file_hash, profile=profile)
+        logger.info("✅ Clean data loaded")
+        return clean_stats
+
+    def _file_report_stage(self, df_raw, raw_stats, df_clean, clean_stats, profile, validation) -> list[dict]:
+        if df_raw is None:
+            # File đã load rồi (check_loaded) hoặc extract bị skip
+            return [ETLPipeline._skipped_report(self.csv_path)]
+        logger.info("=="*60)
+        # Số dòng inserted / deleted / unchanged của từng bảng, bảng đã load rồi (bỏ qua) thì không có
+        if clean_stats and 'profile' in clean_stats:
+            clean_stats = dict(clean_stats)
+            profile = clean_stats.pop('profile')
+        tables = {table: stats for table, stats in ((TABLE_RAW, raw_stats), (TABLE_CLEAN, clean_stats)) if stats}
+        clean_rows = clean_stats['rows'] if clean_stats else (len(df_clean) if df_clean is not None else 0)
+        file_report = {'src_file': self.csv_path, 'status': 'loaded', 'raw_rows': len(df_raw),
+                       'clean_rows': clean_rows, 'tables': tables}
+        if validation is not None:
+            file_report['validation'] = validation
+        if profile is not None:
+            file_report['profile'] = DataProfiler.summarize(profile)
+        return [file_report]
+
+    def _run_streaming(self):
+        # Step 2-5 chạy theo từng chunk: extract -> load raw -> transform -> load clean
+        # Các chunk được ghi vào bảng staging (mỗi chunk 1 transaction), hết file mới publish sang bảng đích
+        # trong 1 transaction duy nhất, nên người đọc không bao giờ thấy file load dở và nội dung bảng
+        # sau khi chạy giống hệt chế độ đọc cả file
+        # Hash lấy từ cache fingerprint (file không đổi thì không đọc thêm lần nào), file thường chưa có trong cache
+        # thì hash trước (mmap, không parse) để biết file đã load chưa trước khi stream
+        # File nén chưa có trong cache: hash được tính ngay trong lần giải nén để parse (chỉ giải nén 1 lượt),
+        # chưa biết hash thì stage cả raw + clean, tới lúc publish mới so với manifest để skip / reload
+        # CHECKPOINTED_LOADS: mỗi chunk commit cùng 1 dòng checkpoint, lỗi giữa chừng thì giữ staging + checkpoint,
+        # lần chạy sau với cùng hash file đọc tiếp từ chunk sau chunk cuối đã commit (src/load/checkpoint.py)
+        mode = 'pipelined' if self.pipelined else 'streaming'
+        logger.info(f"Step 2-5: {mode.capitalize()} data in chunks of {self.chunk_size} rows...")
+        file_hash = FingerprintCache.get(self.csv_path)
+        hash_result = None
+        states = None
+        if file_hash is None and detect_compression(self.csv_path) is not None:
+            # Hash tạm cho checkpoint / cột file_hash của staging raw, hash thật có sau khi stream hết file
+            hash_result = {}
+            file_hash = LoadCheckpoint.pending_hash(self.csv_path)
+            tables = [TABLE_RAW, TABLE_CLEAN]
+        else:
+            file_hash = file_hash or cal_hash_file(self.csv_path)
+            states = {table: DBLoader.load_state(self.csv_path, table, file_hash, skip_if_exist=True)
+                      for table in (TABLE_RAW, TABLE_CLEAN)}
+            if all(state == 'skip' for state in states.values()):
+                logger.info("✅ File already loaded, nothing to stream")
+                return ETLPipeline._skipped_report(self.csv_path)
+            tables = [table for table, state in states.items() if state != 'skip']
+            # Chỉ ghi status khi đã biết bảng nào cần load: file nén chưa có hash thì có thể skip lúc publish
+            DBLoader.start_manifest(self.csv_path, tables)
+        resume = None
+        if CHECKPOINTED_LOADS:
+            resume = LoadCheckpoint.resume_point(
+                self.csv_path, file_hash, {table: DBLoader.create_staging(self.csv_path, table, keep=True)
+                                           for table in tables})
+            if resume is None:
+                LoadCheckpoint.clear(None, self.csv_path)
+        stagings = {}
+        try:
+            for table in tables:
+                stagings[table] = DBLoader.create_staging(self.csv_path, table, keep=resume is not None)
+            if self.pipelined:
+                counts = self._stream_pipelined(file_hash, stagings, resume, hash_result)
+            else:
+                counts = self._stream_chunks(file_hash, stagings, self._write_staged, resume, hash_result)
+            if hash_result is not None:
+                file_hash = hash_result['digest']
+            file_report = self._publish_stream(file_hash, stagings, states, *counts)
+            if resume:
+                file_report['resumed_chunks'] = resume['index']
+            stagings = {}
+        except BaseException:
+            # BaseException: cả khi bị ngắt (KeyboardInterrupt, SystemExit) cũng phải giữ staging,
+            # nếu không finally sẽ xoá staging và lần chạy sau mất hết các chunk đã commit
+            if states is not None:
+                DBLoader.fail_manifest(self.csv_path, tables)
+            if CHECKPOINTED_LOADS and stagings:
+                # Giữ staging + checkpoint của các chunk đã commit để lần chạy sau đọc tiếp
+                logger.warning(f"Streaming {self.csv_path} failed, committed chunks kept for resume")
+                stagings = {}
+            raise
+        finally:
+            # Lỗi giữa chừng: bảng đích chưa bị đụng tới, chỉ cần dọn staging
+            for staging in stagings.values():
+                DBLoader.drop_staging(staging)
+        return file_report
+
+    def _write_staged(self, frames: list, checkpoint: dict | None):
+        # frames: [(staging, frame, tên stage)] của 1 chunk, ghi chung 1 transaction với dòng checkpoint của chunk
+        # Preset 'bulk_load' giống DBLoader.write_staging: staging chưa publish nên không cần chờ flush WAL
+        with DBManager.get_cursor(preset='bulk_load') as cur:
+            for staging, frame, stage_name in frames:
+                with self.metrics.stage(stage_name, rows_in=len(frame)):
+                    DBLoader.write_frame(cur, frame, staging)
+            if checkpoint is not None:
+                LoadCheckpoint.record(cur, self.csv_path, **checkpoint)
+
+    def _stream_chunks(self, file_hash: str, stagings: dict, write, resume: dict | None = None,
+                       hash_result: dict | None = None) -> tuple[int, int, list, list]:
+        # Đọc + clean + validate từng chunk và dựng frame đúng cột của bảng
+        # write(frames, checkpoint) ghi mọi frame của 1 chunk (xem _write_staged)
+        # resume: chỗ đọc tiếp + số liệu các chunk đã commit ở lần chạy trước (LoadCheckpoint.resume_point)
+        # hash_result: hash file tính trong lúc đọc (ExtractorCSV.extract_chunk_ranges), file_hash lúc này là hash tạm
+        # Trả về (số dòng raw, số dòng clean, profile của từng chunk, report validate của từng chunk)
+        resume = resume or {}
+        raw_rows, clean_rows = resume.get('raw_rows', 0), resume.get('clean_rows', 0)
+        chunk_profiles, chunk_validations = list(resume.get('profiles', [])), list(resume.get('validations', []))
+        chunks = ExtractorCSV.extract_chunk_ranges(self.csv_path, self.chunk_size, resume.get('offset', 0),
+                                                   resume.get('index', 0), resume.get('row', 0), hash_result)
+        while True:
+            # Đo riêng thời gian đọc từng chunk, số liệu của các chunk được cộng dồn vào cùng 1 stage
+            with self.metrics.stage('extract') as stage:
+                df_chunk, position = next(chunks, (None, None))
+                stage['rows_out'] = 0 if df_chunk is None else len(df_chunk)
+            if df_chunk is None:
+                break
+
+            frames = []
+            checkpoint = {'file_hash': file_hash, 'tables': list(stagings), 'position': position,
+                          'raw_rows': len(df_chunk), 'clean_rows': 0}
+            if TABLE_RAW in stagings:
+                frames.append((stagings[TABLE_RAW], DBLoader.prepare_raw_frame(df_chunk, self.csv_path, file_hash),
+                               'load_raw'))
+            raw_rows += len(df_chunk)
+
+            if TABLE_CLEAN in stagings:
+                with self.metrics.stage('transform', rows_in=len(df_chunk)) as stage:
+                    df_clean, rejections = DataCleaner.clean_data_with_report(df_chunk)
+                    df_clean, rejections = _dedup_stage(df_clean, rejections)
+                    stage['rows_out'] = len(df_clean)
+                if len(df_clean):
+                    # Chunk rỗng sau clean không phải lỗi, chỉ cả file rỗng mới là lỗi (kiểm tra ở cuối)
+                    with self.metrics.stage('validate', rows_in=len(df_clean)):
+                        checkpoint['validation'] = _validate_stage(df_clean, self.csv_path)
+                    chunk_validations.append(checkpoint['validation'])
+                with self.metrics.stage('dedup', rows_in=len(df_clean)) as stage:
+                    # Bỏ listing đã có trong warehouse từ file khác, 1 query cho cả chunk
+                    frame = DBLoader.prepare_clean_frame(df_clean, self.csv_path)
+                    frame, seen = Deduplicator.drop_seen(None, self.csv_path, frame)
+                    if seen:
+                        rejections = dict(rejections, **{IN_WAREHOUSE: seen})
+                    # Frame đã đúng cột bảng clean nên tính profile luôn trên frame sau dedup
+                    checkpoint['profile'] = DataProfiler.profile_frame(len(df_chunk), frame, rejections)
+                    chunk_profiles.append(checkpoint['profile'])
+                    stage['rows_out'] = len(frame)
+                frames.append((stagings[TABLE_CLEAN], frame, 'load_clean'))
+                checkpoint['clean_rows'] = len(frame)
+                clean_rows += len(frame)
+            write(frames, checkpoint if CHECKPOINTED_LOADS else None)
+            logger.info(f"Chunk {position['index']}: {len(df_chunk)} raw rows staged")
+        if TABLE_CLEAN in stagings:
+            # Từng chunk đã qua validate, chỉ còn kiểm tra cả file có rỗng không
+            _validate_stage(None, self.csv_path, merge_validation_reports(chunk_validations))
+        return raw_rows, clean_rows, chunk_profiles, chunk_validations
+
+    def _stream_pipelined(self, file_hash: str, stagings: dict, resume: dict | None = None,
+                          hash_result: dict | None = None) -> tuple[int, int, list, list]:
+        # Producer / consumer: thread hiện tại đọc + clean + dựng frame (phần nặng GIL),
+        # 1 thread loader chỉ COPY frame vào staging (psycopg2 nhả GIL khi chờ Postgres)
+        # nên chunk N+1 được đọc / clean trong lúc chunk N đang được ghi
+        # Hàng đợi giới hạn PIPELINE_QUEUE_SIZE: loader chậm thì producer phải chờ, RAM không phình
+        # Lỗi ở bất kỳ phía nào cũng dừng phía còn lại, đợi loader thoát hẳn rồi raise lỗi đầu tiên
+        # 1 thread loader ghi lần lượt nên các chunk (và checkpoint) luôn được commit đúng thứ tự
+        work = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        errors = []
+
+        def loader():
+            try:
+                while True:
+                    try:
+                        item = work.get(timeout=0.5)
+                    except queue.Empty:
+                        if stop.is_set():
+                            return
+                        continue
+                    # None: producer đã đọc hết file; stop: producer lỗi, bỏ các chunk còn lại
+                    if item is None or stop.is_set():
+                        return
+                    self._write_staged(*item)
+            except BaseException as e:
+                # Cả khi bị ngắt cũng phải báo cho producer, nếu không producer chờ hàng đợi mãi
+                logger.exception(f"Loader thread failed: {e}")
+                errors.append(e)
+                stop.set()
+
+        def put(item):
+            # Loader đã chết thì không chờ hàng đợi nữa, báo lỗi để producer dừng
+            while not stop.is_set():
+                try:
+                    work.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            raise RuntimeError("Loader thread stopped")
+
+        thread = threading.Thread(target=loader, name='etl-loader', daemon=True)
+        thread.start()
+        try:
+            counts = self._stream_chunks(file_hash, stagings, lambda *item: put(item), resume, hash_result)
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            # Sentinel báo loader thoát sau khi ghi hết các chunk còn trong hàng đợi
+            if not stop.is_set():
+                put(None)
+            thread.join()
+            if errors:
+                raise errors[0]
+        return counts
+
+    def _publish_stream(self, file_hash: str, stagings: dict, states: dict | None,
+                        raw_rows: int, clean_rows: int, chunk_profiles: list, chunk_validations: list) -> dict:
+        # Publish raw + clean + profile trong cùng 1 transaction, chỉ khi mọi chunk đã ghi xong
+        # states: {bảng: 'new' / 'reload'} đã biết trước khi stream; None khi hash chỉ có sau khi stream hết file
+        # (file nén mới): lúc này mới so hash với manifest, bảng đã load đúng phiên bản này thì bỏ staging của nó
+        file_report = {'src_file': self.csv_path, 'status': 'loaded', 'raw_rows': raw_rows, 'clean_rows': clean_rows}
+        with self.metrics.stage('publish', rows_in=raw_rows + clean_rows):
+            with DBManager.get_cursor() as cur:
+                if states is None:
+                    states = {table: DBLoader.load_state(self.csv_path, table, file_hash, True, cur)
+                              for table in stagings}
+                    for table, state in states.items():
+                        if state == 'skip':
+                            cur.execute(f"DROP TABLE {stagings[table]};")
+                    if TABLE_RAW in stagings and states[TABLE_RAW] != 'skip':
+                        DBLoader.set_staging_hash(cur, stagings[TABLE_RAW], file_hash)
+                if all(state == 'skip' for state in states.values()):
+                    # File nén bị đổi stat (copy / touch) nhưng nội dung đã load: không publish gì
+                    file_report = ETLPipeline._skipped_report(self.csv_path)
+                if states.get(TABLE_RAW, 'skip') != 'skip':
+                    DBLoader.publish_staging(self.csv_path, TABLE_RAW, stagings[TABLE_RAW], file_hash, raw_rows,
+                                             states[TABLE_RAW] == 'reload', cur)
+                if states.get(TABLE_CLEAN, 'skip') != 'skip':
+                    # Dòng trùng giữa các chunk / bị file khác claim trong lúc ghi staging bị bỏ lúc publish
+                    duplicates = DBLoader.publish_staging(self.csv_path, TABLE_CLEAN, stagings[TABLE_CLEAN],
+                                                          file_hash, clean_rows, states[TABLE_CLEAN] == 'reload', cur)
+                    clean_rows -= sum(duplicates.values())
+                    file_report['clean_rows'] = clean_rows
+                    # Gộp profile của các chunk thành profile của cả file (median lúc này là xấp xỉ theo histogram)
+                    # Dòng bị bỏ lúc publish thì profile được tính lại trên các dòng đã publish
+                    profile = DataProfiler.merge_profiles(chunk_profiles)
+                    profile = Deduplicator.final_profile(cur, self.csv_path, profile, duplicates)
+                    DataProfiler.save_file_profile(self.csv_path, file_hash, profile, cur)
+                    file_report['profile'] = DataProfiler.summarize(profile)
+                    file_report['validation'] = merge_validation_reports(chunk_validations)
+                if CHECKPOINTED_LOADS:
+                    # File đã publish thì checkpoint hết tác dụng, xoá cùng transaction
+                    LoadCheckpoint.clear(cur, self.csv_path)
+
+        if file_report['status'] == 'skipped':
+            logger.info("✅ File already loaded (hash checked after streaming), staging dropped")
+        else:
+            logger.info(f"✅ Streamed {raw_rows} raw rows, {clean_rows} clean rows")
+        logger.info("=="*60)
+        return file_report
+
+    def _run_parallel(self) -> list[dict]:
+        # Step 2-5 cho nhiều file: extract + clean chạy song song trên process pool (CPU-bound)
+        # File nào extract xong thì đẩy sang thread pool để load, mỗi file commit trong transaction riêng
+        # 1 file lỗi chỉ được ghi nhận status 'failed' trong report, các file khác vẫn chạy tiếp
+        file_reports = []
+        paths = []
+        for path in self.csv_paths:
+            if ETLPipeline._already_loaded(path):
+                file_reports.append(ETLPipeline._skipped_report(path))
+            else:
+                paths.append(path)
+        if not paths:
+            logger.info("✅ All files unchanged since last load, skipping")
+            return file_reports
+        logger.info(f"Step 2-5: Processing {len(paths)} files with {self.max_workers} workers...")
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, len(paths))) as process_pool, \
+                ThreadPoolExecutor(max_workers=min(PARALLEL_LOAD_WORKERS, len(paths))) as load_pool:
+            extract_futures = {process_pool.submit(_extract_and_clean, p, self.csv_engine): p for p in paths}
+            load_futures = {}
+            for future in as_completed(extract_futures):
+                path = extract_futures[future]
+                try:
+                    df_raw, df_clean, file_hash, profile, validation, timings, cache_delta = future.result()
+                except Exception as e:
+                    logger.error(f"❌ Extract/clean failed for {path}: {e}")
+                    file_reports.append(ETLPipeline._failed_report(path, e))
+                    continue
+                StageCache.merge_stats(cache_delta)
+                # Thời gian extract / transform đo trong process con là tổng CPU-time của các worker, không phải wall time
+                self.metrics.add('extract', timings['extract'], rows_out=len(df_raw))
+                self.metrics.add('transform', timings['transform'], rows_in=len(df_raw), rows_out=len(df_clean))
+                self.metrics.add('validate', timings['validate'], rows_in=len(df_clean))
+                load_futures[load_pool.submit(self._load_file, df_raw, df_clean, path, file_hash, profile,
+                                              validation)] = path
+
+            for future in as_completed(load_futures):
+                path = load_futures[future]
+                try:
+                    file_reports.append(future.result())
+                except Exception as e:
+                    logger.error(f"❌ Load failed for {path}: {e}")
+                    file_reports.append(ETLPipeline._failed_report(path, e))
+
+        file_reports.sort(key=lambda r: r['src_file'])
+        loaded = sum(1 for r in file_reports if r['status'] != 'failed')
+        logger.info(f"✅ {loaded}/{len(file_reports)} files processed successfully")
+        logger.info("=="*60)
+        return file_reports
+
+    def _load_file(self, df_raw, df_clean, csv_path: str, file_hash: str, profile: dict, validation: dict) -> dict:
+        # Chạy trong thread load, raw + clean của 1 file đo chung 1 stage 'load'
+        with self.metrics.stage('load', rows_in=len(df_raw) + len(df_clean)):
+            file_report = DBLoader.load_file(df_raw, df_clean, csv_path, file_hash, profile=profile)
+        file_report['validation'] = validation
+        return file_report
+
+    @staticmethod
+    def _failed_report(csv_path: str, error: Exception) -> dict:
+        return {'src_file': csv_path, 'status': 'failed', 'raw_rows': 0, 'clean_rows': 0, 'error': str(error)}
+
+    @staticmethod
+    def _log_report(report: dict):
+        logger.info("=" * 60)
+        if 'raw_record' in report:
+            # Không có khi stage report bị skip
             logger.info("📈 Quality Report:")
             logger.info(f"  Raw Records: {report['raw_record']}")
             logger.info(f"  Clean Records: {report['clean_record']}")
@@ -63,10 +661,36 @@ class ETLPipeline:
             logger.info(f"  Drop Rate: {report['drop_rate']:.2f}%")
             logger.info(f"  Unique Models: {report['unique_model']}")
             logger.info(f"  Price Range: ${report['price_stat']['min']:,} - ${report['price_stat']['max']:,}")
-            logger.info("=" * 60)
-            
-            return report
-            
-        except Exception as e:
-            logger.exception(f"❌ ETL Pipeline failed: {e}")
-            raise
\ No newline at end of file
+        duplicates = {rule: count for rule, count in (report.get('rejections') or {}).items() if rule in (IN_FILE, IN_WAREHOUSE)}
+        if duplicates:
+            logger.info(f"  Duplicates Skipped: {duplicates}")
+        if len(report['files']) > 1:
+            logger.info(f"  Files: {len(report['files'])} ({report['files_failed']} failed)")
+            for file_report in report['files']:
+                logger.info(f"    {file_report['src_file']}: {file_report['status']} "
+                            f"(raw={file_report['raw_rows']}, clean={file_report['clean_rows']})")
+        for file_report in report['files']:
+            for table, stats in file_report.get('tables', {}).items():
+                if stats['mode'] == 'delta':
+                    logger.info(f"  Delta {file_report['src_file']} -> {table}: {stats['inserted']} inserted, "
+                                f"{stats['deleted']} deleted, {stats['unchanged']} unchanged")
+        cache = report['stage_cache']
+        logger.info(f"  Stage Cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions")
+        db_pool = report['db_pool']
+        logger.info(f"  DB Pool: {db_pool['checkouts']} checkouts, avg wait {db_pool['avg_wait_ms']}ms, "
+                    f"max wait {db_pool['max_wait_seconds']}s, peak in use {db_pool['peak_in_use']}/{db_pool['maxconn']}")
+        logger.info("⏱️ Stage Timings:")
+        for name, stage in report['metrics']['stages'].items():
+            logger.info(f"  {name}: {stage['seconds']:.3f}s, rows/sec={stage['rows_per_sec']}, "
+                        f"db_round_trips={stage['db_round_trips']}, rss_delta_kb={stage['rss_delta_kb']}, "
+                        f"peak_rss_delta_kb={stage['peak_rss_delta_kb']}")
+        timeline = report['timeline']
+        logger.info(f"🧭 Stage Timeline (wall {timeline['wall_seconds']:.3f}s):")
+        for record in timeline['stages']:
+            if record['start'] is None:
+                logger.info(f"  {record['stage']}: {record['status']} ({record['reason']})")
+            else:
+                logger.info(f"  {record['stage']}: {record['start']:.3f}s -> {record['end']:.3f}s "
+                            f"({record['seconds']:.3f}s, {record['status']})")
+        logger.info(f"  Critical Path: {' -> '.join(timeline['critical_path'])}")
+        logger.info("=" * 60)
@@ -1,27 +1,224 @@
+import hashlib as hl
+import io
+import mmap
+import os
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
+from typing import Iterator
 from config.log_config import logger_config
 from src.transform.validate import cal_hash_file, check_data_exist, check_validate_csv, check_validate_dataframe
-from config.constants import TABLE_RAW, TABLE_CLEAN, DATA_TYPES, REQUIRED_COLUMNS, COLUMNS_MAPPING
+from src.transform.cleaner import DataCleaner
+from src.utils.fingerprint import FingerprintCache, hashing_open, file_fingerprint
+from src.utils.compressed_io import detect_compression, open_decompressed
+from config.constants import (TABLE_RAW, TABLE_CLEAN, DATA_TYPES, REQUIRED_COLUMNS, COLUMNS_MAPPING, DEFAULT_CHUNK_SIZE,
+                              CSV_DTYPES, CSV_PARSER_ENGINES, DEFAULT_CSV_ENGINE, HASH_ALGORITHM, HASH_READ_BUFFER,
+                              PARALLEL_PARSE_MIN_BYTES, PARALLEL_PARSE_RANGES_PER_WORKER)
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow là optional, không có thì extract_parallel chạy tuần tự
+    pa = None
 
 logger = logger_config('src.extract.csv_extractor')
 
+# Cột tạm giữ index gốc (trong khoảng byte) của các dòng clean khi đi qua Arrow
+_ROW_COLUMN = '__row__'
+
+
+class _RangeReader(io.RawIOBase):
+    # Đọc nối tiếp nhiều khoảng byte của file đã mmap như 1 file liền (dòng header + 1 khoảng dữ liệu)
+    def __init__(self, mm, segments: list[tuple[int, int]]):
+        self._mm = mm
+        self._segments = list(segments)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._segments:
+            start, end = self._segments[0]
+            if start >= end:
+                self._segments.pop(0)
+                continue
+            n = min(len(buffer), end - start)
+            buffer[:n] = self._mm[start:start + n]
+            self._segments[0] = (start + n, end)
+            return n
+        return 0
+
+
+def _write_ipc(table, buf):
+    # Ghi table vào buf dạng Arrow IPC stream trong scope riêng: writer / sink / py_buffer đều giữ export
+    # của memoryview, ra khỏi hàm là được giải phóng hết thì shm.close() mới không báo BufferError
+    sink = pa.FixedSizeBufferWriter(pa.py_buffer(buf))
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    sink.close()
+
+
+def _to_shared(df: pd.DataFrame) -> tuple[str, int]:
+    # Ghi DataFrame vào 1 vùng shared memory dạng Arrow IPC stream, trả về (tên vùng nhớ, số byte)
+    # Process cha đọc thẳng từ vùng nhớ này thay vì nhận DataFrame pickle qua pipe
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, table.schema) as writer:
+        writer.write_table(table)
+    size = mock.size()
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1), track=False)
+    except TypeError:
+        # Python < 3.13 chưa có track=False: process cha sở hữu và unlink vùng nhớ, không để resource tracker
+        # của worker dọn mất
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    try:
+        _write_ipc(table, shm.buf)
+    finally:
+        shm.close()
+    return shm.name, size
+
+
+def _take_shared(name: str, size: int) -> pd.DataFrame:
+    # Đọc DataFrame từ vùng shared memory rồi giải phóng vùng nhớ đó
+    # Copy bytes ra khỏi vùng nhớ 1 lần (memcpy) trước khi dựng DataFrame: DataFrame zero-copy sẽ trỏ thẳng
+    # vào vùng nhớ và giữ export của shm.buf, vùng nhớ không close được
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        with shm.buf[:size] as view:
+            data = view.tobytes()
+    finally:
+        _release_shared(shm)
+    return pa.ipc.open_stream(pa.py_buffer(data)).read_all().to_pandas()
+
+
+def _release_shared(shm):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _discard_shared(name: str):
+    # Dọn vùng nhớ của worker khi không đọc tới (1 khoảng khác bị lỗi)
+    try:
+        _release_shared(shared_memory.SharedMemory(name=name))
+    except FileNotFoundError:
+        pass
+
+
+# Hàm chạy trong process con nên phải để ở module level (pickle được)
+# Parse + clean 1 khoảng byte [start, end) của file, dòng header được đọc lại từ đầu file
+def _parse_range(csv_path: str, start: int, end: int, engine: str) -> dict:
+    with open(csv_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        segments = [(0, mm.find(b'\n') + 1), (start, end)]
+        tolerant = False
+        try:
+            df = pd.read_csv(io.BufferedReader(_RangeReader(mm, segments), buffer_size=HASH_READ_BUFFER),
+                             **ExtractorCSV._read_options(csv_path, engine))
+        except (ValueError, TypeError):
+            # Khoảng này có giá trị bẩn trong cột số: đọc lại, cột số ép kiểu sau giống extract tuần tự
+            tolerant = True
+            df = pd.read_csv(io.BufferedReader(_RangeReader(mm, segments), buffer_size=HASH_READ_BUFFER),
+                             **ExtractorCSV._read_options(csv_path, engine, pin_numeric=False))
+    df.columns = df.columns.str.strip()
+    if tolerant:
+        df = ExtractorCSV._coerce_numeric(df)
+    df_clean, rejections = DataCleaner.clean_data_with_report(df)
+    df_clean = df_clean.assign(**{_ROW_COLUMN: df_clean.index.to_numpy(dtype='int64')})
+    return {'raw': _to_shared(df), 'clean': _to_shared(df_clean), 'rows': len(df),
+            'rejections': rejections, 'tolerant': tolerant}
+
 # Đây là nơi sẽ chứa các hàm để trích xuất dữ liệu từ file CSV
 # Từ file CSV, ta sẽ đọc dữ liệu vào DataFrame của pandas
+# Việc đọc được điều khiển bởi schema CSV_DTYPES trong config/constants.py: chỉ đọc các cột cần thiết (usecols),
+# text đọc thành category, số đọc thẳng thành kiểu hẹp (Int16 / Int32 / float32) nên không cần ép kiểu lại ở cleaner
+# File nén (.csv.gz / .bz2 / .xz / .zst) được giải nén theo kiểu streaming ngay trong lúc parse (src/utils/compressed_io.py)
 class ExtractorCSV:
 
+    @staticmethod
+    def _header(csv_path: str) -> pd.Index:
+        # Chỉ đọc dòng header, file nén thì chỉ giải nén block đầu tiên
+        with open_decompressed(csv_path) as stream:
+            return pd.read_csv(stream, nrows=0).columns
+
+    @staticmethod
+    def _read_options(csv_path: str, engine: str, pin_numeric: bool = True, header: pd.Index | None = None) -> dict:
+        # Đọc dòng header để map tên cột đã strip -> tên cột gốc trong file (file thật có thể có khoảng trắng)
+        # header: các cột đã đọc sẵn (vd chế độ streaming đọc dòng header từ stream đang mở), không mở lại file
+        if engine not in CSV_PARSER_ENGINES:
+            raise ValueError(f"Invalid CSV engine: {engine}. Expected one of {CSV_PARSER_ENGINES}")
+        if header is None:
+            header = ExtractorCSV._header(csv_path)
+        names = {str(col).strip(): col for col in header}
+        if not REQUIRED_COLUMNS <= names.keys():
+            # Thiếu cột thì không pin schema, để bước validate báo lỗi như cũ
+            return {'engine': engine}
+        dtype = {names[col]: t for col, t in CSV_DTYPES.items()
+                 if pin_numeric or t == 'category'}
+        return {'engine': engine, 'usecols': [names[col] for col in CSV_DTYPES], 'dtype': dtype}
+
+    @staticmethod
+    def _coerce_numeric(df: pd.DataFrame) -> pd.DataFrame:
+        # Dùng khi file có giá trị không phải số trong cột số (parse theo schema bị lỗi):
+        # giá trị bẩn -> NA, rồi thu về đúng kiểu hẹp trong schema nếu chứa được
+        for col, dtype in CSV_DTYPES.items():
+            if dtype == 'category' or col not in df.columns:
+                continue
+            values = pd.to_numeric(df[col], errors='coerce')
+            try:
+                df[col] = values.astype(dtype)
+            except (ValueError, TypeError, OverflowError):
+                df[col] = values
+        return df
+
+    @staticmethod
+    def _read_csv(source, csv_path: str, engine: str) -> pd.DataFrame:
+        # source: đường dẫn file hoặc stream đã mở (stream hash / stream giải nén)
+        try:
+            return pd.read_csv(source, **ExtractorCSV._read_options(csv_path, engine))
+        except (ValueError, TypeError) as e:
+            # Giá trị bẩn trong cột số làm parse theo schema thất bại -> đọc lại, cột số ép kiểu sau
+            logger.warning(f"Typed parse failed for {csv_path} ({e}). Re-reading with tolerant numeric columns.")
+            with open_decompressed(csv_path) as stream:
+                df = pd.read_csv(stream, **ExtractorCSV._read_options(csv_path, engine, pin_numeric=False))
+            df.columns = df.columns.str.strip()
+            return ExtractorCSV._coerce_numeric(df)
+
     @staticmethod
     # Đây là phương thức tĩnh, không cần tham số self hoặc cls
     # Có nghĩa là ta có thể gọi trực tiếp phương thức này từ class mà không cần tạo instance của class
     # Ví dụ: ExtractorCSV.load_csv('path/to/csv')
-    def extract(csv_path:str) -> pd.DataFrame:
+    def extract(csv_path:str, engine:str = DEFAULT_CSV_ENGINE) -> pd.DataFrame:
+        df, _ = ExtractorCSV.extract_with_fingerprint(csv_path, engine)
+        return df
+
+    @staticmethod
+    # Giống extract nhưng trả thêm fingerprint (hash) của file
+    # Hash được tính ngay trong lần đọc mà pandas dùng để parse, nên file chỉ bị đọc 1 lần
+    # Nếu hash đã có trong cache (file không đổi) thì chỉ parse, không hash lại
+    def extract_with_fingerprint(csv_path:str, engine:str = DEFAULT_CSV_ENGINE) -> tuple[pd.DataFrame, str]:
         try:
             file_path = Path(csv_path)
             if not file_path.exists():
                 logger.error(f"File not found: {csv_path}")
                 raise FileNotFoundError(f"File not found: {csv_path}")
             logger.info(f"Loading CSV file from: {csv_path}")
-            df = pd.read_csv(csv_path)
+            file_hash = FingerprintCache.get(csv_path)
+            if file_hash and detect_compression(csv_path) is None:
+                df = ExtractorCSV._read_csv(csv_path, csv_path, engine)
+            elif file_hash:
+                with open_decompressed(csv_path) as stream:
+                    df = ExtractorCSV._read_csv(stream, csv_path, engine)
+            else:
+                # Hash + giải nén (nếu có) + parse trong cùng 1 lần đọc file
+                with hashing_open(csv_path) as (stream, result):
+                    df = ExtractorCSV._read_csv(stream, csv_path, engine)
+                file_hash = result['digest']
             logger.info(f"CSV file loaded successfully with {len(df)} records.")
 
             # Clean Column Names
@@ -32,7 +229,227 @@ class ExtractorCSV:
                 logger.error("CSV validation failed. Missing required columns.")
                 raise ValueError("CSV validation failed. Missing required columns.")
             logger.info("CSV validation passed.")
-            return df
+            return df, file_hash
         except Exception as e:
             logger.exception(f"An error occurred while extracting CSV: {e}")
             raise
+
+    @staticmethod
+    def _byte_ranges(csv_path: str, parts: int) -> list[tuple[int, int]]:
+        # Chia phần dữ liệu (sau dòng header) thành tối đa parts khoảng byte, mỗi khoảng kết thúc ngay sau 1 ký tự '\n'
+        # Giả định không có field trong ngoặc kép chứa xuống dòng (đúng với file export của dealer)
+        with open(csv_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            header_end = mm.find(b'\n') + 1
+            if header_end == 0 or header_end >= size:
+                return []
+            step = max((size - header_end) // parts, 1)
+            bounds = [header_end]
+            for i in range(1, parts):
+                target = header_end + i * step
+                if target <= bounds[-1]:
+                    continue
+                newline = mm.find(b'\n', target - 1)
+                if newline == -1 or newline + 1 >= size:
+                    break
+                bounds.append(newline + 1)
+            bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @staticmethod
+    def _concat_ranges(frames: list[pd.DataFrame]) -> pd.DataFrame:
+        # Cột category của mỗi khoảng có tập category riêng: gộp + sắp xếp lại giống tập category khi parse cả file,
+        # nếu không pd.concat sẽ trả về cột object
+        for col in frames[0].columns:
+            if not any(isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames):
+                continue
+            categories = set()
+            for f in frames:
+                values = f[col].cat.categories if isinstance(f[col].dtype, pd.CategoricalDtype) else f[col].dropna()
+                categories.update(values)
+            dtype = pd.CategoricalDtype(pd.Index(sorted(categories), dtype=object))
+            for f in frames:
+                f[col] = f[col].astype(dtype)
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    # Parse + clean song song 1 file CSV lớn, trả về (df_raw, df_clean, rejections, file_hash)
+    # - File được mmap và chia thành các khoảng byte cắt ở ranh giới dòng, dòng header dùng chung cho mọi khoảng
+    # - Mỗi khoảng được parse + DataCleaner.clean_data_with_report trong 1 process của pool
+    # - Kết quả đi về qua shared memory dạng Arrow thay vì pickle DataFrame, hash file tính trong lúc chờ worker
+    # Kết quả giống hệt extract + clean tuần tự: cùng dòng, cùng thứ tự, cùng kiểu cột và cùng index
+    # Không có pyarrow / 1 worker / file nhỏ hơn PARALLEL_PARSE_MIN_BYTES thì chạy tuần tự
+    # Ví dụ: df_raw, df_clean, rejections, file_hash = ExtractorCSV.extract_parallel('big.csv', workers=16)
+    def extract_parallel(csv_path: str, workers: int | None = None,
+                         engine: str = DEFAULT_CSV_ENGINE) -> tuple[pd.DataFrame, pd.DataFrame, dict, str]:
+        try:
+            file_path = Path(csv_path)
+            if not file_path.exists():
+                logger.error(f"File not found: {csv_path}")
+                raise FileNotFoundError(f"File not found: {csv_path}")
+            workers = workers or os.cpu_count() or 1
+            ranges = []
+            # File nén không chia được theo khoảng byte, chạy tuần tự (giải nén streaming)
+            if (pa is not None and workers > 1 and file_path.stat().st_size >= PARALLEL_PARSE_MIN_BYTES
+                    and detect_compression(csv_path) is None):
+                ranges = ExtractorCSV._byte_ranges(csv_path, workers * PARALLEL_PARSE_RANGES_PER_WORKER)
+            if len(ranges) < 2:
+                df_raw, file_hash = ExtractorCSV.extract_with_fingerprint(csv_path, engine)
+                df_clean, rejections = DataCleaner.clean_data_with_report(df_raw)
+                return df_raw, df_clean, rejections, file_hash
+
+            if not check_validate_csv(pd.DataFrame(columns=ExtractorCSV._header(csv_path)), REQUIRED_COLUMNS):
+                logger.error("CSV validation failed. Missing required columns.")
+                raise ValueError("CSV validation failed. Missing required columns.")
+            logger.info(f"Parsing {csv_path} in {len(ranges)} byte ranges on {workers} processes")
+
+            results, error = [], None
+            try:
+                with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+                    futures = [pool.submit(_parse_range, csv_path, start, end, engine) for start, end in ranges]
+                    file_hash = file_fingerprint(csv_path)
+                    # Giữ đúng thứ tự các khoảng byte để thứ tự dòng giống parse tuần tự
+                    for future in futures:
+                        try:
+                            results.append(future.result())
+                        except Exception as e:
+                            error = error or e
+                if error is not None:
+                    raise error
+                df_raw = ExtractorCSV._concat_ranges([_take_shared(*r['raw']) for r in results])
+                clean_frames = [_take_shared(*r['clean']) for r in results]
+            finally:
+                for r in results:
+                    _discard_shared(r['raw'][0])
+                    _discard_shared(r['clean'][0])
+
+            if any(r['tolerant'] for r in results):
+                # Parse tuần tự sẽ ép kiểu lại cột số trên cả file, làm giống vậy để kiểu cột khớp nhau
+                logger.warning(f"Typed parse failed for part of {csv_path}. Using tolerant numeric columns.")
+                df_raw = ExtractorCSV._coerce_numeric(df_raw)
+            # Index của dòng clean = vị trí dòng trong cả file, như khi clean 1 DataFrame đọc từ cả file
+            offsets = np.cumsum([0] + [r['rows'] for r in results[:-1]])
+            clean_counts = [len(f) for f in clean_frames]
+            df_clean = ExtractorCSV._concat_ranges(clean_frames)
+            df_clean.index = df_clean.pop(_ROW_COLUMN).to_numpy() + np.repeat(offsets, clean_counts)
+            rejections = {}
+            for r in results:
+                for rule, count in r['rejections'].items():
+                    rejections[rule] = rejections.get(rule, 0) + count
+            logger.info(f"CSV file loaded successfully with {len(df_raw)} records.")
+            return df_raw, df_clean, rejections, file_hash
+        except Exception as e:
+            logger.exception(f"An error occurred while extracting CSV in parallel: {e}")
+            raise
+
+    @staticmethod
+    # Chế độ streaming: đọc file theo từng chunk chunk_size dòng thay vì đọc cả file vào 1 DataFrame
+    # Bộ nhớ lúc này chỉ phụ thuộc vào chunk_size chứ không phụ thuộc vào kích thước file
+    # Ví dụ: for chunk in ExtractorCSV.extract_chunks('path/to/csv', 50_000): ...
+    # Chế độ này luôn dùng engine 'c'
+    def extract_chunks(csv_path:str, chunk_size:int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+        for chunk, _ in ExtractorCSV.extract_chunk_ranges(csv_path, chunk_size):
+            yield chunk
+
+    @staticmethod
+    def _line_blocks(stream, chunk_size: int, offset: int) -> Iterator[tuple[int, bytes]]:
+        # Cắt stream thành các block đúng chunk_size dòng (block cuối có thể ít hơn), trả về (offset đầu block, bytes)
+        # Đếm '\n' bằng NumPy trên từng buffer HASH_READ_BUFFER byte, không tách từng dòng bằng Python
+        # Giả định không có field trong ngoặc kép chứa xuống dòng (giống _byte_ranges)
+        parts, lines = [], 0
+        while True:
+            block = stream.read(HASH_READ_BUFFER)
+            if not block:
+                break
+            ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10) + 1  # vị trí ngay sau mỗi '\n'
+            begin = 0
+            for cut in ends[chunk_size - lines - 1::chunk_size]:
+                parts.append(block[begin:cut])
+                data = b''.join(parts)
+                yield offset, data
+                offset += len(data)
+                parts, begin = [], int(cut)
+            parts.append(block[begin:])
+            lines = (lines + len(ends)) % chunk_size
+        tail = b''.join(parts)
+        if tail.strip():
+            yield offset, tail
+
+    @staticmethod
+    @contextmanager
+    def _chunk_stream(csv_path: str, hash_result: dict | None):
+        # Stream đã giải nén cho chế độ streaming, hash_result khác None thì hash luôn trong lần đọc này (hashing_open)
+        if hash_result is None:
+            with open_decompressed(csv_path) as stream:
+                yield stream
+            return
+        with hashing_open(csv_path) as (stream, result):
+            yield stream
+        hash_result['digest'] = result['digest']
+
+    @staticmethod
+    # Giống extract_chunks nhưng mỗi chunk kèm vị trí của nó trong file (dùng để checkpoint / resume):
+    # {'index', 'byte_start', 'byte_end', 'row_start', 'chunk_hash'}
+    # - Offset tính trên nội dung đã giải nén (kể cả file nén), chunk_hash là hash HASH_ALGORITHM của bytes chunk
+    # - offset: bắt đầu đọc từ byte này (byte_end của chunk cuối đã load), start_index / start_row là số thứ tự
+    #   chunk / dòng tương ứng. File thường seek thẳng tới offset, không đọc lại phần trước;
+    #   file nén phải giải nén bỏ qua phần trước nhưng không parse
+    # - hash_result: truyền dict vào thì hash của file (trên nội dung đã giải nén) được tính ngay trong lần đọc này,
+    #   đọc hết file thì hash_result['digest'] có giá trị và được lưu vào cache fingerprint. Phần trước offset
+    #   vẫn được đọc qua (không seek) để hash đủ cả file. Dùng cho file nén chưa có hash: chỉ giải nén 1 lượt
+    def extract_chunk_ranges(csv_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, offset: int = 0,
+                             start_index: int = 0, start_row: int = 0,
+                             hash_result: dict | None = None) -> Iterator[tuple[pd.DataFrame, dict]]:
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        file_path = Path(csv_path)
+        if not file_path.exists():
+            logger.error(f"File not found: {csv_path}")
+            raise FileNotFoundError(f"File not found: {csv_path}")
+        logger.info(f"Streaming CSV file from: {csv_path} (chunk_size={chunk_size}, offset={offset})")
+
+        total, index = start_row, start_index
+        pin_numeric = True
+        # File nén được giải nén dần theo từng chunk, RAM vẫn chỉ phụ thuộc chunk_size
+        with ExtractorCSV._chunk_stream(csv_path, hash_result) as stream:
+            # Dòng header đọc 1 lần từ chính stream này (không mở / giải nén lại file),
+            # schema giống nhau ở mọi chunk nên chỉ cần validate 1 lần
+            header = stream.readline()
+            columns = pd.read_csv(io.BytesIO(header), nrows=0).columns
+            if not check_validate_csv(pd.DataFrame(columns=columns), REQUIRED_COLUMNS):
+                logger.error("CSV validation failed. Missing required columns.")
+                raise ValueError("CSV validation failed. Missing required columns.")
+            typed = ExtractorCSV._read_options(csv_path, 'c', header=columns)
+            tolerant = ExtractorCSV._read_options(csv_path, 'c', pin_numeric=False, header=columns)
+            offset = max(offset, len(header))
+            remaining = offset - len(header)
+            if remaining and hash_result is None and detect_compression(csv_path) is None:
+                stream.seek(offset)
+                remaining = 0
+            while remaining > 0:
+                skipped = len(stream.read(min(remaining, HASH_READ_BUFFER)))
+                if not skipped:
+                    break
+                remaining -= skipped
+            for start, data in ExtractorCSV._line_blocks(stream, chunk_size, offset):
+                # Nếu 1 chunk parse theo schema bị lỗi (giá trị bẩn trong cột số) thì parse lại chunk đó
+                # và các chunk sau ở chế độ ép kiểu sau
+                try:
+                    chunk = pd.read_csv(io.BytesIO(header + data), **(typed if pin_numeric else tolerant))
+                except (ValueError, TypeError) as e:
+                    if not pin_numeric:
+                        raise
+                    logger.warning(f"Typed parse failed for {csv_path} after {total} rows ({e}). "
+                                   f"Continuing with tolerant numeric columns.")
+                    pin_numeric = False
+                    chunk = pd.read_csv(io.BytesIO(header + data), **tolerant)
+                chunk.columns = chunk.columns.str.strip()
+                if not pin_numeric:
+                    chunk = ExtractorCSV._coerce_numeric(chunk)
+                chunk.index = pd.RangeIndex(total, total + len(chunk))
+                position = {'index': index, 'byte_start': start, 'byte_end': start + len(data), 'row_start': total,
+                            'chunk_hash': hl.new(HASH_ALGORITHM, data).hexdigest()}
+                total += len(chunk)
+                index += 1
+                yield chunk, position
+        logger.info(f"CSV file streamed successfully with {total} records.")
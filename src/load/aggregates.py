@@ -0,0 +1,196 @@
+import pandas as pd
+from config.log_config import logger_config
+from config.constants import TABLE_CLEAN, TABLE_AGG_MODEL, TABLE_AGG_MODEL_YEAR_FUEL
+from src.utils.db_manager import DBManager
+from src.utils.warehouse_query import WarehouseQuery
+
+logger = logger_config('src.load.aggregates')
+
+# Đây là nơi duy trì các bảng tổng hợp của bảng clean:
+# - agg_model_year_fuel: mỗi (model, year, fuel_type) 1 dòng
+# - agg_model: mỗi model 1 dòng, cộng dồn từ agg_model_year_fuel
+# Mỗi dòng có số record, tổng / min / max của price và mileage
+# Bảng được cập nhật trong cùng transaction với lần ghi / xoá dữ liệu clean, chỉ từ các dòng vừa thêm / vừa xoá:
+# - Thêm dòng: cộng count / sum, min / max lấy LEAST / GREATEST
+# - Xoá dòng: trừ count / sum, nhóm nào bị xoá đúng giá trị min / max thì tính lại riêng nhóm đó từ bảng clean
+# Dashboard / profiler đọc bảng tổng hợp nên không phải quét bảng clean, thời gian không tăng theo warehouse
+# Sau khi transaction commit, cache đọc của WarehouseQuery cho các model bị ảnh hưởng bị xoá
+
+GROUP_KEYS = ['model', 'year', 'fuel_type']
+STAT_COLUMNS = ['row_count', 'price_sum', 'price_min', 'price_max', 'mileage_sum', 'mileage_min', 'mileage_max']
+# Kiểu của từng cột khi truyền mảng vào UNNEST
+_SQL_TYPES = ['TEXT', 'INT', 'TEXT', 'BIGINT', 'BIGINT', 'INT', 'INT', 'BIGINT', 'INT', 'INT']
+
+
+class AggregateTables:
+
+    @staticmethod
+    def create_tables(cur):
+        # Tạo bảng tổng hợp, lần đầu tạo mà bảng clean đã có dữ liệu thì dựng lại từ đầu 1 lần
+        cur.execute("SELECT to_regclass(%s) IS NULL;", (TABLE_AGG_MODEL_YEAR_FUEL,))
+        is_new = cur.fetchone()[0]
+        stats_ddl = """
+            row_count BIGINT NOT NULL,
+            price_sum BIGINT NOT NULL,
+            price_min INT,
+            price_max INT,
+            mileage_sum BIGINT NOT NULL,
+            mileage_min INT,
+            mileage_max INT,
+            updated_at TIMESTAMP DEFAULT NOW()"""
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_AGG_MODEL_YEAR_FUEL}(
+                model TEXT NOT NULL,
+                year INT NOT NULL,
+                fuel_type TEXT NOT NULL,{stats_ddl},
+                PRIMARY KEY (model, year, fuel_type));
+        """)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_AGG_MODEL}(
+                model TEXT PRIMARY KEY,{stats_ddl});
+        """)
+        if is_new:
+            AggregateTables.rebuild(cur)
+
+    @staticmethod
+    def rebuild(cur):
+        # Dựng lại toàn bộ bảng tổng hợp từ bảng clean (quét cả bảng), chỉ dùng khi khởi tạo / sửa sai lệch
+        cur.execute(f"DELETE FROM {TABLE_AGG_MODEL_YEAR_FUEL};")
+        cur.execute(f"""
+            INSERT INTO {TABLE_AGG_MODEL_YEAR_FUEL} (model, year, fuel_type, {', '.join(STAT_COLUMNS)})
+            SELECT model, year, fuel_type, COUNT(*), SUM(price), MIN(price), MAX(price),
+                   SUM(mileage), MIN(mileage), MAX(mileage)
+            FROM {TABLE_CLEAN}
+            GROUP BY model, year, fuel_type;
+        """)
+        cur.execute(f"DELETE FROM {TABLE_AGG_MODEL};")
+        AggregateTables._rollup_models(cur, None)
+        DBManager.after_commit(cur, WarehouseQuery.invalidate_models)
+        logger.info("Aggregate tables rebuilt from clean table")
+
+    @staticmethod
+    def groups_from_frame(df: pd.DataFrame) -> pd.DataFrame:
+        # Tổng hợp theo nhóm từ frame đúng cột bảng clean (các dòng sắp ghi vào / vừa xoá khỏi bảng)
+        if df.empty:
+            return pd.DataFrame(columns=GROUP_KEYS + STAT_COLUMNS)
+        grouped = df.groupby(GROUP_KEYS, observed=True, sort=False).agg(
+            row_count=('price', 'size'),
+            price_sum=('price', 'sum'),
+            price_min=('price', 'min'),
+            price_max=('price', 'max'),
+            mileage_sum=('mileage', 'sum'),
+            mileage_min=('mileage', 'min'),
+            mileage_max=('mileage', 'max'),
+        )
+        return grouped.reset_index()
+
+    @staticmethod
+    def groups_from_table(cur, relation: str, csv_path: str | None = None) -> pd.DataFrame:
+        # Tổng hợp theo nhóm ngay trên server (bảng staging, hoặc dữ liệu của 1 file trong bảng clean trước khi xoá)
+        where = "WHERE src_file = %s" if csv_path is not None else ""
+        cur.execute(f"""
+            SELECT model, year, fuel_type, COUNT(*), SUM(price), MIN(price), MAX(price),
+                   SUM(mileage), MIN(mileage), MAX(mileage)
+            FROM {relation}
+            {where}
+            GROUP BY model, year, fuel_type;
+        """, (csv_path,) if csv_path is not None else None)
+        return pd.DataFrame(cur.fetchall(), columns=GROUP_KEYS + STAT_COLUMNS)
+
+    @staticmethod
+    def _unnest(groups: pd.DataFrame) -> tuple[str, list]:
+        # UNNEST nhiều mảng song song: cả nhóm được gửi trong 1 câu lệnh, 1 round trip
+        columns = GROUP_KEYS + STAT_COLUMNS
+        sql = "UNNEST(" + ", ".join(f"%s::{t}[]" for t in _SQL_TYPES) + f") AS d({', '.join(columns)})"
+        params = []
+        for col in columns:
+            values = groups[col]
+            params.append(values.astype(str).tolist() if col in ('model', 'fuel_type')
+                          else values.astype('int64').tolist())
+        return sql, params
+
+    @staticmethod
+    def apply_added(cur, groups: pd.DataFrame):
+        # Gọi sau khi đã ghi các dòng mới vào bảng clean, trong cùng transaction
+        if groups.empty:
+            return
+        source, params = AggregateTables._unnest(groups)
+        cur.execute(f"""
+            INSERT INTO {TABLE_AGG_MODEL_YEAR_FUEL} AS f (model, year, fuel_type, {', '.join(STAT_COLUMNS)})
+            SELECT * FROM {source}
+            ON CONFLICT (model, year, fuel_type) DO UPDATE SET
+                row_count = f.row_count + EXCLUDED.row_count,
+                price_sum = f.price_sum + EXCLUDED.price_sum,
+                price_min = LEAST(f.price_min, EXCLUDED.price_min),
+                price_max = GREATEST(f.price_max, EXCLUDED.price_max),
+                mileage_sum = f.mileage_sum + EXCLUDED.mileage_sum,
+                mileage_min = LEAST(f.mileage_min, EXCLUDED.mileage_min),
+                mileage_max = GREATEST(f.mileage_max, EXCLUDED.mileage_max),
+                updated_at = NOW();
+        """, params)
+        AggregateTables._models_changed(cur, groups)
+
+    @staticmethod
+    def apply_removed(cur, groups: pd.DataFrame):
+        # Gọi sau khi đã xoá các dòng khỏi bảng clean, trong cùng transaction
+        if groups.empty:
+            return
+        source, params = AggregateTables._unnest(groups)
+        # RETURNING cho biết nhóm nào bị xoá đúng min / max (cần tính lại) và nhóm nào không còn dòng nào
+        cur.execute(f"""
+            UPDATE {TABLE_AGG_MODEL_YEAR_FUEL} AS f SET
+                row_count = f.row_count - d.row_count,
+                price_sum = f.price_sum - d.price_sum,
+                mileage_sum = f.mileage_sum - d.mileage_sum,
+                updated_at = NOW()
+            FROM {source}
+            WHERE f.model = d.model AND f.year = d.year AND f.fuel_type = d.fuel_type
+            RETURNING f.model, f.year, f.fuel_type, f.row_count,
+                      d.price_min <= f.price_min OR d.price_max >= f.price_max
+                      OR d.mileage_min <= f.mileage_min OR d.mileage_max >= f.mileage_max;
+        """, params)
+        updated = cur.fetchall()
+        cur.execute(f"DELETE FROM {TABLE_AGG_MODEL_YEAR_FUEL} WHERE row_count <= 0;")
+
+        stale = [row[:3] for row in updated if row[3] > 0 and row[4]]
+        if stale:
+            models, years, fuels = (list(col) for col in zip(*stale))
+            cur.execute(f"""
+                UPDATE {TABLE_AGG_MODEL_YEAR_FUEL} AS f SET
+                    price_min = s.price_min, price_max = s.price_max,
+                    mileage_min = s.mileage_min, mileage_max = s.mileage_max
+                FROM (
+                    SELECT c.model, c.year, c.fuel_type, MIN(c.price) AS price_min, MAX(c.price) AS price_max,
+                           MIN(c.mileage) AS mileage_min, MAX(c.mileage) AS mileage_max
+                    FROM {TABLE_CLEAN} c
+                    JOIN UNNEST(%s::TEXT[], %s::INT[], %s::TEXT[]) AS g(model, year, fuel_type)
+                      ON c.model = g.model AND c.year = g.year AND c.fuel_type = g.fuel_type
+                    GROUP BY c.model, c.year, c.fuel_type
+                ) s
+                WHERE f.model = s.model AND f.year = s.year AND f.fuel_type = s.fuel_type;
+            """, (models, years, fuels))
+            logger.info(f"Recomputed min/max of {len(stale)} aggregate groups after delete")
+        AggregateTables._models_changed(cur, groups)
+
+    @staticmethod
+    def _models_changed(cur, groups: pd.DataFrame):
+        # Cộng dồn lại agg_model cho các model bị ảnh hưởng, commit xong thì xoá cache đọc của các model đó
+        models = groups['model'].astype(str).unique().tolist()
+        AggregateTables._rollup_models(cur, models)
+        DBManager.after_commit(cur, lambda: WarehouseQuery.invalidate_models(models))
+
+    @staticmethod
+    def _rollup_models(cur, models: list | None):
+        # agg_model cộng dồn từ agg_model_year_fuel (bảng nhỏ) cho các model bị ảnh hưởng, None = mọi model
+        where = "WHERE model = ANY(%s)" if models is not None else ""
+        params = (models,) if models is not None else None
+        if models is not None:
+            cur.execute(f"DELETE FROM {TABLE_AGG_MODEL} {where};", params)
+        cur.execute(f"""
+            INSERT INTO {TABLE_AGG_MODEL} (model, {', '.join(STAT_COLUMNS)})
+            SELECT model, SUM(row_count), SUM(price_sum), MIN(price_min), MAX(price_max),
+                   SUM(mileage_sum), MIN(mileage_min), MAX(mileage_max)
+            FROM {TABLE_AGG_MODEL_YEAR_FUEL}
+            {where}
+            GROUP BY model;
+        """, params)
@@ -0,0 +1,150 @@
+import hashlib as hl
+import json
+import os
+from psycopg2.extras import Json
+from config.log_config import logger_config
+from config.constants import TABLE_RAW, TABLE_CLEAN, TABLE_LOAD_CHECKPOINT, HASH_ALGORITHM
+from src.utils.compressed_io import detect_compression
+from src.utils.db_manager import DBManager
+
+logger = logger_config('src.load.checkpoint')
+
+# Đây là nơi lưu checkpoint của chế độ streaming để load file lớn bị ngắt giữa chừng (mất kết nối, process bị kill)
+# không phải extract / clean / ghi lại từ đầu
+# - Mỗi chunk ghi vào bảng staging (raw + clean) và 1 dòng checkpoint trong CÙNG 1 transaction:
+#   chunk đã commit thì chắc chắn có checkpoint và ngược lại, không có chunk ghi 2 lần hay bị thiếu
+# - Checkpoint ghi offset byte / dòng của chunk, hash của bytes chunk, profile + report validate của chunk
+#   để lúc publish vẫn gộp được profile / report của cả file
+# - Lần chạy sau cùng hash file: kiểm tra checkpoint khớp với staging còn lại rồi đọc tiếp từ byte sau chunk cuối
+# - Publish xoá checkpoint của file trong cùng transaction với lúc publish
+# - File nén chưa có hash (hash tính dần trong lúc stream) thì checkpoint ghi tạm định danh theo stat của file
+#   (pending_hash, giống key của cache fingerprint): file bị sửa / thay thì định danh đổi và checkpoint bị bỏ
+# Ví dụ:
+# resume = LoadCheckpoint.resume_point('archive/bmw.csv', file_hash, stagings)
+# ExtractorCSV.extract_chunk_ranges(path, chunk_size, resume['offset'], resume['index'], resume['row'])
+
+
+def _json(value):
+    # Số đếm trong profile / rejections có thể là số nguyên NumPy
+    return Json(value, dumps=lambda obj: json.dumps(obj, default=lambda o: o.item() if hasattr(o, 'item') else str(o)))
+
+
+class LoadCheckpoint:
+
+    @staticmethod
+    def create_table(cur):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_LOAD_CHECKPOINT}(
+                src_file TEXT NOT NULL,
+                chunk_index INT NOT NULL,
+                file_hash TEXT NOT NULL,
+                tables TEXT[] NOT NULL,
+                byte_start BIGINT NOT NULL,
+                byte_end BIGINT NOT NULL,
+                row_start BIGINT NOT NULL,
+                raw_rows INT NOT NULL,
+                clean_rows INT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                profile JSONB,
+                validation JSONB,
+                committed_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (src_file, chunk_index));
+        """)
+
+    @staticmethod
+    def pending_hash(csv_path: str) -> str:
+        # Dùng thay hash của file khi hash chỉ có sau khi đọc hết file (xem ETLPipeline._run_streaming)
+        st = os.stat(csv_path)
+        return f"pending:{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+
+    @staticmethod
+    def record(cur, csv_path: str, file_hash: str, tables: list, position: dict, raw_rows: int, clean_rows: int,
+               profile: dict | None = None, validation: dict | None = None):
+        # Gọi trong transaction ghi chunk vào staging. Chunk đã có checkpoint thì vi phạm primary key,
+        # transaction rollback luôn phần dữ liệu vừa ghi nên 1 chunk không bao giờ vào staging 2 lần
+        cur.execute(f"""
+            INSERT INTO {TABLE_LOAD_CHECKPOINT} (src_file, chunk_index, file_hash, tables, byte_start, byte_end,
+                row_start, raw_rows, clean_rows, chunk_hash, profile, validation)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+        """, (csv_path, position['index'], file_hash, sorted(tables), position['byte_start'], position['byte_end'],
+              position['row_start'], raw_rows, clean_rows, position['chunk_hash'],
+              _json(profile) if profile is not None else None,
+              _json(validation) if validation is not None else None))
+
+    @staticmethod
+    def clear(cur, csv_path: str):
+        # Xoá checkpoint của file: lúc publish (cùng transaction) hoặc khi bắt đầu load lại từ đầu
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                LoadCheckpoint.clear(own_cur, csv_path)
+            return
+        cur.execute(f"DELETE FROM {TABLE_LOAD_CHECKPOINT} WHERE src_file = %s;", (csv_path,))
+
+    @staticmethod
+    def _chunk_matches(csv_path: str, checkpoint: dict) -> bool:
+        # Đọc lại đúng khoảng byte của chunk cuối và so hash, phát hiện offset lệch (vd cách cắt chunk đã đổi)
+        # File nén thì bỏ qua (phải giải nén lại từ đầu), hash cả file khớp là đủ
+        if detect_compression(csv_path) is not None:
+            return True
+        with open(csv_path, 'rb') as f:
+            f.seek(checkpoint['byte_start'])
+            data = f.read(checkpoint['byte_end'] - checkpoint['byte_start'])
+        return hl.new(HASH_ALGORITHM, data).hexdigest() == checkpoint['chunk_hash']
+
+    @staticmethod
+    def resume_point(csv_path: str, file_hash: str, stagings: dict) -> dict | None:
+        # stagings: {bảng đích: tên bảng staging} của lần chạy này
+        # Trả về chỗ đọc tiếp + số liệu của các chunk đã commit, None nếu không resume được (phải load lại từ đầu):
+        # file đã đổi, lần trước ghi vào bảng khác, staging mất / lệch số dòng (vd UNLOGGED bị truncate sau crash)
+        with DBManager.get_cursor() as cur:
+            cur.execute(f"""
+                SELECT chunk_index, file_hash, tables, byte_start, byte_end, row_start, raw_rows, clean_rows,
+                       chunk_hash, profile, validation
+                FROM {TABLE_LOAD_CHECKPOINT}
+                WHERE src_file = %s
+                ORDER BY chunk_index;
+            """, (csv_path,))
+            columns = [desc[0] for desc in cur.description]
+            checkpoints = [dict(zip(columns, row)) for row in cur.fetchall()]
+            if not checkpoints:
+                return None
+
+            reason = None
+            if any(c['file_hash'] != file_hash for c in checkpoints):
+                reason = 'file changed'
+            elif any(sorted(c['tables']) != sorted(stagings) for c in checkpoints):
+                reason = 'different target tables'
+            elif any(c['chunk_index'] != i or (i and c['byte_start'] != checkpoints[i - 1]['byte_end'])
+                     for i, c in enumerate(checkpoints)):
+                reason = 'gap between chunks'
+            else:
+                expected = {TABLE_RAW: sum(c['raw_rows'] for c in checkpoints),
+                            TABLE_CLEAN: sum(c['clean_rows'] for c in checkpoints)}
+                for table, staging in stagings.items():
+                    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (staging,))
+                    if not cur.fetchone()[0]:
+                        reason = f"staging {staging} missing"
+                        break
+                    cur.execute(f"SELECT COUNT(*) FROM {staging};")
+                    rows = cur.fetchone()[0]
+                    if rows != expected[table]:
+                        reason = f"staging {staging} has {rows} rows, checkpoints say {expected[table]}"
+                        break
+        if reason is None and not LoadCheckpoint._chunk_matches(csv_path, checkpoints[-1]):
+            reason = 'last chunk hash mismatch'
+        if reason is not None:
+            logger.warning(f"Discarding {len(checkpoints)} checkpoints of {csv_path}: {reason}")
+            return None
+
+        last = checkpoints[-1]
+        logger.info(f"Resuming {csv_path} after chunk {last['chunk_index']} "
+                    f"(byte {last['byte_end']}, row {last['row_start'] + last['raw_rows']})")
+        return {
+            'offset': last['byte_end'],
+            'index': last['chunk_index'] + 1,
+            'row': last['row_start'] + last['raw_rows'],
+            'raw_rows': sum(c['raw_rows'] for c in checkpoints),
+            'clean_rows': sum(c['clean_rows'] for c in checkpoints),
+            'profiles': [c['profile'] for c in checkpoints if c['profile'] is not None],
+            'validations': [c['validation'] for c in checkpoints if c['validation'] is not None],
+        }
@@ -1,19 +1,42 @@
+import hashlib as hl
+import io
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_float_dtype
 from pathlib import Path
+from psycopg2.extensions import register_adapter, AsIs
+from psycopg2.extras import execute_values
 from config.log_config import logger_config
-from config.constants import TABLE_RAW, TABLE_CLEAN, COLUMNS_MAPPING, DATA_TYPES, REQUIRED_COLUMNS
+from config.constants import (TABLE_RAW, TABLE_CLEAN, TABLE_MANIFEST, COLUMNS_MAPPING, DATA_TYPES, REQUIRED_COLUMNS,
+                              RAW_DB_COLUMNS, CLEAN_DB_COLUMNS, LOAD_STRATEGIES, DEFAULT_LOAD_STRATEGY,
+                              EXECUTE_VALUES_PAGE_SIZE, PARTITIONED_TABLES, STAGED_RELOADS,
+                              STAGING_TABLE_PREFIX, DELTA_RELOADS, DELTA_MAX_CHANGE_RATIO)
 from src.transform.validate import cal_hash_file, check_data_exist, check_validate_csv, check_validate_dataframe
 from src.utils.db_manager import DBManager
+from src.utils.data_profiler import DataProfiler
+from src.load.aggregates import AggregateTables
+from src.transform.dedup import Deduplicator, IN_WAREHOUSE
+from src.load.checkpoint import LoadCheckpoint
 
 
 logger = logger_config('src.load.db_loader')
+
+# psycopg2 không tự adapt được kiểu số của numpy (np.int64, np.float32, ...)
+# Đăng ký AsIs để execute_values / executemany nhận trực tiếp giá trị từ DataFrame
+for _np_type in (np.int16, np.int32, np.int64, np.float32, np.float64):
+    register_adapter(_np_type, AsIs)
 # Đây là nơi sẽ chứa các hàm để load dữ liệu vào database
 # Từ DataFrame của pandas, ta sẽ load dữ liệu vào database
 # Việc xử lý trước khi load vào DB được gọi tại đây, còn việc xử lý chi tiết sẽ được thực hiện trong hàm khác ở src/transform/cleaner.py
 class DBLoader:
 
+    # Cache kết quả kiểm tra bảng có phải partitioned table hay không, tránh query pg_class mỗi lần load
+    _partitioned = {}
+
     @staticmethod
-    def create_raw_and_clean_table():
+    def create_raw_and_clean_table(partitioned: bool = PARTITIONED_TABLES):
+        # partitioned: tạo bảng raw / clean dạng PARTITION BY LIST (src_file), mỗi file có partition riêng
+        partition_clause = " PARTITION BY LIST (src_file)" if partitioned else ""
         with DBManager.get_cursor() as cur:
             cur.execute(f"""
                 CREATE TABLE IF NOT EXISTS {TABLE_RAW}(
@@ -28,7 +51,8 @@ class DBLoader:
                 engine_size FLOAT,
                 src_file TEXT,
                 file_hash TEXT,
-                ingest_at TIMESTAMP DEFAULT NOW());
+                row_hash BIGINT,
+                ingest_at TIMESTAMP DEFAULT NOW()){partition_clause};
             """)
 
             cur.execute(f"""
@@ -43,99 +67,587 @@ class DBLoader:
                     mpg FLOAT NOT NULL,
                     engine_size FLOAT NOT NULL,
                     src_file TEXT NOT NULL,
-                    ingest_at TIMESTAMP DEFAULT NOW());
+                    row_hash BIGINT,
+                    ingest_at TIMESTAMP DEFAULT NOW()){partition_clause};
+            """)
+
+            # Index cho (src_file, row_hash) (xoá / tra theo file, so hash từng dòng khi load delta)
+            # và (model, year) cho truy vấn phân tích
+            # Với bảng partitioned, index tạo trên bảng cha sẽ tự có trên mọi partition
+            for table in (TABLE_RAW, TABLE_CLEAN):
+                # Bảng tạo từ phiên bản cũ chưa có cột row_hash, index cũ chỉ có src_file thì thay bằng index mới
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_hash BIGINT;")
+                cur.execute(f"DROP INDEX IF EXISTS idx_{table}_src_file;")
+                cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_src_file_row_hash ON {table} (src_file, row_hash);")
+                cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_model_year ON {table} (model, year);")
+
+            # Bảng manifest: mỗi (file, bảng) 1 dòng, tra theo primary key thay vì COUNT(*) trên bảng dữ liệu
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {TABLE_MANIFEST}(
+                    src_file TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    row_count BIGINT NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    started_at TIMESTAMP DEFAULT NOW(),
+                    loaded_at TIMESTAMP,
+                    PRIMARY KEY (src_file, table_name));
             """)
+            # Bảng tổng hợp theo model / (model, year, fuel_type), được cập nhật dần theo mỗi lần load bảng clean
+            AggregateTables.create_tables(cur)
+            # Bảng key hash để loại listing trùng giữa các file
+            Deduplicator.create_table(cur)
+            # Bảng checkpoint của chế độ streaming (resume load bị ngắt giữa chừng)
+            LoadCheckpoint.create_table(cur)
             logger.info("Tables created successfully")
 
     @staticmethod
-    def delete_existing(csv_path: str, table_name:str):
+    def delete_existing(csv_path: str, table_name:str, cur=None):
+        # cur: nếu truyền vào thì xoá trong transaction của cursor đó, không tự commit
         if table_name not in [TABLE_CLEAN, TABLE_RAW]:
             raise ValueError(f"Invalid table name: {table_name}")
-        with DBManager.get_cursor() as cur:
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                DBLoader.delete_existing(csv_path, table_name, own_cur)
+            return
+        # Bảng clean: lấy tổng hợp theo nhóm của dữ liệu sắp xoá để trừ khỏi bảng tổng hợp
+        removed = AggregateTables.groups_from_table(cur, table_name, csv_path) if table_name == TABLE_CLEAN else None
+        if DBLoader.is_partitioned(table_name, cur):
+            # Bảng partitioned: bỏ cả partition của file thay vì DELETE từng dòng
+            # Chi phí không phụ thuộc vào kích thước warehouse và không để lại dead tuple
+            partition = DBLoader._partition_name(csv_path, table_name)
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (partition,))
+            if cur.fetchone()[0]:
+                cur.execute(f"ALTER TABLE {table_name} DETACH PARTITION {partition};")
+                cur.execute(f"DROP TABLE {partition};")
+                logger.info(f"Dropped partition {partition} of {table_name}")
+        else:
             cur.execute(f"""
                 DELETE FROM {table_name}
                 WHERE src_file = %s
             """, (csv_path,))
-        logger.info(f"Deleted existing data from {table_name}")        
+            logger.info(f"Deleted existing data from {table_name}")
+        if removed is not None:
+            AggregateTables.apply_removed(cur, removed)
+            Deduplicator.release_file(cur, csv_path)
+
+    @staticmethod
+    def is_partitioned(table_name: str, cur) -> bool:
+        if table_name not in DBLoader._partitioned:
+            cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table_name,))
+            row = cur.fetchone()
+            DBLoader._partitioned[table_name] = bool(row and row[0])
+        return DBLoader._partitioned[table_name]
+
+    @staticmethod
+    def _partition_name(csv_path: str, table_name: str) -> str:
+        # Tên partition lấy từ hash của src_file để luôn hợp lệ và không vượt giới hạn 63 ký tự của Postgres
+        return f"{table_name}_p_{hl.md5(csv_path.encode('utf-8')).hexdigest()[:16]}"
+
+    @staticmethod
+    def ensure_partition(csv_path: str, table_name: str, cur):
+        # Tạo partition (rỗng) cho file nếu bảng là partitioned và partition chưa có
+        if not DBLoader.is_partitioned(table_name, cur):
+            return
+        partition = DBLoader._partition_name(csv_path, table_name)
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table_name} FOR VALUES IN (%s);",
+                    (csv_path,))
+
+    @staticmethod
+    def _to_int(series: pd.Series) -> pd.Series:
+        # Cột INT trong DB: giá trị không phải số -> NULL, số thực thì làm tròn giống Postgres khi ép float -> int
+        return pd.to_numeric(series, errors='coerce').round().astype('Int64')
+
+    @staticmethod
+    def _to_float(series: pd.Series) -> pd.Series:
+        return series if is_float_dtype(series) else series.astype('float64')
+
+    @staticmethod
+    def _row_hash(frame: pd.DataFrame) -> np.ndarray:
+        # Hash 64-bit của từng dòng trên các cột nghiệp vụ (vector hoá), dùng để so sánh khi load delta
+        # Đổi sang int64 để lưu được vào cột BIGINT của Postgres
+        return pd.util.hash_pandas_object(frame, index=False).to_numpy().view('int64')
+
+    @staticmethod
+    def prepare_raw_frame(df: pd.DataFrame, csv_path: str, file_hash: str) -> pd.DataFrame:
+        # Dựng frame đúng thứ tự RAW_DB_COLUMNS bằng thao tác vector hoá, thay cho vòng lặp iterrows
+        frame = pd.DataFrame({
+            'model': df['model'].astype(str).str.strip(),
+            'year': DBLoader._to_int(df['year']),
+            'price': DBLoader._to_int(df['price']),
+            'transmission': df['transmission'].astype(str).str.strip(),
+            'mileage': DBLoader._to_int(df['mileage']),
+            'fuel_type': df['fuelType'].astype(str).str.strip(),
+            'tax': DBLoader._to_int(df['tax']),
+            'mpg': pd.to_numeric(df['mpg'], errors='coerce'),
+            'engine_size': pd.to_numeric(df['engineSize'], errors='coerce'),
+        })
+        frame['row_hash'] = DBLoader._row_hash(frame)
+        frame['src_file'] = csv_path
+        frame['file_hash'] = file_hash
+        return frame[RAW_DB_COLUMNS]
+
+    @staticmethod
+    def prepare_clean_frame(df: pd.DataFrame, csv_file: str) -> pd.DataFrame:
+        frame = pd.DataFrame({
+            'model': df['model'],
+            'year': df['year'].astype('int64'),
+            'price': df['price'].astype('int64'),
+            'transmission': df['transmission'],
+            'mileage': df['mileage'].astype('int64'),
+            'fuel_type': df['fuel_type'],
+            'tax': df['tax'].astype('int64'),
+            # float32 (đọc theo schema) giữ nguyên để ghi ra đúng giá trị trong file, không lộ sai số khi ép lên float64
+            'mpg': DBLoader._to_float(df['mpg']),
+            'engine_size': DBLoader._to_float(df['engine_size']),
+        })
+        frame['row_hash'] = DBLoader._row_hash(frame)
+        frame['src_file'] = csv_file
+        return frame[CLEAN_DB_COLUMNS]
+
+    @staticmethod
+    def _frame_to_rows(frame: pd.DataFrame) -> list:
+        # Chỉ dùng cho fallback execute_values / executemany: NaN / NA -> None để psycopg2 ghi NULL
+        return list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+
+    @staticmethod
+    def write_frame(cur, frame: pd.DataFrame, table_name: str, strategy: str = DEFAULT_LOAD_STRATEGY) -> int:
+        # Ghi frame (đã đúng thứ tự cột) vào bảng theo chiến lược được chọn, trả về số dòng đã ghi
+        if strategy not in LOAD_STRATEGIES:
+            raise ValueError(f"Invalid load strategy: {strategy}. Expected one of {LOAD_STRATEGIES}")
+        columns = ', '.join(frame.columns)
+
+        if strategy == 'copy':
+            # COPY ... FROM STDIN: ghi toàn bộ frame ra buffer CSV trong RAM rồi stream 1 lần vào Postgres
+            buffer = io.StringIO()
+            frame.to_csv(buffer, index=False, header=False, na_rep='')
+            buffer.seek(0)
+            cur.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '')", buffer)
+        elif strategy == 'execute_values':
+            execute_values(cur, f"INSERT INTO {table_name} ({columns}) VALUES %s",
+                           DBLoader._frame_to_rows(frame), page_size=EXECUTE_VALUES_PAGE_SIZE)
+        else:
+            placeholders = ', '.join(['%s'] * len(frame.columns))
+            cur.executemany(f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
+                            DBLoader._frame_to_rows(frame))
+        return len(frame)
 
     @staticmethod
-    def load_to_raw_table(df:pd.DataFrame, csv_path:str, skip_if_exist:bool = True):
+    def load_state(csv_path: str, table_name: str, current_hash: str, skip_if_exist: bool = True,
+                   cur=None) -> str:
+        # Check hash của file với manifest, trả về:
+        # - 'skip': file đã load đúng phiên bản này, bỏ qua
+        # - 'reload': file đã có dữ liệu cũ trong bảng, cần thay thế
+        # - 'new': chưa có dữ liệu (hoặc skip_if_exist=False thì chỉ ghi thêm, không xoá)
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                return DBLoader.load_state(csv_path, table_name, current_hash, skip_if_exist, own_cur)
+
+        existed, old_hash = check_data_exist(csv_path, table_name, cur)
+        if not (existed and skip_if_exist):
+            return 'new'
+        if old_hash == current_hash:
+            logger.info(f"Data from {csv_path} already exists in {table_name}. Skipping.")
+            return 'skip'
+        return 'reload'
+
+    @staticmethod
+    def _staging_name(csv_path: str, table_name: str) -> str:
+        return f"{STAGING_TABLE_PREFIX}_{table_name}_{hl.md5(csv_path.encode('utf-8')).hexdigest()[:16]}"
+
+    @staticmethod
+    def create_staging(csv_path: str, table_name: str, keep: bool = False) -> str:
+        # Tạo bảng staging UNLOGGED cùng cấu trúc với bảng đích (không ghi WAL nên bulk load nhanh hơn)
+        # Bảng staging của lần chạy lỗi trước (nếu còn) bị xoá đi tạo lại
+        # keep=True: giữ nguyên staging của lần chạy trước để ghi tiếp (resume theo checkpoint), chỉ trả về tên
+        staging = DBLoader._staging_name(csv_path, table_name)
+        if keep:
+            return staging
+        with DBManager.get_cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {staging};")
+            cur.execute(f"CREATE UNLOGGED TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS);")
+        logger.info(f"Created staging table {staging} for {table_name}")
+        return staging
+
+    @staticmethod
+    def write_staging(frame: pd.DataFrame, staging: str, load_strategy: str = DEFAULT_LOAD_STRATEGY) -> int:
+        # Ghi vào staging với preset 'bulk_load' (synchronous_commit=off): dữ liệu staging chưa được publish,
+        # mất khi crash thì chỉ cần load lại, không cần chờ flush WAL ở mỗi lần commit
+        with DBManager.get_cursor(preset='bulk_load') as cur:
+            return DBLoader.write_frame(cur, frame, staging, load_strategy)
+
+    @staticmethod
+    def drop_staging(staging: str):
         try:
-            current_hash = cal_hash_file(csv_path)
-            existed, old_hash = check_data_exist(csv_path, TABLE_RAW)
-            if existed and skip_if_exist:
-                if old_hash == current_hash:
-                    logger.info(f"Data from {csv_path} already exists. Skipping.")
-                    return
-                
-                DBLoader.delete_existing(csv_path, TABLE_RAW)
-            logger.info(f"Loading {len(df)} rows to {TABLE_RAW}")
+            with DBManager.get_cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {staging};")
+        except Exception as e:
+            logger.warning(f"Failed to drop staging table {staging}: {e}")
 
-            # Sau khi xử lý các bước check hash rồi thì giờ insert vô thâu
-            data_to_insert = []
-            for _, row in df.iterrows():
-                data_to_insert.append((
-                    str(row.get('model', '')).strip(),
-                    row.get('year'),
-                    row.get('price'),
-                    str(row.get('transmission', '')).strip(),
-                    row.get('mileage'),
-                    str(row.get('fuelType', '')).strip(),
-                    row.get('tax'),
-                    row.get('mpg'),
-                    row.get('engineSize'),
-                    csv_path,
-                    current_hash
-                ))
+    @staticmethod
+    def _validate_staging(cur, staging: str, csv_path: str, expected_rows: int):
+        # Kiểm tra trên staging trước khi publish: đủ số dòng và mọi dòng đều thuộc đúng file
+        cur.execute(f"""
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE src_file IS DISTINCT FROM %s)
+            FROM {staging};
+        """, (csv_path,))
+        rows, foreign = cur.fetchone()
+        if rows != expected_rows or foreign:
+            raise ValueError(f"Staging table {staging} failed validation: {rows} rows "
+                             f"(expected {expected_rows}), {foreign} rows from another file")
+
+    @staticmethod
+    def set_staging_hash(cur, staging: str, file_hash: str):
+        # Streaming file nén chưa có hash: các dòng raw được ghi vào staging với hash tạm, hash thật chỉ có
+        # sau khi đọc hết file nên được ghi lại trước khi publish (1 lượt UPDATE trong DB, không giải nén lại file)
+        cur.execute(f"UPDATE {staging} SET file_hash = %s;", (file_hash,))
+
+    @staticmethod
+    def publish_staging(csv_path: str, table_name: str, staging: str, file_hash: str, row_count: int,
+                        replace: bool, cur) -> dict:
+        # Publish staging vào bảng đích trong transaction của cur (người gọi commit):
+        # - Bảng partitioned: bỏ partition cũ rồi attach luôn staging làm partition mới (swap, không copy dữ liệu)
+        # - Bảng thường: xoá dữ liệu cũ + INSERT ... SELECT từ staging
+        # Người đọc chỉ thấy dữ liệu cũ hoặc dữ liệu mới đầy đủ, không có lúc file bị thiếu
+        # Trả về số dòng trùng bị bỏ khỏi staging của bảng clean theo từng loại ({} với bảng raw)
+        DBLoader._validate_staging(cur, staging, csv_path, row_count)
+        if replace:
+            DBLoader.delete_existing(csv_path, table_name, cur)
+        duplicates = {}
+        added = None
+        if table_name == TABLE_CLEAN:
+            # Claim key sau khi đã trả lại key cũ của file, dòng trùng bị xoá luôn trong staging
+            duplicates = Deduplicator.claim_staging(cur, csv_path, staging)
+            row_count -= sum(duplicates.values())
+            # Tổng hợp theo nhóm tính luôn trên staging (trước khi staging bị đổi tên / xoá)
+            added = AggregateTables.groups_from_table(cur, staging)
+
+        partition = DBLoader._partition_name(csv_path, table_name)
+        swap = False
+        if DBLoader.is_partitioned(table_name, cur):
+            cur.execute("SELECT to_regclass(%s) IS NULL;", (partition,))
+            swap = cur.fetchone()[0]
+
+        if swap:
+            # Partition phải là bảng logged; CHECK constraint khớp partition bound để ATTACH không phải quét lại bảng
+            cur.execute(f"ALTER TABLE {staging} SET LOGGED;")
+            cur.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_src_file "
+                        f"CHECK (src_file IS NOT NULL AND src_file = %s);", (csv_path,))
+            cur.execute(f"ALTER TABLE {table_name} ATTACH PARTITION {staging} FOR VALUES IN (%s);", (csv_path,))
+            cur.execute(f"ALTER TABLE {staging} RENAME TO {partition};")
+            logger.info(f"Swapped {staging} in as partition {partition} of {table_name}")
+        else:
+            DBLoader.ensure_partition(csv_path, table_name, cur)
+            columns = ', '.join(RAW_DB_COLUMNS if table_name == TABLE_RAW else CLEAN_DB_COLUMNS)
+            cur.execute(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {staging};")
+            cur.execute(f"DROP TABLE {staging};")
+            logger.info(f"Published {row_count} rows from {staging} to {table_name}")
+        if added is not None:
+            AggregateTables.apply_added(cur, added)
+        DBLoader.finish_manifest(csv_path, table_name, file_hash, row_count, cur)
+        return duplicates
+
+    @staticmethod
+    def finish_manifest(csv_path: str, table_name: str, file_hash: str, row_count: int, cur=None):
+        # Đánh dấu file đã load xong vào bảng, gọi trong cùng transaction với lần ghi cuối cùng
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                DBLoader.finish_manifest(csv_path, table_name, file_hash, row_count, own_cur)
+            return
+        DBLoader._upsert_manifest(cur, csv_path, table_name, file_hash, row_count, 'loaded')
+
+    @staticmethod
+    def start_manifest(csv_path: str, tables, cur=None):
+        # Đánh dấu bắt đầu load (status 'loading', started_at), gọi với cur=None để commit ngay trong transaction
+        # riêng, nhìn thấy được trong lúc đang load. Hash / số dòng / loaded_at giữ nguyên của lần load thành công
+        # gần nhất: mọi lần load đều ghi trong 1 transaction nên tới lúc xong dữ liệu trong bảng vẫn là của lần đó
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                DBLoader.start_manifest(csv_path, tables, own_cur)
+            return
+        for table in tables:
+            DBLoader._upsert_manifest(cur, csv_path, table, '', 0, 'loading')
+
+    @staticmethod
+    def fail_manifest(csv_path: str, tables):
+        # Đánh dấu load lỗi (status 'failed'), gọi sau khi transaction load đã rollback
+        # Ghi lỗi (vd mất kết nối DB, cũng chính là nguyên nhân load lỗi) thì chỉ log lại, không che lỗi gốc
+        try:
             with DBManager.get_cursor() as cur:
-                cur.executemany(f"""
-                    INSERT INTO {TABLE_RAW} (model, year, price, transmission, mileage, fuel_type, 
-                        tax, mpg, engine_size, src_file, file_hash)
-                    VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, data_to_insert)
+                for table in tables:
+                    DBLoader._upsert_manifest(cur, csv_path, table, '', 0, 'failed')
+        except Exception as e:
+            logger.warning(f"Failed to mark {csv_path} as failed in {TABLE_MANIFEST}: {e}")
+
+    @staticmethod
+    def _upsert_manifest(cur, csv_path: str, table_name: str, file_hash: str, row_count: int, status: str):
+        # 'loaded': ghi hash / số dòng / loaded_at của lần load vừa xong
+        # 'loading' / 'failed': chỉ đổi status ('loading' thì cả started_at), file chưa load lần nào thì hash rỗng
+        cur.execute(f"""
+            INSERT INTO {TABLE_MANIFEST} (src_file, table_name, file_hash, row_count, status, started_at, loaded_at)
+            VALUES (%s, %s, %s, %s, %s, NOW(), CASE WHEN %s = 'loaded' THEN NOW() END)
+            ON CONFLICT (src_file, table_name) DO UPDATE SET
+                file_hash = CASE WHEN EXCLUDED.status = 'loaded'
+                                 THEN EXCLUDED.file_hash ELSE {TABLE_MANIFEST}.file_hash END,
+                row_count = CASE WHEN EXCLUDED.status = 'loaded'
+                                 THEN EXCLUDED.row_count ELSE {TABLE_MANIFEST}.row_count END,
+                status = EXCLUDED.status,
+                started_at = CASE WHEN EXCLUDED.status = 'loading'
+                                  THEN EXCLUDED.started_at ELSE {TABLE_MANIFEST}.started_at END,
+                loaded_at = CASE WHEN EXCLUDED.status = 'loaded'
+                                 THEN EXCLUDED.loaded_at ELSE {TABLE_MANIFEST}.loaded_at END
+        """, (csv_path, table_name, file_hash, row_count, status, status))
+
+    @staticmethod
+    def is_file_loaded(csv_path: str, file_hash: str) -> bool:
+        # True nếu cả bảng raw và clean đều đã load xong đúng phiên bản file này
+        # Chỉ đọc 2 dòng trong manifest theo primary key, dùng để bỏ qua cả bước extract + clean
+        with DBManager.get_cursor() as cur:
+            cur.execute(f"""
+                SELECT COUNT(*)
+                FROM {TABLE_MANIFEST}
+                WHERE src_file = %s AND table_name IN (%s, %s)
+                  AND status = 'loaded' AND file_hash = %s;
+            """, (csv_path, TABLE_RAW, TABLE_CLEAN, file_hash))
+            return cur.fetchone()[0] == 2
+
+    @staticmethod
+    def _delta_plan(cur, csv_path: str, table_name: str, frame: pd.DataFrame) -> dict | None:
+        # So row_hash của frame mới với các dòng đang có của file trong bảng (so theo số lần xuất hiện,
+        # vì file có thể có nhiều dòng giống hệt nhau), trả về None nếu nên thay cả file:
+        # - dữ liệu cũ có dòng chưa có row_hash (load từ phiên bản cũ)
+        # - số dòng thay đổi vượt DELTA_MAX_CHANGE_RATIO, thay cả file qua staging sẽ rẻ hơn
+        cur.execute(f"""
+            SELECT row_hash, COUNT(*)
+            FROM {table_name}
+            WHERE src_file = %s
+            GROUP BY row_hash;
+        """, (csv_path,))
+        old_counts = dict(cur.fetchall())
+        if None in old_counts:
+            logger.info(f"{table_name} has rows without row_hash for {csv_path}, delta load not possible")
+            return None
+
+        hashes = frame['row_hash']
+        # Lần xuất hiện thứ k (đếm từ 0) của 1 hash là dòng mới nếu dữ liệu cũ có <= k dòng cùng hash
+        occurrence = hashes.groupby(hashes).cumcount().to_numpy()
+        insert_mask = occurrence >= hashes.map(old_counts).fillna(0).to_numpy(dtype='int64')
+        old = pd.Series(old_counts, dtype='int64')
+        surplus = old - hashes.value_counts().reindex(old.index, fill_value=0)
+        surplus = surplus[surplus > 0]
+
+        plan = {'inserted': int(insert_mask.sum()), 'deleted': int(surplus.sum())}
+        plan['unchanged'] = len(frame) - plan['inserted']
+        if plan['inserted'] + plan['deleted'] > DELTA_MAX_CHANGE_RATIO * max(len(frame), 1):
+            logger.info(f"{csv_path} changed {plan['inserted']} inserted / {plan['deleted']} deleted rows "
+                        f"in {table_name}, replacing the whole file instead of delta load")
+            return None
+        plan['insert_frame'] = frame[insert_mask]
+        plan['delete_counts'] = surplus
+        return plan
+
+    @staticmethod
+    def _apply_delta(cur, csv_path: str, table_name: str, plan: dict, load_strategy: str = DEFAULT_LOAD_STRATEGY) -> int:
+        # Xoá đúng số dòng thừa của từng hash (ROW_NUMBER để chỉ xoá n dòng trong các dòng trùng nhau)
+        # rồi ghi thêm các dòng mới, chạy trong transaction của cur
+        # Trả về số dòng mới bị bỏ vì file khác vừa claim key (bảng clean)
+        surplus = plan['delete_counts']
+        # Bảng clean trả về các dòng vừa xoá (chỉ vài dòng) để trừ khỏi bảng tổng hợp và trả lại key
+        returning = "RETURNING model, year, fuel_type, price, mileage, row_hash" if table_name == TABLE_CLEAN else ""
+        if len(surplus):
+            cur.execute(f"""
+                DELETE FROM {table_name}
+                WHERE src_file = %s AND ctid IN (
+                    SELECT x.ctid
+                    FROM (
+                        SELECT ctid, row_hash, ROW_NUMBER() OVER (PARTITION BY row_hash) AS rn
+                        FROM {table_name}
+                        WHERE src_file = %s AND row_hash = ANY(%s)
+                    ) x
+                    JOIN UNNEST(%s::BIGINT[], %s::BIGINT[]) AS d(row_hash, n) ON x.row_hash = d.row_hash
+                    WHERE x.rn <= d.n)
+                {returning};
+            """, (csv_path, csv_path, surplus.index.tolist(), surplus.index.tolist(), surplus.tolist()))
+            if returning:
+                deleted = pd.DataFrame(cur.fetchall(),
+                                       columns=['model', 'year', 'fuel_type', 'price', 'mileage', 'row_hash'])
+                AggregateTables.apply_removed(cur, AggregateTables.groups_from_frame(deleted))
+                Deduplicator.release(cur, csv_path, deleted['row_hash'].unique().tolist())
+        lost = 0
+        if table_name == TABLE_CLEAN:
+            plan['insert_frame'], lost = Deduplicator.claim(cur, csv_path, plan['insert_frame'])
+            plan['inserted'] -= lost
+        if len(plan['insert_frame']):
+            DBLoader.write_frame(cur, plan['insert_frame'], table_name, load_strategy)
+            if table_name == TABLE_CLEAN:
+                AggregateTables.apply_added(cur, AggregateTables.groups_from_frame(plan['insert_frame']))
+        logger.info(f"Delta load {csv_path} to {table_name}: {plan['inserted']} inserted, "
+                    f"{plan['deleted']} deleted, {plan['unchanged']} unchanged")
+        return lost
+
+    @staticmethod
+    def _load_tables(csv_path: str, file_hash: str, frames: dict, skip_if_exist: bool = True,
+                     load_strategy: str = DEFAULT_LOAD_STRATEGY, profile: dict | None = None) -> dict | None:
+        # frames: {tên bảng: hàm dựng frame}, frame chỉ được dựng khi bảng đó thật sự cần load
+        # Trả về {tên bảng: {'mode', 'rows', 'inserted', 'deleted', 'unchanged'}} của các bảng đã load,
+        # None nếu mọi bảng đều bỏ qua
+        # - Load lần đầu: ghi thẳng vào bảng đích
+        # - Load lại (DELTA_RELOADS): chỉ insert / xoá các dòng khác nhau theo row_hash
+        # - Load lại mà thay đổi nhiều (STAGED_RELOADS): ghi vào staging trước rồi publish
+        # Bảng clean: dòng đã có trong warehouse từ file khác bị bỏ trước khi so delta / ghi (Deduplicator),
+        # số dòng bị bỏ nằm trong 'duplicates' của bảng clean, profile được tính lại trên các dòng đã ghi
+        # và trả về trong 'profile' của bảng clean
+        # Mọi bảng + profile được commit trong 1 transaction cuối cùng
+        with DBManager.get_cursor() as cur:
+            states = {table: DBLoader.load_state(csv_path, table, file_hash, skip_if_exist, cur)
+                      for table in frames}
+        states = {table: state for table, state in states.items() if state != 'skip'}
+        if not states:
+            return None
+        DBLoader.start_manifest(csv_path, states)
+        try:
+            return DBLoader._write_tables(csv_path, file_hash, frames, states, load_strategy, profile)
+        except BaseException:
+            DBLoader.fail_manifest(csv_path, states)
+            raise
+
+    @staticmethod
+    def _write_tables(csv_path: str, file_hash: str, frames: dict, states: dict, load_strategy: str,
+                      profile: dict | None) -> dict:
+        # Phần ghi của _load_tables cho các bảng cần load (states: {bảng: 'new' / 'reload'})
+        built = {table: frames[table]() for table in states}
+
+        plans = {}
+        duplicates = {}
+        if TABLE_CLEAN in built or (DELTA_RELOADS and 'reload' in states.values()):
+            with DBManager.get_cursor() as cur:
+                if TABLE_CLEAN in built:
+                    built[TABLE_CLEAN], seen = Deduplicator.drop_seen(cur, csv_path, built[TABLE_CLEAN])
+                    duplicates = Deduplicator.merge_counts({IN_WAREHOUSE: seen})
+                for table, state in (states.items() if DELTA_RELOADS else ()):
+                    plan = DBLoader._delta_plan(cur, csv_path, table, built[table]) if state == 'reload' else None
+                    if plan is not None:
+                        plans[table] = plan
+
+        stats = {}
+        stagings = {}
+        try:
+            if STAGED_RELOADS:
+                for table, state in states.items():
+                    if state == 'reload' and table not in plans:
+                        stagings[table] = DBLoader.create_staging(csv_path, table)
+                        logger.info(f"Staging {csv_path} for {table} using '{load_strategy}'")
+                        DBLoader.write_staging(built[table], stagings[table], load_strategy)
+
+            with DBManager.get_cursor() as cur:
+                for table, state in states.items():
+                    rows = len(built[table])
+                    if table in plans:
+                        lost = DBLoader._apply_delta(cur, csv_path, table, plans[table], load_strategy)
+                        duplicates = Deduplicator.merge_counts(duplicates, {IN_WAREHOUSE: lost})
+                        rows -= lost
+                        stats[table] = {'mode': 'delta', 'rows': rows, 'inserted': plans[table]['inserted'],
+                                        'deleted': plans[table]['deleted'], 'unchanged': plans[table]['unchanged']}
+                        DBLoader.finish_manifest(csv_path, table, file_hash, rows, cur)
+                        continue
+                    if table in stagings:
+                        published = DBLoader.publish_staging(csv_path, table, stagings[table], file_hash, rows,
+                                                             True, cur)
+                        duplicates = Deduplicator.merge_counts(duplicates, published)
+                        rows -= sum(published.values())
+                    else:
+                        logger.info(f"Loading {csv_path} to {table} using '{load_strategy}'")
+                        if state == 'reload':
+                            DBLoader.delete_existing(csv_path, table, cur)
+                        DBLoader.ensure_partition(csv_path, table, cur)
+                        frame = built[table]
+                        if table == TABLE_CLEAN:
+                            # Claim sau khi đã trả lại key cũ của file (delete_existing)
+                            frame, lost = Deduplicator.claim(cur, csv_path, frame)
+                            duplicates = Deduplicator.merge_counts(duplicates, {IN_WAREHOUSE: lost})
+                            rows = len(frame)
+                        DBLoader.write_frame(cur, frame, table, load_strategy)
+                        if table == TABLE_CLEAN:
+                            AggregateTables.apply_added(cur, AggregateTables.groups_from_frame(frame))
+                        DBLoader.finish_manifest(csv_path, table, file_hash, rows, cur)
+                    stats[table] = {'mode': 'replace' if state == 'reload' else 'full', 'rows': rows,
+                                    'inserted': rows, 'deleted': None, 'unchanged': 0}
+                if TABLE_CLEAN in stats:
+                    stats[TABLE_CLEAN]['duplicates'] = duplicates
+                if profile is not None and TABLE_CLEAN in states:
+                    profile = Deduplicator.final_profile(cur, csv_path, profile, duplicates)
+                    stats[TABLE_CLEAN]['profile'] = profile
+                    DataProfiler.save_file_profile(csv_path, file_hash, profile, cur)
+            stagings = {}
+        finally:
+            # Publish lỗi thì transaction đã rollback, dữ liệu cũ còn nguyên, chỉ cần dọn staging
+            for staging in stagings.values():
+                DBLoader.drop_staging(staging)
+        return stats
+
+    @staticmethod
+    def load_to_raw_table(df:pd.DataFrame, csv_path:str, skip_if_exist:bool = True,
+                          load_strategy:str = DEFAULT_LOAD_STRATEGY, file_hash:str | None = None) -> dict | None:
+        # file_hash: truyền vào hash đã tính lúc extract để không phải đọc lại file
+        # Xoá dữ liệu cũ + insert + cập nhật manifest được publish trong 1 transaction
+        # Trả về số dòng inserted / deleted / unchanged, None nếu file đã load rồi
+        try:
+            current_hash = file_hash or cal_hash_file(csv_path)
+            # Sau khi xử lý các bước check hash rồi thì giờ insert vô thâu
+            stats = DBLoader._load_tables(
+                csv_path, current_hash,
+                {TABLE_RAW: lambda: DBLoader.prepare_raw_frame(df, csv_path, current_hash)},
+                skip_if_exist, load_strategy)
+            if stats is None:
+                return None
             logger.info(f"Successfully loaded raw data")
+            return stats[TABLE_RAW]
 
         except Exception as e:
             logger.exception(f"Load raw failed: {e}")
             raise
     
     @staticmethod
-    def load_to_clean_table(df: pd.DataFrame, csv_file:str, skip_if_exist:bool=True):
+    def load_to_clean_table(df: pd.DataFrame, csv_file:str, skip_if_exist:bool=True,
+                            load_strategy:str = DEFAULT_LOAD_STRATEGY, file_hash:str | None = None,
+                            profile: dict | None = None) -> dict | None:
+        # profile: profile tính lúc transform, được tính lại nếu có dòng trùng bị bỏ và lưu cùng transaction
         try:
-            current_hash = cal_hash_file(csv_file)
-            existed, old_hash = check_data_exist(csv_file, TABLE_CLEAN)
-            
-            if existed and skip_if_exist:
-                if current_hash == old_hash:
-                    logger.info(f"Cleaned data from {csv_file} already exists. Skipping.")
-                    return
-                DBLoader.delete_existing(csv_file, TABLE_CLEAN)
-            
-            data_to_load = []
-            for _, row in df.iterrows():
-                data_to_load.append((
-                    row['model'],
-                    int(row['year']),
-                    int(row['price']),
-                    row['transmission'],
-                    int(row['mileage']),
-                    row['fuel_type'],
-                    int(row['tax']),
-                    float(row['mpg']),
-                    float(row['engine_size']),
-                    csv_file
-                ))
-            
-            with DBManager.get_cursor() as cur:
-                cur.executemany(f"""
-                    INSERT INTO {TABLE_CLEAN}
-                    (model, year, price, transmission, mileage, fuel_type, tax, mpg, engine_size, src_file)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, data_to_load)
-                logger.info(f"Successfully loaded clean data")
+            current_hash = file_hash or cal_hash_file(csv_file)
+            stats = DBLoader._load_tables(
+                csv_file, current_hash,
+                {TABLE_CLEAN: lambda: DBLoader.prepare_clean_frame(df, csv_file)},
+                skip_if_exist, load_strategy, profile)
+            if stats is None:
+                return None
+            logger.info(f"Successfully loaded clean data")
+            return stats[TABLE_CLEAN]
 
         except Exception as e:
             logger.exception(f"Load clean failed: {e}")
             raise
-    
 
+    @staticmethod
+    def load_file(df_raw: pd.DataFrame, df_clean: pd.DataFrame, csv_path: str, file_hash: str,
+                  skip_if_exist: bool = True, load_strategy: str = DEFAULT_LOAD_STRATEGY,
+                  profile: dict | None = None) -> dict:
+        # Load raw + clean của 1 file, dữ liệu của cả 2 bảng được publish trong 1 transaction duy nhất
+        # Dùng cho chế độ nhiều file: file nào lỗi thì rollback riêng file đó, không ảnh hưởng file khác
+        # profile: profile tính lúc transform, được lưu cùng transaction với dữ liệu clean
+        stats = DBLoader._load_tables(csv_path, file_hash, {
+            TABLE_RAW: lambda: DBLoader.prepare_raw_frame(df_raw, csv_path, file_hash),
+            TABLE_CLEAN: lambda: DBLoader.prepare_clean_frame(df_clean, csv_path),
+        }, skip_if_exist, load_strategy, profile) or {}
+        raw_rows = stats[TABLE_RAW]['rows'] if TABLE_RAW in stats else 0
+        clean_rows = stats[TABLE_CLEAN]['rows'] if TABLE_CLEAN in stats else 0
+        status = 'loaded' if stats else 'skipped'
+        logger.info(f"File {csv_path} {status}: {raw_rows} raw rows, {clean_rows} clean rows")
+        file_report = {'src_file': csv_path, 'status': status, 'raw_rows': raw_rows, 'clean_rows': clean_rows}
+        if stats:
+            # Số dòng inserted / deleted / unchanged của từng bảng (load delta chỉ ghi phần thay đổi)
+            file_report['tables'] = stats
+        if TABLE_CLEAN in stats and 'profile' in stats[TABLE_CLEAN]:
+            file_report['profile'] = DataProfiler.summarize(stats[TABLE_CLEAN].pop('profile'))
+        elif profile is not None:
+            file_report['profile'] = DataProfiler.summarize(profile)
+        return file_report
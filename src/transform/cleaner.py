@@ -1,7 +1,9 @@
 import pandas as pd
 from config.log_config import logger_config
 from src.transform.validate import check_validate_dataframe, cal_hash_file, check_data_exist, check_validate_csv
-from config.constants import REQUIRED_COLUMNS, COLUMNS_MAPPING, DATA_TYPES
+from src.transform.rule_engine import RuleEngine
+from config.constants import (REQUIRED_COLUMNS, COLUMNS_MAPPING, DATA_TYPES, TEXT_COLUMNS, NULL_DROP_COLUMNS,
+                              NULL_FILL_VALUES, RANGE_RULES)
 
 logger = logger_config('src.transform.cleaner')
 # Đây là nơi sẽ chứa các hàm để làm sạch dữ liệu
@@ -11,6 +13,27 @@ class DataCleaner:
     #  Phương thức tĩnh để làm sạch dữ liệu trong DataFrame
     @staticmethod
     def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+        df_clean, _ = DataCleaner.clean_data_with_report(df)
+        return df_clean
+
+    # Giống clean_data nhưng trả thêm số dòng bị loại theo từng rule
+    @staticmethod
+    def clean_data_with_report(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+        # Toàn bộ rule (ép kiểu, null, business rule) khai báo trong config/constants.py
+        # và được RuleEngine gộp thành 1 mask, áp 1 lần duy nhất
+        try:
+            logger.info("Starting data cleaning process.")
+            df_clean, rejections = RuleEngine.apply(df)
+            logger.info("Data cleaning process completed successfully.")
+            return df_clean, rejections
+        except Exception as e:
+            logger.exception(f"An error occurred during data cleaning: {e}")
+            raise
+
+    # Cách clean cũ từng bước, mỗi bước tạo 1 DataFrame mới
+    # Giữ lại để đối chiếu kết quả và làm baseline cho benchmark (benchmarks/bench_cleaner.py)
+    @staticmethod
+    def clean_data_stepwise(df: pd.DataFrame) -> pd.DataFrame:
         # Step by step các bước làm sạch dữ liệu:
         # Đổi tên cột theo COLUMNS_MAPPING
         # Đổi kiểu dữ liệu theo DATA_TYPES
@@ -62,8 +85,7 @@ class DataCleaner:
     
     @staticmethod
     def _clean_text_columns(df: pd.DataFrame) -> pd.DataFrame:
-        text_cols = ['model', 'transmission', 'fuel_type']
-        for col in text_cols:
+        for col in TEXT_COLUMNS:
             if col in df.columns:
                 df[col] = df[col].str.strip().str.lower()
         return df
@@ -72,25 +94,22 @@ class DataCleaner:
     def _handle_nulls(df: pd.DataFrame) -> pd.DataFrame:
 
         # Drop rows with nulls in critical columns FIRST
-        critical_cols = ['model', 'year', 'price']  # ✅ Dùng tên sau khi rename
-        df = df.dropna(subset=critical_cols)
+        df = df.dropna(subset=NULL_DROP_COLUMNS)  # ✅ Dùng tên sau khi rename
     
 
-        # Fill null for numerical columns with median
-        num_cols = ['mileage', 'tax', 'mpg', 'engine_size']
-        for col in num_cols:
+        # Fill null for numerical columns with default value
+        for col, value in NULL_FILL_VALUES.items():
             if col in df.columns:
-                df[col] = df[col].fillna(0)
-                logger.info(f"Filled null values in {col} with 0.")
+                df[col] = df[col].fillna(value)
+                logger.info(f"Filled null values in {col} with {value}.")
         # Drop rows with nulls in required columns
         logger.info(f"Handled null values. Remaining records: {len(df)}.")
         return df
     
     @staticmethod
     def _apply_business_rules(df: pd.DataFrame) -> pd.DataFrame:
-        # Filter out records with price <= 0
-        df = df[df['price'] > 0]
-        df = df[df['year'] >= 2014]
-        df = df[df['mileage'] >= 0]
+        # Mỗi rule 1 lần filter, mỗi lần tạo 1 DataFrame mới
+        for _, col, op, threshold in RANGE_RULES:
+            df = df[RuleEngine.rule_mask(df[col], op, threshold)]
         logger.info(f"Applied business rules. Remaining records after filtering: {len(df)}.")
         return df
\ No newline at end of file
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+from config.log_config import logger_config
+from config.constants import TABLE_CLEAN, TABLE_DEDUP_KEYS, CLEAN_DB_COLUMNS, DEDUP_ENABLED
+from src.utils.db_manager import DBManager
+from src.utils.data_profiler import DataProfiler
+
+logger = logger_config('src.transform.dedup')
+
+# Đây là nơi loại các listing trùng trước khi ghi vào bảng clean
+# Các file export của dealer chồng lấn nhau nên 1 chiếc xe có thể xuất hiện trong nhiều file
+# Key của 1 listing là hash 64-bit trên các cột nghiệp vụ (chính là row_hash của bảng clean), tính vector hoá
+# - Trùng trong cùng 1 file: bỏ ngay ở bước transform (drop_in_file), không cần DB
+# - Trùng với file khác: tra bảng dedup_keys (key_hash -> file sở hữu), mỗi chunk 1 query dạng JOIN UNNEST
+# - Lúc ghi vào bảng clean, key được claim trong cùng transaction (INSERT ... ON CONFLICT ... RETURNING)
+#   nên 2 file chồng lấn load song song cũng chỉ có 1 file ghi được listing đó
+# - Xoá / load lại 1 file thì key của file đó được trả lại (release_file / release)
+# Bảng raw giữ nguyên mọi dòng của file gốc (lineage, load delta), chỉ bảng clean được dedup
+# Số dòng bị loại được ghi vào rejections của profile: 'duplicate_in_file' và 'duplicate_in_warehouse'
+# Dòng bị bỏ lúc load thì profile của file được tính lại trên đúng các dòng đã ghi (final_profile)
+
+KEY_COLUMNS = [col for col in CLEAN_DB_COLUMNS if col not in ('src_file', 'row_hash')]
+IN_FILE = 'duplicate_in_file'
+IN_WAREHOUSE = 'duplicate_in_warehouse'
+
+
+class Deduplicator:
+
+    @staticmethod
+    def create_table(cur):
+        # Tạo bảng key, lần đầu tạo mà bảng clean đã có dữ liệu thì mỗi key thuộc về file load sớm nhất
+        cur.execute("SELECT to_regclass(%s) IS NULL;", (TABLE_DEDUP_KEYS,))
+        is_new = cur.fetchone()[0]
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_DEDUP_KEYS}(
+                key_hash BIGINT PRIMARY KEY,
+                src_file TEXT NOT NULL,
+                first_seen TIMESTAMP DEFAULT NOW());
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_DEDUP_KEYS}_src_file ON {TABLE_DEDUP_KEYS} (src_file);")
+        if is_new:
+            cur.execute(f"""
+                INSERT INTO {TABLE_DEDUP_KEYS} (key_hash, src_file)
+                SELECT DISTINCT ON (row_hash) row_hash, src_file
+                FROM {TABLE_CLEAN}
+                WHERE row_hash IS NOT NULL
+                ORDER BY row_hash, ingest_at;
+            """)
+            logger.info(f"Dedup key table seeded with {cur.rowcount} keys from {TABLE_CLEAN}")
+
+    @staticmethod
+    def key_hash(df: pd.DataFrame) -> pd.Series:
+        return pd.util.hash_pandas_object(df[KEY_COLUMNS], index=False)
+
+    @staticmethod
+    def drop_in_file(df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+        # Bỏ các dòng trùng trong cùng 1 frame (sau clean), giữ lần xuất hiện đầu tiên
+        if not DEDUP_ENABLED or df.empty:
+            return df, 0
+        duplicated = Deduplicator.key_hash(df).duplicated().to_numpy()
+        count = int(duplicated.sum())
+        return (df[~duplicated] if count else df), count
+
+    @staticmethod
+    def drop_seen(cur, csv_path: str, frame: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+        # frame đúng cột bảng clean, bỏ các dòng có key đã thuộc về file khác, 1 query cho cả frame
+        # Chỉ đọc: key chưa được claim ở đây, lúc publish mới claim (claim / claim_staging)
+        # cur: None thì tự lấy cursor riêng
+        if not DEDUP_ENABLED or frame.empty:
+            return frame, 0
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                return Deduplicator.drop_seen(own_cur, csv_path, frame)
+        keys = frame['row_hash'].to_numpy()
+        cur.execute(f"""
+            SELECT k.key_hash
+            FROM UNNEST(%s::BIGINT[]) AS k(key_hash)
+            JOIN {TABLE_DEDUP_KEYS} d ON d.key_hash = k.key_hash
+            WHERE d.src_file <> %s;
+        """, (np.unique(keys).tolist(), csv_path))
+        seen = np.fromiter((row[0] for row in cur.fetchall()), dtype='int64')
+        if not len(seen):
+            return frame, 0
+        mask = np.isin(keys, seen)
+        return frame[~mask], int(mask.sum())
+
+    @staticmethod
+    def claim(cur, csv_path: str, frame: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+        # Claim key của các dòng sắp ghi vào bảng clean, gọi trong transaction ghi dữ liệu
+        # Key đã thuộc về file khác (kể cả file vừa commit song song) thì không được trả về, dòng đó bị bỏ
+        # Key đưa vào theo thứ tự tăng dần để 2 transaction khoá key theo cùng thứ tự, không deadlock
+        if not DEDUP_ENABLED or frame.empty:
+            return frame, 0
+        keys = frame['row_hash'].to_numpy()
+        cur.execute(f"""
+            INSERT INTO {TABLE_DEDUP_KEYS} AS d (key_hash, src_file)
+            SELECT key_hash, %s FROM UNNEST(%s::BIGINT[]) AS k(key_hash) ORDER BY key_hash
+            ON CONFLICT (key_hash) DO UPDATE SET src_file = EXCLUDED.src_file
+                WHERE d.src_file = EXCLUDED.src_file
+            RETURNING key_hash;
+        """, (csv_path, np.unique(keys).tolist()))
+        claimed = np.fromiter((row[0] for row in cur.fetchall()), dtype='int64')
+        mask = np.isin(keys, claimed)
+        lost = len(frame) - int(mask.sum())
+        if lost:
+            logger.info(f"{csv_path}: {lost} rows already loaded from another file, skipped")
+        return (frame[mask] if lost else frame), lost
+
+    @staticmethod
+    def claim_staging(cur, csv_path: str, staging: str) -> dict:
+        # Giống claim nhưng chạy hết trên server với bảng staging của bảng clean (chế độ streaming)
+        # Mỗi chunk đã được drop_in_file + drop_seen, ở đây chỉ còn:
+        # - dòng trùng giữa các chunk của cùng file
+        # - dòng có key bị file khác claim trong lúc đang ghi staging
+        if not DEDUP_ENABLED:
+            return {}
+        cur.execute(f"""
+            DELETE FROM {staging} a
+            USING {staging} b
+            WHERE a.row_hash = b.row_hash AND a.ctid > b.ctid;
+        """)
+        in_file = cur.rowcount
+        cur.execute(f"""
+            WITH claimed AS (
+                INSERT INTO {TABLE_DEDUP_KEYS} AS d (key_hash, src_file)
+                SELECT row_hash, %s FROM {staging} ORDER BY row_hash
+                ON CONFLICT (key_hash) DO UPDATE SET src_file = EXCLUDED.src_file
+                    WHERE d.src_file = EXCLUDED.src_file
+                RETURNING key_hash)
+            DELETE FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM claimed c WHERE c.key_hash = s.row_hash);
+        """, (csv_path,))
+        return {IN_FILE: in_file, IN_WAREHOUSE: cur.rowcount}
+
+    @staticmethod
+    def release_file(cur, csv_path: str):
+        # Trả lại mọi key của file (file bị xoá / thay cả file), gọi trong cùng transaction với lần xoá
+        if DEDUP_ENABLED:
+            cur.execute(f"DELETE FROM {TABLE_DEDUP_KEYS} WHERE src_file = %s;", (csv_path,))
+
+    @staticmethod
+    def release(cur, csv_path: str, keys: list):
+        # Trả lại key của các dòng vừa bị xoá khi load delta, trừ key vẫn còn dòng khác của file trong bảng clean
+        if not DEDUP_ENABLED or not keys:
+            return
+        cur.execute(f"""
+            DELETE FROM {TABLE_DEDUP_KEYS} d
+            WHERE d.src_file = %s AND d.key_hash = ANY(%s)
+              AND NOT EXISTS (SELECT 1 FROM {TABLE_CLEAN} c WHERE c.src_file = d.src_file AND c.row_hash = d.key_hash);
+        """, (csv_path, keys))
+
+    @staticmethod
+    def merge_counts(*counts: dict) -> dict:
+        merged = {}
+        for count in counts:
+            for rule, n in count.items():
+                if n:
+                    merged[rule] = merged.get(rule, 0) + int(n)
+        return merged
+
+    @staticmethod
+    def final_profile(cur, csv_path: str, profile: dict, duplicates: dict) -> dict:
+        # Gọi trong transaction ghi bảng clean, sau khi đã claim key
+        # Không có dòng nào bị bỏ lúc load thì profile lúc transform đã đúng, trả về nguyên profile đó
+        # Có dòng bị bỏ thì giá / model / năm / histogram phải tính lại, không chỉ trừ số dòng:
+        # tính lại trên các dòng của file đang có trong bảng clean (profile cũ không bị sửa)
+        if not sum(duplicates.values()):
+            return profile
+        rejections = Deduplicator.merge_counts(profile['rejections'], duplicates)
+        return DataProfiler.profile_loaded_file(cur, csv_path, profile['raw_record'], rejections)
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype, is_float_dtype
+from config.log_config import logger_config
+from config.constants import (COLUMNS_MAPPING, DATA_TYPES, TEXT_COLUMNS, NULL_DROP_COLUMNS,
+                              NULL_FILL_VALUES, RANGE_RULES)
+
+logger = logger_config('src.transform.rule_engine')
+
+# Đây là rule engine cho bước clean: toàn bộ rule được khai báo trong config/constants.py
+# Thay vì mỗi bước filter tạo ra 1 DataFrame mới, engine:
+# 1. Đổi tên + ép kiểu + làm sạch text + điền null theo từng cột (mỗi cột chỉ xử lý 1 lần)
+# 2. Gộp mọi rule (null + range) thành 1 mask NumPy duy nhất
+# 3. Áp mask 1 lần ở cuối, đồng thời đếm số dòng bị loại bởi từng rule
+
+_OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+
+class RuleEngine:
+
+    @staticmethod
+    def _coerce_column(name: str, series: pd.Series) -> pd.Series:
+        # Cột đã được ExtractorCSV đọc đúng kiểu (Int16 / Int32 / float32) thì giữ nguyên, không ép kiểu lại
+        dtype = DATA_TYPES.get(name)
+        if dtype in ['Int64', 'int'] and not is_integer_dtype(series):
+            series = pd.to_numeric(series, errors='coerce').astype('Int64')
+        elif dtype == 'float' and not is_float_dtype(series):
+            series = pd.to_numeric(series, errors='coerce')
+        if name in TEXT_COLUMNS:
+            series = RuleEngine._clean_text(series)
+        if name in NULL_FILL_VALUES:
+            series = series.fillna(NULL_FILL_VALUES[name])
+        return series
+
+    @staticmethod
+    def _clean_text(series: pd.Series) -> pd.Series:
+        # strip + lower. Với cột category chỉ xử lý trên tập category (vài chục giá trị) thay vì từng dòng
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            return series.str.strip().str.lower()
+        cleaned = series.cat.categories.str.strip().str.lower()
+        # Nhiều category có thể gộp về cùng 1 giá trị (' X5' và 'x5'), nên tính lại codes thay vì rename
+        categories, inverse = np.unique(np.asarray(cleaned, dtype=object), return_inverse=True)
+        codes = series.cat.codes.to_numpy()
+        new_codes = np.where(codes >= 0, inverse[codes], -1)
+        return pd.Series(pd.Categorical.from_codes(new_codes, categories), index=series.index, name=series.name)
+
+    @staticmethod
+    def rule_mask(series: pd.Series, op: str, threshold) -> np.ndarray:
+        if op not in _OPERATORS:
+            raise ValueError(f"Unsupported rule operator: {op}")
+        # NA -> NaN để mọi phép so sánh với NA đều trả về False (dòng bị loại)
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        return _OPERATORS[op](values, threshold)
+
+    @staticmethod
+    def apply(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+        # Trả về (DataFrame đã clean, {tên rule: số dòng bị loại bởi rule đó})
+        # Mỗi dòng chỉ được tính cho rule đầu tiên nó vi phạm, nên tổng các count = tổng số dòng bị loại
+        columns = {}
+        for col in df.columns:
+            name = COLUMNS_MAPPING.get(col, col)
+            columns[name] = RuleEngine._coerce_column(name, df[col])
+        out = pd.DataFrame(columns, index=df.index)
+
+        keep = np.ones(len(out), dtype=bool)
+        rejections = {}
+        for col in NULL_DROP_COLUMNS:
+            passed = out[col].notna().to_numpy()
+            rejections[f'not_null_{col}'] = int(np.count_nonzero(keep & ~passed))
+            keep &= passed
+        for rule_name, col, op, threshold in RANGE_RULES:
+            passed = RuleEngine.rule_mask(out[col], op, threshold)
+            rejections[rule_name] = int(np.count_nonzero(keep & ~passed))
+            keep &= passed
+
+        # Chỉ copy dữ liệu 1 lần khi áp mask, không phụ thuộc số lượng rule
+        if not keep.all():
+            out = out[keep]
+        logger.info(f"Applied {len(NULL_DROP_COLUMNS) + len(RANGE_RULES)} rules in one pass. "
+                    f"Remaining records: {len(out)}. Rejections: {rejections}")
+        return out, rejections
@@ -1,10 +1,12 @@
 import pandas as pd
 from config.log_config import logger_config
-import psycopg2 as ps
-import hashlib as hl
-from config.config import DB_CONFIG
+from config.constants import (TABLE_MANIFEST, VALIDATION_COLUMNS, VALIDATION_DTYPES, VALIDATION_RANGE_RULES,
+                              VALIDATION_SAMPLE_THRESHOLD, VALIDATION_SAMPLE_SIZE)
 from pandas.api.types import is_integer_dtype, is_float_dtype, is_string_dtype
 from pathlib import Path
+from src.transform.rule_engine import RuleEngine
+from src.utils.fingerprint import file_fingerprint
+from src.utils.db_manager import DBManager
 
 # Đây là nơi sẽ chứa các hàm để validate dữ liệu, nó sẽ khác với cleaner ở chỗ cleaner là để làm sạch dữ liệu
 # Còn validate là để kiểm tra dữ liệu đã sạch hay chưa, có hợp lệ để load vào DB hay không
@@ -29,78 +31,95 @@ def check_validate_csv(df:pd.DataFrame, requirements_column: list) -> bool:
 
     return True
 
+def validate_dataframe(df: pd.DataFrame, sample_size: int | None = None) -> dict:
+    # Validate DataFrame trước khi load vào bảng clean_bmw_sales, trả về report đủ mọi vi phạm thay vì dừng ở lỗi đầu tiên
+    # - null: đếm cho mọi cột trong 1 lần isna() trên cả block
+    # - dtype: chỉ xem metadata của cột, không quét dữ liệu
+    # - range: mỗi rule 1 phép so sánh vector hoá trên NumPy
+    # sample_size: chỉ kiểm tra mẫu ngẫu nhiên bấy nhiêu dòng (None = tự bật khi frame > VALIDATION_SAMPLE_THRESHOLD)
+    # Ở chế độ mẫu, số vi phạm là số đếm trên mẫu, kèm 'estimated' là số ước lượng cho cả frame
+    total_rows = len(df)
+    if sample_size is None and total_rows > VALIDATION_SAMPLE_THRESHOLD:
+        sample_size = VALIDATION_SAMPLE_SIZE
+    sampled = sample_size is not None and sample_size < total_rows
+    checked = df.sample(n=sample_size, random_state=0) if sampled else df
+
+    report = {'rows': total_rows, 'checked_rows': len(checked), 'sampled': sampled,
+              'missing_columns': sorted(set(VALIDATION_COLUMNS) - set(df.columns)), 'violations': {}}
+    columns = [col for col in VALIDATION_COLUMNS if col in df.columns]
+
+    def add(col: str, rule: str, count: int):
+        if count:
+            report['violations'].setdefault(col, {})[rule] = int(count)
+
+    null_counts = checked[columns].isna().to_numpy().sum(axis=0)
+    for col, count in zip(columns, null_counts):
+        add(col, 'null', count)
+
+    for col in columns:
+        expected = VALIDATION_DTYPES[col]
+        dtype = df[col].dtype
+        ok = (is_integer_dtype(dtype) if expected == 'int'
+              else is_float_dtype(dtype) if expected == 'float'
+              else is_string_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype))
+        if not ok:
+            add(col, f'dtype:{expected}', len(df))
+
+    for name, col, op, threshold in VALIDATION_RANGE_RULES:
+        if col in columns:
+            # NA không tính là vi phạm range vì đã được đếm ở rule null
+            series = checked[col]
+            add(col, name, (~RuleEngine.rule_mask(series, op, threshold) & series.notna().to_numpy()).sum())
+
+    if sampled and len(checked):
+        scale = total_rows / len(checked)
+        report['estimated'] = {col: {rule: round(count * scale) for rule, count in rules.items()
+                                     if not rule.startswith('dtype:')}
+                               for col, rules in report['violations'].items()}
+    report['empty'] = total_rows == 0
+    report['passed'] = not (report['missing_columns'] or report['violations'] or report['empty'])
+    return report
+
+
+def merge_validation_reports(reports: list[dict]) -> dict:
+    # Gộp report của nhiều chunk thành report của cả file
+    merged = {'rows': 0, 'checked_rows': 0, 'sampled': False, 'missing_columns': [], 'violations': {}}
+    for report in reports:
+        merged['rows'] += report['rows']
+        merged['checked_rows'] += report['checked_rows']
+        merged['sampled'] = merged['sampled'] or report['sampled']
+        merged['missing_columns'] = sorted(set(merged['missing_columns']) | set(report['missing_columns']))
+        for col, rules in report['violations'].items():
+            target = merged['violations'].setdefault(col, {})
+            for rule, count in rules.items():
+                target[rule] = target.get(rule, 0) + count
+    merged['empty'] = merged['rows'] == 0
+    merged['passed'] = not (merged['missing_columns'] or merged['violations'] or merged['empty'])
+    return merged
+
+
+def log_validation_report(report: dict, source: str = ''):
+    prefix = f"{source}: " if source else ""
+    if report['passed']:
+        logger.info(f"{prefix}DataFrame passed all validation checks ({report['checked_rows']}/{report['rows']} rows checked).")
+        return
+    if report['missing_columns']:
+        logger.error(f"{prefix}Missing required column: {set(report['missing_columns'])}")
+    if report['empty']:
+        logger.error(f"{prefix}DataFrame is empty after validation.")
+    for col, rules in report['violations'].items():
+        for rule, count in rules.items():
+            logger.error(f"{prefix}Column {col} violates '{rule}': {count} rows"
+                         f"{' (in sample)' if report['sampled'] else ''}.")
+
+
 # Tạo hàm check validate của dataframe trước khi load vào bảng clean_bmw_sales
 def check_validate_dataframe(df:pd.DataFrame) -> bool:
+    # Giữ lại để tương thích: chạy validate_dataframe, log mọi vi phạm và trả về True / False
     try:
-        # Check schema sau khi rename
-        required_column = {'model',
-                           'year',
-                           'price',
-                           'transmission',
-                           'mileage',
-                           'fuel_type',
-                           'tax',
-                           'mpg',
-                           'engine_size'}
-        missing_column = required_column - set(df.columns)
-        if missing_column:
-            logger.error(f"Missing required column: {missing_column}")
-            return False
-
-        # Check null cho các cột
-        for col in ['model',
-                    'year',
-                    'price',
-                    'transmission',
-                    'mileage',
-                    'fuel_type',
-                    'tax',
-                    'mpg',
-                    'engine_size']:
-            count_null = df[col].isnull().sum() # Dòng này để đếm số giá trị null trong từng cột
-            if count_null > 0:
-                logger.error(f"Column {col} has {count_null} null values.")
-                return False
-        
-        # Check data type
-        if not is_integer_dtype(df['year']):
-            logger.error("Column 'year' is not of integer type.")
-            return False
-        if not is_integer_dtype(df['price']):
-            logger.error("Column 'price' is not of integer type.")
-            return False
-        if not is_integer_dtype(df['mileage']):
-            logger.error("Column 'mileage' is not of integer type.")
-            return False
-        if not is_integer_dtype(df['tax']):
-            logger.error("Column 'tax' is not of integer type.")
-            return False
-        if not is_float_dtype(df['mpg']):
-            logger.error("Column 'mpg' is not of float type.")
-            return False
-        if not is_float_dtype(df['engine_size']):
-            logger.error("Column 'engine_size' is not of float type.")
-            return False
-        
-        # Check validate data ranges
-        if(df['year'] < 1990).any():
-            logger.error("Column 'year' has values less than 1990.")
-            return False
-        if(df['price'] < 0).any():
-            logger.error("Column 'price' has negative values.")
-            return False    
-        if(df['mileage'] < 0).any():
-            logger.error("Column 'mileage' has negative values.")
-            return False
-        
-
-        #  Check empty df
-        if (len(df) == 0):
-            logger.error("DataFrame is empty after validation.")
-            return False
-        
-        logger.info("DataFrame passed all validation checks.")
-        return True
+        report = validate_dataframe(df)
+        log_validation_report(report)
+        return report['passed']
 
     except Exception as e:
         logger.exception(f"An error occurred during DataFrame validation: {e}")
@@ -109,58 +128,40 @@ def check_validate_dataframe(df:pd.DataFrame) -> bool:
 # Tạo hàm tính hash của file csv để so sánh xem file với những record đã load vào DB chưa
 # Và cũng để check xem các record với giá trị có bị load trùng lặp vào DB không
 def cal_hash_file(file_path: str) -> str:
-    # Tính MD5 hash của file csv, MD5 là một hàm băm phổ biến được sử dụng để kiểm tra tính toàn vẹn của dữ liệu.
-    # Hàm đó được sử dụng để tạo ra một chuỗi ký tự duy nhất đại diện cho nội dung của file.
-    # Và nếu nội dung của file thay đổi, thì giá trị hash cũng sẽ thay đổi.
-    # Khi đó thì ta có thể sử dụng giá trị hash này để kiểm tra xem file cùng nội dung đã được load vào DB chưa.
+    # Hash của file được dùng để kiểm tra xem file cùng nội dung đã được load vào DB chưa.
+    # Việc tính toán nằm ở src/utils/fingerprint.py: thuật toán lấy theo HASH_ALGORITHM,
+    # kết quả được cache theo (path, size, mtime, inode) nên file không đổi sẽ không bị đọc lại.
     try:
-        hash_md5 = hl.md5()
-        # Mở file ở chế độ đọc nhị phân 
-        # sau đó đọc từng khối dữ liệu và cập nhật giá trị hash 
-        # rồi cuối cùng trả về giá trị hash dưới dạng chuỗi hex
-        # Dùng with để tự động đóng file sau khi đọc xong
-
-        with open(file_path, "rb") as f: # rb là read binary
-            for chunk in iter(lambda: f.read(4096), b""): 
-                # chunk là từng phần nhỏ của file, 
-                # iter đọc từng phần 4096 byte, b"" là giá trị kết thúc
-                # 4096 byte là kích thước khối phổ biến để đọc file lớn
-                # Dùng lambda để tạo hàm không tên để đọc file
-                hash_md5.update(chunk) # Cập nhật giá trị hash với khối dữ liệu hiện tại
-        return hash_md5.hexdigest() # Trả về giá trị hash dưới dạng chuỗi hex
+        return file_fingerprint(file_path)
     except Exception as e:
         logger.error(f"An error occurred while calculating file hash: {e}")
         return ""
 
-def check_data_exist (file_path: str, table: str) -> bool:
-    # Kiểm tra xem file csv này đã được load vào DB chưa
+def check_data_exist (file_path: str, table: str, cur=None) -> tuple[bool, str]:
+    # Kiểm tra xem file csv này đã có dữ liệu trong bảng `table` chưa, trả về (đã có?, hash lúc load)
+    # Tra trong bảng ingest_manifest theo primary key (src_file, table_name) nên không phải quét bảng dữ liệu lớn
+    # Mọi lần load đều ghi trong 1 transaction nên dữ liệu trong bảng luôn là của lần load thành công gần nhất
+    # (file_hash trong manifest), kể cả khi lần load sau đang chạy ('loading') hoặc bị lỗi ('failed')
+    # File chưa load thành công lần nào thì hash rỗng: coi như chưa có dữ liệu
     try:
-        conn = ps.connect(**DB_CONFIG)
-        if conn is None:
-            logger.error("Failed to connect to the database.")
-            return False
-        cur = conn.cursor()
-     
-        # Lấy hash cũ của file csv
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                return check_data_exist(file_path, table, own_cur)
+
         cur.execute(f"""
-            SELECT COUNT(*) 
-            FROM {table}
-            WHERE src_file = %s
-            LIMIT 1;
-        """, (file_path,))
+            SELECT file_hash, status
+            FROM {TABLE_MANIFEST}
+            WHERE src_file = %s AND table_name = %s;
+        """, (file_path, table))
 
         result = cur.fetchone()
 
-        if result and result[0]:
-            return(True, result[0]) # result[0] là số lượng record có hash trùng với file csv
+        if result:
+            # result[0] là hash của file ở lần load thành công gần nhất, result[1] là trạng thái lần load sau cùng
+            return (bool(result[0]), result[0])
         else:
-            return (False, "") # Không có record nào có hash trùng với file csv
+            return (False, "") # File chưa từng load vào bảng này
         
     except Exception as e:
         logger.exception(f"An error occurred while checking data existence: {e}")
-        return False
-    finally:
-        conn.close()
-        cur.close()
-
-
+        return (False, "")
@@ -0,0 +1,71 @@
+import bz2
+import gzip
+import io
+import lzma
+from pathlib import Path
+from config.log_config import logger_config
+from config.constants import COMPRESSION_EXTENSIONS, HASH_READ_BUFFER
+
+try:
+    from compression import zstd  # Python >= 3.14 có sẵn zstd trong thư viện chuẩn
+except ImportError:
+    zstd = None
+try:
+    import zstandard
+except ImportError:  # zstandard là optional, chỉ cần khi đọc file .zst trên Python < 3.14
+    zstandard = None
+
+logger = logger_config('utils.compressed_io')
+
+# Đây là nơi mở file dữ liệu nén (gzip / bz2 / xz / zstd) thành 1 stream đã giải nén
+# - Loại nén nhận theo đuôi file (COMPRESSION_EXTENSIONS), không khớp đuôi nào thì đọc vài byte đầu (magic bytes)
+# - Giải nén theo kiểu streaming: pandas / hasher đọc tới đâu giải nén tới đó, không ghi file tạm ra đĩa
+# - File không nén thì mở bình thường
+# Ví dụ:
+# with open_decompressed('archive/bmw_2024.csv.zst') as stream:
+#     df = pd.read_csv(stream)
+
+_MAGIC_BYTES = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+
+
+def detect_compression(file_path: str) -> str | None:
+    # Trả về 'gzip' / 'bz2' / 'xz' / 'zstd', None nếu file không nén
+    suffix = Path(file_path).suffix.lower()
+    if suffix in COMPRESSION_EXTENSIONS:
+        return COMPRESSION_EXTENSIONS[suffix]
+    with open(file_path, 'rb') as f:
+        head = f.read(6)
+    for magic, kind in _MAGIC_BYTES:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def _open_zstd(file_path: str):
+    if zstd is not None:
+        return zstd.open(file_path, 'rb')
+    if zstandard is None:
+        raise ImportError(f"Reading {file_path} needs zstd support: use Python >= 3.14 or pip install zstandard")
+    reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True,
+                                                        read_across_frames=True)
+    return io.BufferedReader(reader, buffer_size=HASH_READ_BUFFER)
+
+
+def open_decompressed(file_path: str):
+    # Mở file ở chế độ nhị phân, dữ liệu đọc ra luôn là nội dung CSV đã giải nén
+    kind = detect_compression(file_path)
+    if kind is None:
+        return open(file_path, 'rb')
+    logger.debug(f"Opening {file_path} with streaming {kind} decompression")
+    if kind == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if kind == 'bz2':
+        return bz2.open(file_path, 'rb')
+    if kind == 'xz':
+        return lzma.open(file_path, 'rb')
+    return _open_zstd(file_path)
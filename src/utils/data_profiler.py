@@ -1,18 +1,232 @@
+import numpy as np
+import pandas as pd
+from psycopg2.extras import Json
 from config.log_config import logger_config
-from config.constants import TABLE_RAW, TABLE_CLEAN
+from config.constants import TABLE_RAW, TABLE_CLEAN, TABLE_PROFILE, PRICE_HISTOGRAM_BIN_WIDTH
 from src.utils.db_manager import DBManager
 
 logger = logger_config('utils.data_profiler')
 
 # Ở phân đoạn này, cần làm report để báo cáo chất lượng của report
+# Profile được tính ngay trong bước transform cho từng file (profile_frame) rồi lưu vào bảng file_profile
+# Report toàn cục được gộp từ các profile đã lưu, không phải quét lại bảng raw / clean
+# nên thời gian làm report không tăng theo lịch sử dữ liệu trong warehouse
 
 class DataProfiler:
 
     @staticmethod
-    def generated_quantity_report()->dict:
+    def create_profile_table():
+        with DBManager.get_cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {TABLE_PROFILE}(
+                    src_file TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    raw_record BIGINT NOT NULL,
+                    clean_record BIGINT NOT NULL,
+                    rejections JSONB,
+                    models TEXT[],
+                    price_min INT,
+                    price_max INT,
+                    price_sum NUMERIC,
+                    price_median FLOAT,
+                    price_hist JSONB,
+                    year_min INT,
+                    year_max INT,
+                    profiled_at TIMESTAMP DEFAULT NOW());
+            """)
+            logger.info("Profile table created successfully")
+
+    @staticmethod
+    def profile_frame(raw_record: int, df_clean: pd.DataFrame, rejections: dict | None = None) -> dict:
+        # Tính profile của 1 file (hoặc 1 chunk) từ DataFrame đã clean, chỉ tốn thêm 1 lượt đọc các cột cần thiết
+        prices = df_clean['price'].to_numpy(dtype='int64')
+        years = df_clean['year'].to_numpy(dtype='int64')
+        bins = (prices // PRICE_HISTOGRAM_BIN_WIDTH) * PRICE_HISTOGRAM_BIN_WIDTH
+        bin_values, bin_counts = np.unique(bins, return_counts=True)
+        has_rows = len(prices) > 0
+        return {
+            'raw_record': int(raw_record),
+            'clean_record': int(len(df_clean)),
+            'rejections': dict(rejections or {}),
+            'models': sorted(df_clean['model'].dropna().unique().tolist()),
+            'price_min': int(prices.min()) if has_rows else None,
+            'price_max': int(prices.max()) if has_rows else None,
+            'price_sum': int(prices.sum()),
+            'price_median': float(np.median(prices)) if has_rows else None,
+            'price_hist': {str(int(b)): int(c) for b, c in zip(bin_values, bin_counts)},
+            'year_min': int(years.min()) if has_rows else None,
+            'year_max': int(years.max()) if has_rows else None,
+        }
+
+    @staticmethod
+    def profile_loaded_file(cur, csv_path: str, raw_record: int, rejections: dict) -> dict:
+        # Giống profile_frame nhưng tính trên các dòng của file đang có trong bảng clean (trong transaction của cur)
+        # Dùng khi lúc load có dòng bị bỏ (trùng với warehouse): profile lúc transform vẫn tính cả các dòng đó
+        cur.execute(f"""
+            SELECT COUNT(*),
+                   ARRAY(SELECT DISTINCT model FROM {TABLE_CLEAN} WHERE src_file = %s AND model IS NOT NULL ORDER BY model),
+                   MIN(price), MAX(price), COALESCE(SUM(price), 0),
+                   PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price),
+                   MIN(year), MAX(year)
+            FROM {TABLE_CLEAN}
+            WHERE src_file = %s;
+        """, (csv_path, csv_path))
+        clean_record, models, price_min, price_max, price_sum, price_median, year_min, year_max = cur.fetchone()
+        cur.execute(f"""
+            SELECT FLOOR(price::NUMERIC / %s) * %s, COUNT(*)
+            FROM {TABLE_CLEAN}
+            WHERE src_file = %s
+            GROUP BY 1;
+        """, (PRICE_HISTOGRAM_BIN_WIDTH, PRICE_HISTOGRAM_BIN_WIDTH, csv_path))
+        return {
+            'raw_record': int(raw_record),
+            'clean_record': int(clean_record),
+            'rejections': dict(rejections),
+            'models': list(models),
+            'price_min': price_min,
+            'price_max': price_max,
+            'price_sum': int(price_sum),
+            'price_median': float(price_median) if price_median is not None else None,
+            'price_hist': {str(int(b)): int(c) for b, c in cur.fetchall()},
+            'year_min': year_min,
+            'year_max': year_max,
+        }
+
+    @staticmethod
+    def merge_profiles(profiles: list[dict]) -> dict:
+        # Gộp nhiều profile (nhiều chunk của 1 file, hoặc nhiều file) thành 1 profile
+        def _opt(func, values):
+            values = [v for v in values if v is not None]
+            return func(values) if values else None
+
+        rejections, hist, models = {}, {}, set()
+        for p in profiles:
+            for rule, count in (p.get('rejections') or {}).items():
+                rejections[rule] = rejections.get(rule, 0) + count
+            for b, count in (p.get('price_hist') or {}).items():
+                hist[b] = hist.get(b, 0) + count
+            models.update(p.get('models') or [])
 
+        merged = {
+            'raw_record': sum(p['raw_record'] for p in profiles),
+            'clean_record': sum(p['clean_record'] for p in profiles),
+            'rejections': rejections,
+            'models': sorted(models),
+            'price_min': _opt(min, [p['price_min'] for p in profiles]),
+            'price_max': _opt(max, [p['price_max'] for p in profiles]),
+            'price_sum': sum(int(p['price_sum'] or 0) for p in profiles),
+            'price_hist': hist,
+            'year_min': _opt(min, [p['year_min'] for p in profiles]),
+            'year_max': _opt(max, [p['year_max'] for p in profiles]),
+        }
+        merged['price_median'] = DataProfiler._median_from_hist(hist, merged['price_min'], merged['price_max'])
+        if len(profiles) == 1 and profiles[0].get('price_median') is not None:
+            merged['price_median'] = profiles[0]['price_median']
+        return merged
+
+    @staticmethod
+    def _median_from_hist(hist: dict, price_min, price_max) -> float | None:
+        # Median xấp xỉ từ histogram: nội suy tuyến tính trong bin chứa phần tử ở giữa
+        total = sum(hist.values())
+        if total == 0:
+            return None
+        target = total / 2
+        cumulative = 0
+        for b in sorted(hist, key=int):
+            count = hist[b]
+            if cumulative + count >= target:
+                median = int(b) + PRICE_HISTOGRAM_BIN_WIDTH * (target - cumulative) / count
+                return float(min(max(median, price_min), price_max))
+            cumulative += count
+        return float(price_max)
+
+    @staticmethod
+    def summarize(profile: dict) -> dict:
+        # Đổi profile sang đúng format report cũ
+        raw_count = profile['raw_record']
+        clear_count = profile['clean_record']
+        records_dropped = raw_count - clear_count
+        drop_rate = 0
+        if raw_count > 0:
+            drop_rate = (records_dropped / raw_count * 100)
+        # price_sum đọc lại từ bảng file_profile (cột NUMERIC) là Decimal, ép về int giống merge_profiles
+        avg_price = int(profile['price_sum'] or 0) / clear_count if clear_count else 0
+
+        return {
+            'raw_record' : raw_count,
+            'clean_record' : clear_count,
+            'record_dropped' : records_dropped,
+            'drop_rate' : drop_rate,
+            'rejections' : profile['rejections'],
+            'unique_model' : len(profile['models']),
+            'price_stat' : {
+                'min' : profile['price_min'],
+                'max' : profile['price_max'],
+                'avg' : round(avg_price, 2),
+                'median' : profile['price_median']
+            },
+            'year_stat' : {
+                'min' : profile['year_min'],
+                'max' : profile['year_max']
+            }
+        }
+
+    @staticmethod
+    def save_file_profile(csv_path: str, file_hash: str, profile: dict, cur=None):
+        # Lưu profile của 1 file, file load lại thì ghi đè profile cũ
+        if cur is None:
+            with DBManager.get_cursor() as own_cur:
+                DataProfiler.save_file_profile(csv_path, file_hash, profile, own_cur)
+            return
+        cur.execute(f"""
+            INSERT INTO {TABLE_PROFILE} (src_file, file_hash, raw_record, clean_record, rejections, models,
+                price_min, price_max, price_sum, price_median, price_hist, year_min, year_max, profiled_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (src_file) DO UPDATE SET
+                file_hash = EXCLUDED.file_hash,
+                raw_record = EXCLUDED.raw_record,
+                clean_record = EXCLUDED.clean_record,
+                rejections = EXCLUDED.rejections,
+                models = EXCLUDED.models,
+                price_min = EXCLUDED.price_min,
+                price_max = EXCLUDED.price_max,
+                price_sum = EXCLUDED.price_sum,
+                price_median = EXCLUDED.price_median,
+                price_hist = EXCLUDED.price_hist,
+                year_min = EXCLUDED.year_min,
+                year_max = EXCLUDED.year_max,
+                profiled_at = NOW()
+        """, (csv_path, file_hash, profile['raw_record'], profile['clean_record'], Json(profile['rejections']),
+              profile['models'], profile['price_min'], profile['price_max'], profile['price_sum'],
+              profile['price_median'], Json(profile['price_hist']), profile['year_min'], profile['year_max']))
+
+    @staticmethod
+    def generated_quantity_report()->dict:
+        # Report toàn cục gộp từ profile của từng file, chỉ đọc bảng file_profile (mỗi file 1 dòng)
+        # Median giá là giá trị xấp xỉ từ histogram, sai số tối đa PRICE_HISTOGRAM_BIN_WIDTH
         try:
             with DBManager.get_cursor() as cur:
+                cur.execute(f"""
+                    SELECT raw_record, clean_record, rejections, models, price_min, price_max,
+                           price_sum, price_median, price_hist, year_min, year_max
+                    FROM {TABLE_PROFILE};
+                """)
+                columns = [desc[0] for desc in cur.description]
+                profiles = [dict(zip(columns, row)) for row in cur.fetchall()]
+
+            report = DataProfiler.summarize(DataProfiler.merge_profiles(profiles))
+            logger.info("Data profiling report generated successfully")
+            return report
+        except Exception as e:
+            logger.exception(f"Failed to generate data profiling report: {e}")
+            raise
+
+    @staticmethod
+    def generated_quantity_report_from_tables()->dict:
+        # Cách làm report cũ: quét toàn bộ bảng raw / clean
+        # Chậm dần theo lịch sử dữ liệu, chỉ dùng để đối chiếu với report gộp từ profile
+        try:
+            with DBManager.get_cursor(preset='report') as cur:
 
                 # count all rows in table raw and clean
                 cur.execute(f"SELECT COUNT(*) FROM {TABLE_RAW};")
@@ -27,7 +241,7 @@ class DataProfiler:
 
                 # Price statistics
                 cur.execute(f"""
-                    SELECT 
+                    SELECT
                         MIN(price) as min_price,
                         MAX(price) as max_price,
                         AVG(price) as avg_price,
@@ -35,22 +249,22 @@ class DataProfiler:
                     FROM {TABLE_CLEAN};
                 """)
                 price_stats = cur.fetchone()
-                
+
                 # Year distribution
                 cur.execute(f"""
-                    SELECT 
+                    SELECT
                         MIN(year) as oldest_year,
                         MAX(year) as newest_year
                     FROM {TABLE_CLEAN};
                 """)
                 year_stats = cur.fetchone()
-                
+
                 # Calculate metrics
                 records_dropped = raw_count - clear_count
                 drop_rate = 0
                 if raw_count > 0:
                     drop_rate = (records_dropped / raw_count * 100)
-                
+
 
 
                 report = {
@@ -64,10 +278,14 @@ class DataProfiler:
                         'max' : price_stats[1],
                         'avg' : round(price_stats[2], 2) if price_stats[2] else 0, # round ở đây là làm tròn 2 chữ số thập phân, còn nếu price_stats[2] là None thì sẽ trả về 0
                         'median' : price_stats[3]
+                    },
+                    'year_stat' : {
+                        'min' : year_stats[0],
+                        'max' : year_stats[1]
                     }
                 }
                 logger.info("Data profiling report generated successfully")
                 return report
         except Exception as e:
             logger.exception(f"Failed to generate data profiling report: {e}")
-            raise
\ No newline at end of file
+            raise
@@ -1,12 +1,19 @@
+import logging
+import random
+import threading
+import time
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extensions import cursor as base_cursor, TRANSACTION_STATUS_UNKNOWN
 from contextlib import contextmanager
-from config.config import DB_CONFIG
+from config.config import DB_CONFIG, DB_POOL_CONFIG
+from config.constants import DB_OP_LOG_SAMPLE_RATE, DB_CONNECT_RETRIES, DB_RETRY_BACKOFF, DB_SESSION_PRESETS
 from config.log_config import logger_config
 
 # Đây là nơi sẽ chứa các hàm để quản lý kết nối database
 # Tạo connection pool để tái sử dụng kết nối, tránh việc tạo và đóng kết nối liên tục gây tốn tài nguyên
-# Sử dụng psycopg2.pool.SimpleConnectionPool để tạo connection pool
+# Sử dụng psycopg2.pool.ThreadedConnectionPool để tạo connection pool, an toàn khi nhiều thread cùng load song song
+# Kích thước pool lấy từ DB_POOL_CONFIG, connection được kiểm tra còn sống trước khi dùng, lỗi kết nối tạm thời thì thử lại
 # Tạo class DBManager để quản lý connection pool và cung cấp các phương thức lấy kết nối và con trỏ (cursor)
 # Sử dụng context manager để tự động quản lý việc lấy và trả kết nối, con trỏ, tránh rò rỉ kết nối
 logger = logger_config('utils.db_manager')
@@ -18,24 +25,126 @@ logger = logger_config('utils.db_manager')
 # 2. Tạo một phương thức để lấy kết nối từ pool, nó giống như psycopg2.connect() nhưng thực chất là lấy từ pool
 # 3. Tạo một phương thức để trả kết nối về pool, nó giống như conn.close() nhưng thực chất là trả về pool chứ không phải đóng kết nối
 
+# Bộ đếm round trip tới DB, dùng cho metrics của từng stage (có lock vì nhiều thread load song song)
+_round_trip_lock = threading.Lock()
+_round_trip_total = 0
+
+
+class CountingCursor(base_cursor):
+    # Cursor đếm số lần gửi lệnh tới server: execute / copy = 1 lần, executemany = 1 lần mỗi dòng
+    # after_commit: các callback chạy sau khi transaction của cursor commit thành công (vd xoá cache đọc)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.after_commit = []
+
+    def execute(self, query, vars=None):
+        _count_round_trips(1)
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        _count_round_trips(len(vars_list))
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        _count_round_trips(1)
+        return super().copy_expert(sql, file, size)
+
+
+def _log_db_op(event: str):
+    # Log từng thao tác DB chỉ khi logger bật DEBUG và theo tỉ lệ lấy mẫu DB_OP_LOG_SAMPLE_RATE
+    # Mặc định tắt nên mỗi lần lấy / trả connection không phải tạo record log nào
+    if DB_OP_LOG_SAMPLE_RATE <= 0 or not logger.isEnabledFor(logging.DEBUG):
+        return
+    if DB_OP_LOG_SAMPLE_RATE >= 1 or random.random() < DB_OP_LOG_SAMPLE_RATE:
+        logger.debug(event, extra={'event': 'db_op', 'sample_rate': DB_OP_LOG_SAMPLE_RATE})
+
+
+def _count_round_trips(n: int):
+    global _round_trip_total
+    with _round_trip_lock:
+        _round_trip_total += n
+
+
 class DBManager: # Tạo class để quản lý kết nối DB
 
     _connection_pool = None
+    _slots = None           # Semaphore số connection được phép dùng cùng lúc, thread thừa thì chờ thay vì lỗi
+    _checkout_timeout = None
+    _ping_after = None
+    _last_used = {}         # id(conn) -> thời điểm trả về pool, dùng để quyết định có cần ping trước khi dùng
+    _init_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _stats = {'checkouts': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'in_use': 0, 'peak_in_use': 0,
+              'pings': 0, 'reconnects': 0, 'retries': 0}
 
     @classmethod 
     # classmethod dùng để gọi hàm mà không cần tạo instance của class 
     # có nghĩa là không cần tạo db_manager = DBManager() rồi mới gọi hàm
     # Mà có thể gọi trực tiếp DBManager.init_pool()
-    def init_pool(cls, minconn = 1, maxconn = 10): # cls là tham số đại diện cho class DBManager
+    def init_pool(cls, minconn: int | None = None, maxconn: int | None = None): # cls là tham số đại diện cho class DBManager
         # minconn: số kết nối tối thiểu trong pool, có nghĩa là khi khởi tạo pool thì sẽ tạo sẵn minconn kết nối chứ không phải đợi đến khi có yêu cầu mới tạo
         # maxconn: số kết nối tối đa trong pool
-        if cls._connection_pool is None: # Có nghĩa là nếu không có pool thì mới tạo pool
-            cls._connection_pool = pool.SimpleConnectionPool(
-                minconn,
-                maxconn,
-                **DB_CONFIG
-            )
-            logger.info("Database connection pool initialized.")
+        # Không truyền vào thì lấy theo DB_POOL_CONFIG trong config/config.py
+        with cls._init_lock:
+            if cls._connection_pool is not None: # Có nghĩa là nếu không có pool thì mới tạo pool
+                return
+            minconn = DB_POOL_CONFIG['minconn'] if minconn is None else minconn
+            maxconn = DB_POOL_CONFIG['maxconn'] if maxconn is None else maxconn
+            cls._connection_pool = cls._with_retry(lambda: pool.ThreadedConnectionPool(minconn, maxconn, **DB_CONFIG))
+            cls._slots = threading.BoundedSemaphore(maxconn)
+            cls._checkout_timeout = DB_POOL_CONFIG['checkout_timeout']
+            cls._ping_after = DB_POOL_CONFIG['ping_after']
+            logger.info(f"Database connection pool initialized ({minconn}-{maxconn} connections).")
+
+    @classmethod
+    def _with_retry(cls, connect):
+        # Thử lại khi lỗi kết nối tạm thời (DB restart, mạng chập chờn), chờ DB_RETRY_BACKOFF * 2^lần thử
+        for attempt in range(DB_CONNECT_RETRIES + 1):
+            try:
+                return connect()
+            except psycopg2.OperationalError as e:
+                if attempt == DB_CONNECT_RETRIES:
+                    raise
+                delay = DB_RETRY_BACKOFF * (2 ** attempt)
+                logger.warning(f"Database connection failed ({e}), retrying in {delay:.1f}s")
+                cls._count('retries')
+                time.sleep(delay)
+
+    @classmethod
+    def _count(cls, key: str, n: int = 1):
+        with cls._stats_lock:
+            cls._stats[key] += n
+
+    @classmethod
+    def _is_alive(cls, conn) -> bool:
+        # Connection đã đóng / mất kết nối thì bỏ luôn; rảnh lâu hơn ping_after thì SELECT 1 để chắc chắn
+        if conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+            return False
+        last_used = cls._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < cls._ping_after:
+            return True
+        cls._count('pings')
+        try:
+            with conn.cursor() as cur:
+                _count_round_trips(1)
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @classmethod
+    def _checkout(cls):
+        # Lấy connection từ pool, connection chết thì đóng hẳn và lấy connection khác
+        while True:
+            conn = cls._with_retry(cls._connection_pool.getconn)
+            if cls._is_alive(conn):
+                return conn
+            logger.warning("Discarding dead database connection from pool")
+            cls._count('reconnects')
+            cls._last_used.pop(id(conn), None)
+            cls._connection_pool.putconn(conn, close=True)
     
     @classmethod
     @contextmanager
@@ -46,34 +155,90 @@ class DBManager: # Tạo class để quản lý kết nối DB
     def get_connection(cls):
         if cls._connection_pool is None:
             cls.init_pool()
-        
-        conn = cls._connection_pool.getconn() # Lấy kết nối từ pool, giống như psycopg2.connect()
+
+        # Chờ tới khi có connection rảnh (ThreadedConnectionPool hết connection thì báo lỗi ngay chứ không chờ)
+        start = time.perf_counter()
+        if not cls._slots.acquire(timeout=cls._checkout_timeout):
+            raise pool.PoolError(f"Timed out after {cls._checkout_timeout}s waiting for a database connection")
+        try:
+            conn = cls._checkout() # Lấy kết nối từ pool, giống như psycopg2.connect()
+        except Exception:
+            cls._slots.release()
+            raise
+        waited = time.perf_counter() - start
+        with cls._stats_lock:
+            cls._stats['checkouts'] += 1
+            cls._stats['wait_seconds'] += waited
+            cls._stats['max_wait_seconds'] = max(cls._stats['max_wait_seconds'], waited)
+            cls._stats['in_use'] += 1
+            cls._stats['peak_in_use'] = max(cls._stats['peak_in_use'], cls._stats['in_use'])
+
          # Sử dụng try...finally để đảm bảo rằng kết nối sẽ được trả về pool dù có lỗi xảy ra hay không
         try:
             yield conn 
             # yield giống như return nhưng nó sẽ trả về một generator - là một iterator có thể lặp lại được 
             # ví dụ như list, tuple, ...
         finally:
-            cls._connection_pool.putconn(conn) # Trả kết nối về pool, giống như conn.close() nhưng thực chất là trả về pool chứ không phải đóng kết nối
-            logger.info("Database connection returned to pool.")
+            cls._last_used[id(conn)] = time.monotonic()
+            # Trả kết nối về pool, giống như conn.close() nhưng thực chất là trả về pool chứ không phải đóng kết nối
+            # Connection bị mất giữa chừng thì đóng hẳn để lần sau pool tạo connection mới
+            cls._connection_pool.putconn(conn, close=bool(conn.closed))
+            with cls._stats_lock:
+                cls._stats['in_use'] -= 1
+            cls._slots.release()
+            _log_db_op("Database connection returned to pool.")
     
 
     @classmethod
     @contextmanager
-    def get_cursor(cls, commit: bool = True):
+    def get_cursor(cls, commit: bool = True, preset: str = 'default'):
+        # preset: tên preset trong DB_SESSION_PRESETS (vd 'bulk_load'), áp dụng bằng set_config(..., is_local=true)
+        # nên chỉ có tác dụng trong transaction này, connection trả về pool không mang theo cấu hình
+        if preset not in DB_SESSION_PRESETS:
+            raise ValueError(f"Invalid session preset: {preset}. Expected one of {tuple(DB_SESSION_PRESETS)}")
         with cls.get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = conn.cursor(cursor_factory=CountingCursor)
             try:
+                settings = DB_SESSION_PRESETS[preset]
+                if settings:
+                    # Gộp mọi setting vào 1 câu lệnh để chỉ tốn 1 round trip
+                    calls = ', '.join(['set_config(%s, %s, true)'] * len(settings))
+                    cursor.execute(f"SELECT {calls};", [v for item in settings.items() for v in item])
                 yield cursor
                 if commit:
                     conn.commit()
-                    logger.info("Transaction committed.")
+                    _log_db_op("Transaction committed.")
+                    for callback in cursor.after_commit:
+                        try:
+                            callback()
+                        except Exception as e:
+                            logger.exception(f"After-commit callback failed: {e}")
             except Exception as e:
                 conn.rollback()
                 logger.error("Transaction rolled back due to error: %s", e)
                 raise
             finally:
                 cursor.close()
-                logger.info("Database cursor closed.")
+                _log_db_op("Database cursor closed.")
 
-            
\ No newline at end of file
+    @staticmethod
+    def after_commit(cur, callback):
+        # Đăng ký callback chạy khi transaction của cur commit xong, rollback thì callback bị bỏ
+        cur.after_commit.append(callback)
+
+    @staticmethod
+    def round_trips() -> int:
+        # Tổng số round trip tới DB từ lúc process bắt đầu, lấy hiệu giữa 2 lần gọi để biết 1 stage tốn bao nhiêu
+        return _round_trip_total
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        # Số liệu dùng pool từ lúc process bắt đầu: số lần lấy connection, tổng / max thời gian chờ,
+        # số connection dùng cùng lúc cao nhất, số lần ping / bỏ connection chết / thử kết nối lại
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 4)
+        stats['max_wait_seconds'] = round(stats['max_wait_seconds'], 4)
+        stats['avg_wait_ms'] = round(stats['wait_seconds'] / stats['checkouts'] * 1000, 3) if stats['checkouts'] else 0
+        stats['maxconn'] = cls._connection_pool.maxconn if cls._connection_pool is not None else None
+        return stats
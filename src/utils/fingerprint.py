@@ -0,0 +1,152 @@
+import hashlib as hl
+import io
+import json
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from config.log_config import logger_config
+from config.constants import HASH_ALGORITHM, HASH_READ_BUFFER, HASH_MMAP_THRESHOLD, FINGERPRINT_CACHE_PATH
+from src.utils.compressed_io import detect_compression, open_decompressed
+
+logger = logger_config('utils.fingerprint')
+
+# Đây là nơi tính fingerprint (hash nội dung) của file dữ liệu
+# Mục tiêu: mỗi file chỉ bị đọc đúng 1 lần trong 1 lần chạy
+# - Nếu file không đổi (cùng path, size, mtime, inode) thì lấy hash từ cache trên đĩa, không đọc lại file
+# - Nếu phải tính thì tính ngay trong lần đọc mà pandas dùng để parse (xem hashing_open)
+# - Khi chỉ cần hash (không parse) thì đọc buffer lớn hoặc mmap cho file lớn
+# - File nén (gz / bz2 / xz / zst) được hash trên nội dung đã giải nén, nên cùng 1 file CSV nén hay không nén,
+#   nén lại với mức nén khác đều ra cùng 1 hash
+
+
+class _HashingRawReader(io.RawIOBase):
+    # Bọc file nhị phân: mỗi byte được đọc ra đều được cập nhật vào hasher
+    def __init__(self, raw, hasher):
+        self._raw = raw
+        self._hasher = hasher
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._raw.readinto(buffer)
+        if n:
+            self._hasher.update(memoryview(buffer)[:n])
+        return n
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+class FingerprintCache:
+    # Cache hash trên đĩa dạng JSON, key là (algorithm, path, size, mtime, inode)
+    # File giữ nguyên các thông số này thì coi như không đổi, không cần hash lại
+
+    _lock = threading.Lock()
+    _entries = None
+
+    @staticmethod
+    def _key(file_path: str, algorithm: str) -> str | None:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return f"{algorithm}|{Path(file_path).resolve()}|{st.st_size}|{st.st_mtime_ns}|{st.st_ino}"
+
+    @staticmethod
+    def _read_disk() -> dict:
+        try:
+            with open(FINGERPRINT_CACHE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @classmethod
+    def _load(cls) -> dict:
+        if cls._entries is None:
+            cls._entries = cls._read_disk()
+        return cls._entries
+
+    @classmethod
+    def get(cls, file_path: str, algorithm: str = HASH_ALGORITHM) -> str | None:
+        key = cls._key(file_path, algorithm)
+        if key is None:
+            return None
+        with cls._lock:
+            return cls._load().get(key)
+
+    @classmethod
+    def put(cls, file_path: str, digest: str, algorithm: str = HASH_ALGORITHM):
+        key = cls._key(file_path, algorithm)
+        if key is None:
+            return
+        with cls._lock:
+            # Đọc lại file trước khi ghi để gộp entry do process khác (chạy nhiều file song song) vừa ghi
+            entries = cls._load()
+            entries.update(cls._read_disk())
+            entries[key] = digest
+            # Ghi ra file tạm rồi os.replace để không bao giờ để lại file cache ghi dở
+            os.makedirs(os.path.dirname(FINGERPRINT_CACHE_PATH) or '.', exist_ok=True)
+            tmp_path = f"{FINGERPRINT_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, FINGERPRINT_CACHE_PATH)
+
+
+def compute_fingerprint(file_path: str, algorithm: str = HASH_ALGORITHM) -> str:
+    # Tính hash bằng cách đọc toàn bộ file, không dùng cache
+    hasher = hl.new(algorithm)
+    if detect_compression(file_path) is not None:
+        with open_decompressed(file_path) as f:
+            buffer = bytearray(HASH_READ_BUFFER)
+            view = memoryview(buffer)
+            while n := f.readinto(buffer):
+                hasher.update(view[:n])
+        return hasher.hexdigest()
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if size >= HASH_MMAP_THRESHOLD:
+            # File lớn: map thẳng vào bộ nhớ, hashlib đọc trực tiếp không copy qua buffer Python
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+        else:
+            for chunk in iter(lambda: f.read(HASH_READ_BUFFER), b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def file_fingerprint(file_path: str, algorithm: str = HASH_ALGORITHM) -> str:
+    # Lấy hash từ cache nếu file không đổi, nếu không thì tính rồi lưu vào cache
+    cached = FingerprintCache.get(file_path, algorithm)
+    if cached:
+        return cached
+    digest = compute_fingerprint(file_path, algorithm)
+    FingerprintCache.put(file_path, digest, algorithm)
+    logger.info(f"Computed {algorithm} fingerprint for {file_path}")
+    return digest
+
+
+@contextmanager
+def hashing_open(file_path: str, algorithm: str = HASH_ALGORITHM):
+    # Mở file để parse và hash trong cùng 1 lần đọc
+    # Ví dụ:
+    # with hashing_open(path) as (stream, result):
+    #     df = pd.read_csv(stream)
+    # digest = result['digest']
+    # Khi thoát khối with, phần còn lại của file (nếu parser chưa đọc hết) được đọc nốt để hash đủ,
+    # rồi digest được lưu vào cache
+    hasher = hl.new(algorithm)
+    result = {'digest': None}
+    # File nén: hasher nhận dữ liệu đã giải nén, pandas đọc cùng 1 stream đó
+    stream = io.BufferedReader(_HashingRawReader(open_decompressed(file_path), hasher), buffer_size=HASH_READ_BUFFER)
+    try:
+        yield stream, result
+        while stream.read(HASH_READ_BUFFER):
+            pass
+        result['digest'] = hasher.hexdigest()
+        FingerprintCache.put(file_path, result['digest'], algorithm)
+    finally:
+        stream.close()
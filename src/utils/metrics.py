@@ -0,0 +1,201 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from config.log_config import logger_config
+from config.constants import METRICS_DIR, PROFILE_MODES, METRICS_RSS_SAMPLE_SECONDS
+from src.utils.db_manager import DBManager
+
+logger = logger_config('utils.metrics')
+
+# Đây là nơi đo thời gian / throughput / bộ nhớ / số round trip DB cho từng stage của pipeline
+# Ví dụ:
+# metrics = RunMetrics()
+# with metrics.stage('extract') as stage:
+#     df = ExtractorCSV.extract(path)
+#     stage['rows_out'] = len(df)
+# Cùng 1 tên stage gọi nhiều lần (nhiều chunk, nhiều file) thì số liệu được cộng dồn
+# Bộ nhớ của stage đo trên RSS hiện tại của process (/proc/self/statm), không phải ru_maxrss (peak cả đời process):
+# - rss_delta_kb: RSS lúc kết thúc - lúc bắt đầu (bộ nhớ stage còn giữ lại), cộng dồn qua các lần gọi
+# - peak_rss_delta_kb: RSS cao nhất lấy mẫu được trong lúc stage chạy - lúc bắt đầu, lấy max qua các lần gọi
+# RSS là của cả process nên stage chạy song song (DAG, loader thread) thấy cả phần tăng của nhau;
+# cần số liệu riêng 1 stage thì bật profile_mode='tracemalloc' cho stage đó (profile['peak_kb'])
+# Không có /proc (không phải Linux) hoặc số liệu đo trong process con (add) thì 2 trường này là None
+
+_PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+
+
+def _current_rss_kb() -> int | None:
+    # RSS hiện tại của process (trường thứ 2 của /proc/self/statm, tính theo page)
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _RssSampler:
+    # 1 thread daemon lấy mẫu RSS mỗi METRICS_RSS_SAMPLE_SECONDS giây, chỉ chạy khi có stage đang được đo
+    # Mỗi stage đang chạy giữ 1 watch {'start', 'peak'}, sampler cập nhật peak của mọi watch
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watches = {}
+        self._thread = None
+
+    def watch(self) -> dict | None:
+        rss = _current_rss_kb()
+        if rss is None:
+            return None
+        watch = {'start': rss, 'peak': rss}
+        with self._lock:
+            self._watches[id(watch)] = watch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='rss-sampler', daemon=True)
+                self._thread.start()
+        return watch
+
+    def unwatch(self, watch: dict | None) -> tuple[int | None, int | None]:
+        # Trả về (rss_delta_kb, peak_rss_delta_kb) của stage
+        if watch is None:
+            return None, None
+        rss = _current_rss_kb()
+        with self._lock:
+            self._watches.pop(id(watch), None)
+        if rss is None:
+            return None, None
+        peak = max(watch['peak'], rss)
+        return rss - watch['start'], peak - watch['start']
+
+    def _loop(self):
+        while True:
+            time.sleep(METRICS_RSS_SAMPLE_SECONDS)
+            rss = _current_rss_kb()
+            with self._lock:
+                if not self._watches:
+                    # Không còn stage nào: thread thoát, stage sau tạo thread mới
+                    self._thread = None
+                    return
+                if rss is None:
+                    continue
+                for watch in self._watches.values():
+                    watch['peak'] = max(watch['peak'], rss)
+
+
+_sampler = _RssSampler()
+
+
+class RunMetrics:
+
+    def __init__(self, profile_stage: str | None = None, profile_mode: str = 'cprofile'):
+        # profile_stage: tên 1 stage muốn bật cProfile / tracemalloc, mặc định không bật stage nào
+        if profile_mode not in PROFILE_MODES:
+            raise ValueError(f"Invalid profile mode: {profile_mode}. Expected one of {PROFILE_MODES}")
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self.profile_stage = profile_stage
+        self.profile_mode = profile_mode
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None):
+        record = {'rows_in': rows_in, 'rows_out': None}
+        profiler = None
+        if name == self.profile_stage:
+            profiler = self._start_profiler()
+
+        watch = _sampler.watch()
+        trips_before = DBManager.round_trips()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            record['db_round_trips'] = DBManager.round_trips() - trips_before
+            record['rss_delta_kb'], record['peak_rss_delta_kb'] = _sampler.unwatch(watch)
+            if profiler is not None:
+                record['profile'] = self._stop_profiler(name, profiler)
+            self._accumulate(name, record)
+
+    def add(self, name: str, seconds: float, rows_in: int | None = None, rows_out: int | None = None):
+        # Ghi số liệu đo ở nơi khác (vd trong process con của chế độ nhiều file) vào stage
+        # RSS của process khác không đo được ở đây nên không ghi số liệu bộ nhớ
+        self._accumulate(name, {'rows_in': rows_in, 'rows_out': rows_out, 'seconds': seconds,
+                                'db_round_trips': 0, 'rss_delta_kb': None, 'peak_rss_delta_kb': None})
+
+    def _accumulate(self, name: str, record: dict):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows_in': None, 'rows_out': None,
+                                                  'db_round_trips': 0, 'rss_delta_kb': None,
+                                                  'peak_rss_delta_kb': None})
+            stage['calls'] += 1
+            stage['seconds'] += record['seconds']
+            stage['db_round_trips'] += record['db_round_trips']
+            if record['rss_delta_kb'] is not None:
+                stage['rss_delta_kb'] = (stage['rss_delta_kb'] or 0) + record['rss_delta_kb']
+            if record['peak_rss_delta_kb'] is not None:
+                stage['peak_rss_delta_kb'] = max(stage['peak_rss_delta_kb'] or 0, record['peak_rss_delta_kb'])
+            for key in ('rows_in', 'rows_out'):
+                if record[key] is not None:
+                    stage[key] = (stage[key] or 0) + record[key]
+            if 'profile' in record:
+                stage['profile'] = record['profile']
+
+    def _start_profiler(self):
+        if self.profile_mode == 'tracemalloc':
+            tracemalloc.start()
+            return tracemalloc
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, name: str, profiler) -> dict:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        if profiler is tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top = [str(stat) for stat in snapshot.statistics('lineno')[:10]]
+            return {'mode': 'tracemalloc', 'peak_kb': peak // 1024, 'top_allocations': top}
+
+        profiler.disable()
+        path = os.path.join(METRICS_DIR, f"run_{self.run_id}_{name}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(10)
+        logger.info(f"cProfile for stage '{name}' written to {path}")
+        return {'mode': 'cprofile', 'stats_file': path, 'top_cumulative': summary.getvalue()}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                stage = dict(stage)
+                rows = stage['rows_out'] if stage['rows_out'] is not None else stage['rows_in']
+                stage['rows_per_sec'] = round(rows / stage['seconds'], 1) if rows and stage['seconds'] else None
+                stage['seconds'] = round(stage['seconds'], 4)
+                stages[name] = stage
+        return {
+            'run_id': self.run_id,
+            'total_seconds': round(time.perf_counter() - self._started, 4),
+            'stages': stages,
+        }
+
+    def write_json(self, extra: dict | None = None) -> str:
+        # Mỗi lần chạy ghi 1 file metrics/run_<run_id>.json để so sánh giữa các đêm chạy
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"run_{self.run_id}.json")
+        payload = self.to_dict()
+        if extra:
+            payload.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2, default=str)
+        logger.info(f"Run metrics written to {path}")
+        return path
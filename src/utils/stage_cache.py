@@ -0,0 +1,125 @@
+import hashlib as hl
+import json
+import os
+import threading
+import pandas as pd
+from config.log_config import logger_config
+from config import constants
+from config.constants import STAGE_CACHE_ENABLED, STAGE_CACHE_DIR, STAGE_CACHE_MAX_BYTES, CLEANING_RULES_VERSION
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow là optional, không có thì cache tự tắt
+    feather = None
+
+logger = logger_config('utils.stage_cache')
+
+# Đây là cache kết quả của bước extract và transform, lưu dạng Arrow IPC (Feather, không nén) trên đĩa
+# - Key là fingerprint của file (+ version của rule clean với bước transform)
+# - Đọc lại bằng memory map nên rerun / chạy lại 1 phần (chỉ load hoặc report) không phải parse CSV và clean lại
+# - Tổng dung lượng bị giới hạn bởi STAGE_CACHE_MAX_BYTES, vượt thì xoá entry dùng lâu nhất (LRU theo mtime)
+
+
+def _rules_stamp() -> str:
+    # Version stamp của rule clean: version thủ công + hash của toàn bộ rule khai báo trong config/constants.py
+    rules = repr((constants.COLUMNS_MAPPING, constants.DATA_TYPES, constants.CSV_DTYPES, constants.TEXT_COLUMNS,
+                  constants.NULL_DROP_COLUMNS, constants.NULL_FILL_VALUES, constants.RANGE_RULES,
+                  constants.DEDUP_ENABLED))
+    return f"v{CLEANING_RULES_VERSION}-{hl.md5(rules.encode('utf-8')).hexdigest()[:8]}"
+
+
+RULES_STAMP = _rules_stamp()
+
+
+class StageCache:
+
+    _lock = threading.Lock()
+    _stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    @staticmethod
+    def enabled() -> bool:
+        return STAGE_CACHE_ENABLED and feather is not None
+
+    @staticmethod
+    def _paths(file_hash: str, stage: str) -> tuple[str, str]:
+        # stage 'clean' được gắn thêm stamp của rule để đổi rule là cache cũ tự mất hiệu lực
+        name = f"{file_hash}_{stage}" if stage != 'clean' else f"{file_hash}_clean_{RULES_STAMP}"
+        base = os.path.join(STAGE_CACHE_DIR, name)
+        return f"{base}.arrow", f"{base}.json"
+
+    @classmethod
+    def _count(cls, key: str, n: int = 1):
+        with cls._lock:
+            cls._stats[key] += n
+
+    @classmethod
+    def get(cls, file_hash: str, stage: str) -> tuple[pd.DataFrame, dict] | None:
+        # Trả về (DataFrame, metadata) nếu có trong cache, ngược lại None
+        if not cls.enabled() or not file_hash:
+            return None
+        data_path, meta_path = cls._paths(file_hash, stage)
+        try:
+            table = feather.read_table(data_path, memory_map=True)
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            cls._count('misses')
+            return None
+        os.utime(data_path)  # Đánh dấu vừa dùng cho LRU
+        cls._count('hits')
+        logger.info(f"Stage cache hit: {stage} for {file_hash[:12]}")
+        return table.to_pandas(), meta
+
+    @classmethod
+    def put(cls, file_hash: str, stage: str, df: pd.DataFrame, meta: dict | None = None):
+        if not cls.enabled() or not file_hash:
+            return
+        data_path, meta_path = cls._paths(file_hash, stage)
+        try:
+            os.makedirs(STAGE_CACHE_DIR, exist_ok=True)
+            # Feather cần RangeIndex, index sau khi filter không còn ý nghĩa nên bỏ đi
+            tmp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            df.reset_index(drop=True).to_feather(tmp_path, compression='uncompressed')
+            os.replace(tmp_path, data_path)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta or {}, f)
+        except Exception as e:
+            # Cache lỗi không được làm hỏng pipeline, chỉ log lại
+            logger.warning(f"Failed to write stage cache for {stage}: {e}")
+            return
+        cls._count('writes')
+        cls.evict()
+
+    @classmethod
+    def evict(cls, max_bytes: int = STAGE_CACHE_MAX_BYTES):
+        # Xoá các entry dùng lâu nhất cho tới khi tổng dung lượng <= max_bytes
+        try:
+            entries = [os.path.join(STAGE_CACHE_DIR, name) for name in os.listdir(STAGE_CACHE_DIR)
+                       if name.endswith('.arrow')]
+            stats = sorted(((os.stat(p).st_mtime, os.stat(p).st_size, p) for p in entries))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in stats:
+            if total <= max_bytes:
+                break
+            for victim in (path, path[:-len('.arrow')] + '.json'):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+            cls._count('evictions')
+            logger.info(f"Evicted stage cache entry {os.path.basename(path)}")
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            return dict(cls._stats)
+
+    @classmethod
+    def merge_stats(cls, delta: dict):
+        # Cộng số liệu cache từ process con (chế độ nhiều file) vào process cha
+        with cls._lock:
+            for key, value in delta.items():
+                cls._stats[key] = cls._stats.get(key, 0) + value
@@ -0,0 +1,164 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from config.log_config import logger_config
+from config.constants import (TABLE_AGG_MODEL, TABLE_AGG_MODEL_YEAR_FUEL, QUERY_CACHE_MAX_ENTRIES,
+                              QUERY_CACHE_TTL_SECONDS)
+from src.utils.db_manager import DBManager
+
+logger = logger_config('utils.warehouse_query')
+
+# Đây là lớp truy vấn đọc cho các service: danh sách model, thống kê giá theo model / năm, số xe theo loại nhiên liệu
+# - Dữ liệu đọc từ bảng tổng hợp (src/load/aggregates.py) nên không phải quét bảng clean
+# - Kết quả được cache trong process (LRU + TTL), lần gọi lặp lại chỉ tốn vài micro giây
+# - Pipeline commit dữ liệu mới thì các entry liên quan tới model bị ảnh hưởng bị xoá ngay (invalidate_models)
+# - Tên model được chuẩn hoá giống lúc clean (strip + lower) nên ' 3 Series' hay '3 series' đều trả cùng kết quả
+# Ví dụ:
+# WarehouseQuery.unique_models()
+# WarehouseQuery.price_stats('3 series', 2019)
+# WarehouseQuery.counts_by_fuel_type()
+
+_ALL = '*'  # Tag của entry phụ thuộc vào mọi model
+
+
+class QueryCache:
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl: float = QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (hết hạn lúc, tags, giá trị)
+        self._lock = threading.Lock()
+        self._generation = 0            # Tăng mỗi lần invalidate
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidated': 0}
+
+    def get(self, key):
+        # Trả về (True, giá trị) nếu có và chưa hết hạn, ngược lại (False, None)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, entry[2]
+
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, key, value, tags: frozenset, generation: int):
+        # generation: giá trị lấy trước khi query, có invalidate xen giữa thì kết quả có thể là dữ liệu cũ, không cache
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, tags, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, models: list | None = None):
+        # Xoá entry phụ thuộc vào các model này + mọi entry phụ thuộc toàn bộ warehouse, None = xoá hết
+        with self._lock:
+            if models is None:
+                victims = list(self._entries)
+            else:
+                touched = set(models) | {_ALL}
+                victims = [key for key, (_, tags, _) in self._entries.items() if tags & touched]
+            for key in victims:
+                del self._entries[key]
+            self._generation += 1
+            self._stats['invalidated'] += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+
+class WarehouseQuery:
+
+    _cache = QueryCache()
+
+    @classmethod
+    def _cached(cls, key: tuple, tags: frozenset, query):
+        found, value = cls._cache.get(key)
+        if not found:
+            generation = cls._cache.generation()
+            value = query()
+            cls._cache.put(key, value, tags, generation)
+        # Trả bản copy để người gọi sửa kết quả không làm hỏng cache
+        return copy.deepcopy(value)
+
+    @staticmethod
+    def _normalize_model(model: str) -> str:
+        # Bảng clean / bảng tổng hợp lưu model đã strip + lower (DataCleaner._clean_text_columns)
+        return model.strip().lower()
+
+    @classmethod
+    def unique_models(cls) -> list[str]:
+        def query():
+            with DBManager.get_cursor() as cur:
+                cur.execute(f"SELECT model FROM {TABLE_AGG_MODEL} ORDER BY model;")
+                return [row[0] for row in cur.fetchall()]
+        return cls._cached(('unique_models',), frozenset({_ALL}), query)
+
+    @classmethod
+    def price_stats(cls, model: str, year: int | None = None) -> dict | None:
+        # Thống kê giá của 1 model (hoặc 1 model trong 1 năm), None nếu không có dữ liệu
+        model = cls._normalize_model(model)
+
+        def query():
+            with DBManager.get_cursor() as cur:
+                if year is None:
+                    cur.execute(f"""
+                        SELECT row_count, price_sum, price_min, price_max
+                        FROM {TABLE_AGG_MODEL}
+                        WHERE model = %s;
+                    """, (model,))
+                else:
+                    # SUM trên cột BIGINT trả về NUMERIC (Decimal), ép lại BIGINT cho giống nhánh chỉ có model
+                    cur.execute(f"""
+                        SELECT SUM(row_count)::BIGINT, SUM(price_sum)::BIGINT, MIN(price_min), MAX(price_max)
+                        FROM {TABLE_AGG_MODEL_YEAR_FUEL}
+                        WHERE model = %s AND year = %s;
+                    """, (model, year))
+                row = cur.fetchone()
+            if not row or not row[0]:
+                return None
+            count, total, price_min, price_max = int(row[0]), int(row[1]), row[2], row[3]
+            return {'count': count, 'min': price_min, 'max': price_max, 'avg': round(total / count, 2)}
+        return cls._cached(('price_stats', model, year), frozenset({model}), query)
+
+    @classmethod
+    def counts_by_fuel_type(cls, model: str | None = None) -> dict[str, int]:
+        if model is not None:
+            model = cls._normalize_model(model)
+
+        def query():
+            where = "WHERE model = %s" if model is not None else ""
+            with DBManager.get_cursor() as cur:
+                cur.execute(f"""
+                    SELECT fuel_type, SUM(row_count)
+                    FROM {TABLE_AGG_MODEL_YEAR_FUEL}
+                    {where}
+                    GROUP BY fuel_type
+                    ORDER BY fuel_type;
+                """, (model,) if model is not None else None)
+                return {fuel: int(count) for fuel, count in cur.fetchall()}
+        tags = frozenset({_ALL}) if model is None else frozenset({model})
+        return cls._cached(('counts_by_fuel_type', model), tags, query)
+
+    @classmethod
+    def invalidate_models(cls, models: list | None = None):
+        # Gọi sau khi pipeline commit dữ liệu clean mới, models là các model bị thêm / xoá dòng
+        cls._cache.invalidate(models)
+        logger.debug(f"Query cache invalidated for {len(models) if models is not None else 'all'} models")
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        return cls._cache.stats()